@@ -1,8 +1,26 @@
+# see tool/analysis/gamer_stencil.py for an AMR-aware version using ghost-zone-filled stencils on the patches
+# (the "numpy" and "fft" methods below assume a uniform grid)
 import yt
 import numpy as np
 import argparse
+import importlib
+import os
 import sys
 
+
+def import_gamer_tool( name ):
+   # import a module of tool/analysis from $GAMER_PATH (the GAMER root directory) or relative to this script
+   paths = [ os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../..') ]
+   if 'GAMER_PATH' in os.environ:   paths.insert( 0, os.environ['GAMER_PATH'] )
+   for path in paths:
+      path = os.path.join( path, 'tool', 'analysis' )
+      if os.path.isfile( os.path.join(path, name+'.py') ):
+         if path not in sys.path:   sys.path.insert( 0, path )
+         return importlib.import_module( name )
+   print( 'Cannot find tool/analysis/%s.py of GAMER --> please set the environment variable GAMER_PATH '
+          'to the GAMER root directory !!'%name )
+   sys.exit(1)
+
 #-------------------------------------------------------------------------------------------------------------------------
 # load the command-line parameters
 parser = argparse.ArgumentParser( description='Get average velocity dispersion of the entire box' )
@@ -35,6 +53,9 @@ for t in range( len(sys.argv) ):
 print( '' )
 print( '-------------------------------------------------------------------\n' )
 
+if method == 'numpy' or method == 'fft':
+   Snapshot = import_gamer_tool( 'gamer_snapshot' ).Snapshot
+
 yt.enable_parallelism()
 ts = yt.DatasetSeries( [ '../Data_%06d'%idx for idx in range(idx_start, idx_end+1, didx) ] )
 
@@ -53,35 +74,29 @@ for ds in ts.piter():
    if method == 'yt':
       grad_Real = ds.add_gradient_fields(("Real"))
       grad_Imag = ds.add_gradient_fields(("Imag"))
+      dd = ds.all_data()
 
-   dd = ds.all_data()
-
-   if ( N_tot != len(dd["Dens"])):
-      print('Data_%06d file size not matched!'%idx)
-      sys.exit(1)
+      if ( N_tot != len(dd["Dens"])):
+         print('Data_%06d file size not matched!'%idx)
+         sys.exit(1)
 
-   if method == 'yt':
       dens = np.array(dd["Dens"])
       real = np.array(dd["Real"])
       imag = np.array(dd["Imag"])
       avedens = np.mean(dens)
 
    elif method == 'numpy' or method == 'fft':
-      # re-arange arrays base on 3d position
-      X = np.array( dd['x'] )
-      Y = np.array( dd['y'] )
-      Z = np.array( dd['z'] )
+      # place the level-0 patches straight into uniform arrays using Tree/Corner (no coordinate sorting)
+      snap = Snapshot( ds.parameter_filename )
 
-      if len(np.unique(X)) != N[0] or len(np.unique(Y)) != N[1] or len(np.unique(Z)) != N[2]:
-         print('Array size not matched!'%idx)
+      if np.any( snap.npatch[1:] > 0 ):
+         print('Data_%06d is not a single-level dump!'%idx)
          sys.exit(1)
 
-      indices = np.lexsort((Z, Y, X))
-
-      # re-arange then reshape to 3d array
-      dens = np.reshape( np.array(dd["Dens"][indices]), (N[0], N[1], N[2]) )
-      real = np.reshape( np.array(dd["Real"][indices]), (N[0], N[1], N[2]) )
-      imag = np.reshape( np.array(dd["Imag"][indices]), (N[0], N[1], N[2]) )
+      # [z][y][x] -> [x][y][z]
+      dens = snap.read_uniform( "Dens", lv=0 ).T
+      real = snap.read_uniform( "Real", lv=0 ).T
+      imag = snap.read_uniform( "Imag", lv=0 ).T
 
       if method == 'fft':
          kx = 2*np.pi*np.fft.fftfreq(N[0], d=dh[0])
@@ -1,12 +1,30 @@
+import os
+import sys
+import importlib
 import h5py
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Use 'Agg' backend to avoid PuTTY X11 errors
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
-from scipy.interpolate import RegularGridInterpolator
 
 
+# -------------------------------------------------------------------------
+# Import a module of tool/analysis from $GAMER_PATH (the GAMER root directory) or relative to this script
+def import_gamer_tool(name):
+    paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../..')]
+    if 'GAMER_PATH' in os.environ:
+        paths.insert(0, os.environ['GAMER_PATH'])
+    for path in paths:
+        path = os.path.join(path, 'tool', 'analysis')
+        if os.path.isfile(os.path.join(path, name+'.py')):
+            if path not in sys.path:
+                sys.path.insert(0, path)
+            return importlib.import_module(name)
+    print('Cannot find tool/analysis/%s.py of GAMER --> please set the environment variable GAMER_PATH '
+          'to the GAMER root directory !!'%name)
+    sys.exit(1)
+
 # -------------------------------------------------------------------------
 # Set user-specified parameters
 GRACKLE_PATH = "../CloudyData_UVB=HM2012.h5"
@@ -16,69 +34,28 @@ T_NOW        = 1.0e4                       # Temperature (K)
 X_H          = 0.716                       # Hydrogen mass fraction for HM2012
 RHO_RANGE    = np.logspace(-29, -21, 100)  # Denisty axis range (g/cm^3)
 T_MU_RANGE   = np.logspace(  0,   8, 100)  # Temperature/mu axis range (K)
+CACHE_DIR    = None                        # Directory caching the processed table for later runs (None: no cache)
 
 
 # -------------------------------------------------------------------------
 # Interpolate the cooling and heating rates from the grackle table
+#   --> as in Grackle, the rates are interpolated linearly in log10(rate) over ( log10(nH), z, log10(T) ),
+#       whereas earlier versions of this script interpolated the rates themselves linearly, so the plotted
+#       curves differ between the table nodes
+#   --> the sorted and deduplicated table is cached in CACHE_DIR and memory-mapped on later runs when
+#       CACHE_DIR is set (see tool/analysis/gamer_cooling_table.py)
 class GrackleTable():
-    def __init__(self, file_path):
+    def __init__(self, file_path, cache_dir=CACHE_DIR):
+        CoolingTable   = import_gamer_tool('gamer_cooling_table').CoolingTable
         self.file_path = file_path
-        self.build_interpolators()
-
-    def build_interpolators(self):
-        with h5py.File(self.file_path, 'r') as f:
-            # Load Cooling, Heating, and Mean Molecular Weight directly from "HM2012.h5"
-            ds_cool = f['CoolingRates/Primordial/Cooling']
-            ds_heat = f['CoolingRates/Primordial/Heating']
-            ds_mmw  = f['CoolingRates/Primordial/MMW']
-
-            # Extract grids
-            nh_grid   = ds_cool.attrs['Parameter1'][:]
-            z_grid    = ds_cool.attrs['Parameter2'][:]
-            t_grid    = ds_cool.attrs['Temperature'][:]
-
-            cool_data = ds_cool[:]
-            heat_data = ds_heat[:]
-            mmw_data  = ds_mmw[:]
-
-            grids = [nh_grid, z_grid, t_grid]
-            data_list = [cool_data, heat_data, mmw_data]
-
-            # Sort and clean grids and data
-            for i in range(len(grids)):
-                # Sort grids
-                sort_idx = np.argsort(grids[i])
-                grids[i] = grids[i][sort_idx]
-                for j in range(len(data_list)):
-                    data_list[j] = np.take(data_list[j], sort_idx, axis=i)
-
-                # Remove redundant grids
-                mask = np.concatenate(([True], np.diff(grids[i]) > 0))
-                grids[i] = grids[i][mask]
-                for j in range(len(data_list)):
-                    data_list[j] = np.compress(mask, data_list[j], axis=i)
-
-            # Create interpolators
-            self.cool_interp = RegularGridInterpolator(tuple(grids), data_list[0])
-            self.heat_interp = RegularGridInterpolator(tuple(grids), data_list[1])
-            self.mmw_interp  = RegularGridInterpolator(tuple(grids), data_list[2])
-
-            self.log_nh_min  = grids[0].min()
-            self.log_nh_max  = grids[0].max()
-            self.z_min       = grids[1].min()
-            self.z_max       = grids[1].max()
-            self.t_min       = grids[2].min()
-            self.t_max       = grids[2].max()
+        self.table     = CoolingTable(file_path, group='CoolingRates/Primordial', quantities=('Cooling', 'Heating', 'MMW'),
+                                      cache_dir=cache_dir)
 
     def get_grackle_rates_and_mmw(self, z_target, nh_target, t_target):
-        # Bounds clipping
-        log_nh = np.clip(np.log10(nh_target), self.log_nh_min, self.log_nh_max)
-        z_safe = np.clip(           z_target,      self.z_min,      self.z_max)
-        t_safe = np.clip(           t_target,      self.t_min,      self.t_max)
-
-        points = np.dstack((log_nh, z_safe, t_safe))
+        # all rates are interpolated together; values outside the table are clipped to its boundaries
+        rates = self.table.lookup(nh_target, z_target, t_target)
 
-        return self.cool_interp(points), self.heat_interp(points), self.mmw_interp(points)
+        return np.atleast_2d(rates['Cooling']), np.atleast_2d(rates['Heating']), np.atleast_2d(rates['MMW'])
 
 
 # -------------------------------------------------------------------------
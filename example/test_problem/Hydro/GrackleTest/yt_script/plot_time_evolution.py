@@ -1,9 +1,28 @@
 import argparse
+import importlib
+import os
 import sys
 import yt
 import matplotlib.pyplot as plt
 import numpy as np
 
+
+# import a module of tool/analysis from $GAMER_PATH (the GAMER root directory) or relative to this script
+def import_gamer_tool( name ):
+    paths = [ os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../..') ]
+    if 'GAMER_PATH' in os.environ:
+        paths.insert( 0, os.environ['GAMER_PATH'] )
+    for path in paths:
+        path = os.path.join( path, 'tool', 'analysis' )
+        if os.path.isfile( os.path.join(path, name+'.py') ):
+            if path not in sys.path:
+                sys.path.insert( 0, path )
+            return importlib.import_module( name )
+    print( 'Cannot find tool/analysis/%s.py of GAMER --> please set the environment variable GAMER_PATH '
+           'to the GAMER root directory !!'%name )
+    sys.exit(1)
+
+
 # load the command-line parameters
 parser = argparse.ArgumentParser( description='Plot the gas time evolution' )
 
@@ -15,6 +34,11 @@ parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_e
                      help='last data index' )
 parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
                      help='delta data index [%(default)d]', default=1 )
+parser.add_argument( '-n', action='store', required=False, type=int, dest='nproc',
+                     help='number of processes [%(default)d]', default=1 )
+parser.add_argument( '-c', action='store_true', required=False, dest='cache',
+                     help='cache the per-snapshot results in <prefix>/time_evolution_cache.npz [%(default)s]',
+                     default=False )
 
 args=parser.parse_args()
 
@@ -29,40 +53,28 @@ idx_start = args.idx_start
 idx_end   = args.idx_end
 didx      = args.didx
 prefix    = args.prefix
+cache     = os.path.join( prefix, 'time_evolution_cache.npz' ) if args.cache else None
 
 if didx <= 0 or idx_end < idx_start:
     raise ValueError( 'Invalid input: idx_start = %d, idx_end = %d, didx = %d !!'%(idx_start, idx_end, didx) )
 
 
-ts = yt.DatasetSeries( [ prefix+'/Data_%06d'%idx for idx in range(idx_start, idx_end+1, didx) ] )
-
-
-time               = np.array([])
-density            = np.array([])
-metal_density      = np.array([])
-electron_density   = np.array([])
-HI_density         = np.array([])
-HII_density        = np.array([])
-HeI_density        = np.array([])
-HeII_density       = np.array([])
-HeIII_density      = np.array([])
-HM_density         = np.array([])
-H2I_density        = np.array([])
-H2II_density       = np.array([])
-DI_density         = np.array([])
-DII_density        = np.array([])
-HDI_density        = np.array([])
-temperature        = np.array([])
-gr_temperature     = np.array([])
-gr_mu              = np.array([])
-temperature_max    = np.array([])
-temperature_min    = np.array([])
-gr_temperature_max = np.array([])
-gr_temperature_min = np.array([])
+SPECIES = { 1: [ 'electron_density', 'HI_density', 'HII_density', 'HeI_density', 'HeII_density', 'HeIII_density' ],
+            2: [ 'HM_density', 'H2I_density', 'H2II_density' ],
+            3: [ 'DI_density', 'DII_density', 'HDI_density' ] }
 
+COLUMNS = [ 'time', 'density', 'metal_density' ] + [ v for lv in SPECIES for v in SPECIES[lv] ] + \
+          [ 'temperature', 'gr_temperature', 'gr_mu', 'temperature_max', 'temperature_min',
+            'gr_temperature_max', 'gr_temperature_min' ]
 
-# collect the results
-for ds in ts.piter():
+# identify reduce_one() in the cache --> change it whenever reduce_one() changes
+CACHE_KEY = 'grackle_time_evolution-v1'
+
+
+# reduce one snapshot (run in the worker processes)
+def reduce_one( filename ):
+
+    ds = yt.load( filename )
 
     # check
     if not ds.parameters["Opt__Output_GrackleTemp"]:
@@ -74,40 +86,64 @@ for ds in ts.piter():
     if not ds.parameters["Opt__Output_GrackleTCool"]:
         raise ValueError( 'OPT__OUTPUT_GRACKLE_TCOOL must be enabled !!' )
 
-    ad = ds.all_data()
+    ad  = ds.all_data()
+    out = {}
 
-    time                 = np.append( time              , ds.current_time.in_units('Myr').d )
-    density              = np.append( density           , np.average(ad['density'            ].in_units('g/cm**3').d) )
+    out['time']    = ds.current_time.in_units('Myr').d
+    out['density'] = np.average( ad['density'].in_units('g/cm**3').d )
 
     if ds.parameters['Grackle_Metal'] == 1:
-        metal_density    = np.append( metal_density     , np.average(ad['metal_density'      ].in_units('g/cm**3').d) )
-
-    if ds.parameters['Grackle_Primordial'] >= 1:
-        electron_density = np.append( electron_density  , np.average(ad['electron_density'   ].in_units('g/cm**3').d) )
-        HI_density       = np.append( HI_density        , np.average(ad['HI_density'         ].in_units('g/cm**3').d) )
-        HII_density      = np.append( HII_density       , np.average(ad['HII_density'        ].in_units('g/cm**3').d) )
-        HeI_density      = np.append( HeI_density       , np.average(ad['HeI_density'        ].in_units('g/cm**3').d) )
-        HeII_density     = np.append( HeII_density      , np.average(ad['HeII_density'       ].in_units('g/cm**3').d) )
-        HeIII_density    = np.append( HeIII_density     , np.average(ad['HeIII_density'      ].in_units('g/cm**3').d) )
-
-    if ds.parameters['Grackle_Primordial'] >= 2:
-        HM_density       = np.append( HM_density        , np.average(ad['HM_density'         ].in_units('g/cm**3').d) )
-        H2I_density      = np.append( H2I_density       , np.average(ad['H2I_density'        ].in_units('g/cm**3').d) )
-        H2II_density     = np.append( H2II_density      , np.average(ad['H2II_density'       ].in_units('g/cm**3').d) )
-
-    if ds.parameters['Grackle_Primordial'] >= 3:
-        DI_density       = np.append( DI_density        , np.average(ad['DI_density'         ].in_units('g/cm**3').d) )
-        DII_density      = np.append( DII_density       , np.average(ad['DII_density'        ].in_units('g/cm**3').d) )
-        HDI_density      = np.append( HDI_density       , np.average(ad['HDI_density'        ].in_units('g/cm**3').d) )
-
-    temperature          = np.append( temperature       , np.average(ad['temperature'        ].in_units('K').d)       )
-    gr_temperature       = np.append( gr_temperature    , np.average(ad['grackle_temperature'].in_units('K').d)       )
-    gr_mu                = np.append( gr_mu             , np.average(ad['grackle_mu'         ].d)                     )
-
-    temperature_max      = np.append( temperature_max   , np.max(    ad['temperature'        ].in_units('K').d)       )
-    temperature_min      = np.append( temperature_min   , np.min(    ad['temperature'        ].in_units('K').d)       )
-    gr_temperature_max   = np.append( gr_temperature_max, np.max(    ad['grackle_temperature'].in_units('K').d)       )
-    gr_temperature_min   = np.append( gr_temperature_min, np.min(    ad['grackle_temperature'].in_units('K').d)       )
+        out['metal_density'] = np.average( ad['metal_density'].in_units('g/cm**3').d )
+
+    for lv, species in SPECIES.items():
+        if ds.parameters['Grackle_Primordial'] >= lv:
+            for v in species:
+                out[v] = np.average( ad[v].in_units('g/cm**3').d )
+
+    temp    = ad['temperature'        ].in_units('K').d
+    gr_temp = ad['grackle_temperature'].in_units('K').d
+
+    out['temperature']        = np.average( temp )
+    out['gr_temperature']     = np.average( gr_temp )
+    out['gr_mu']              = np.average( ad['grackle_mu'].d )
+    out['temperature_max']    = np.max( temp )
+    out['temperature_min']    = np.min( temp )
+    out['gr_temperature_max'] = np.max( gr_temp )
+    out['gr_temperature_min'] = np.min( gr_temp )
+
+    return out
+
+
+# collect the results
+#   --> only the snapshots not found in the cache (or modified since) are processed
+#   --> the cache is discarded when CACHE_KEY or COLUMNS changes
+reduce_series = import_gamer_tool( 'gamer_series' ).reduce_series
+filenames = [ prefix+'/Data_%06d'%idx for idx in range(idx_start, idx_end+1, didx) ]
+res       = reduce_series( filenames, reduce_one, cache=cache, nproc=args.nproc, columns=COLUMNS, key=CACHE_KEY )
+ds        = yt.load( filenames[-1] )
+
+time               = res['time'              ]
+density            = res['density'           ]
+metal_density      = res['metal_density'     ]
+electron_density   = res['electron_density'  ]
+HI_density         = res['HI_density'        ]
+HII_density        = res['HII_density'       ]
+HeI_density        = res['HeI_density'       ]
+HeII_density       = res['HeII_density'      ]
+HeIII_density      = res['HeIII_density'     ]
+HM_density         = res['HM_density'        ]
+H2I_density        = res['H2I_density'       ]
+H2II_density       = res['H2II_density'      ]
+DI_density         = res['DI_density'        ]
+DII_density        = res['DII_density'       ]
+HDI_density        = res['HDI_density'       ]
+temperature        = res['temperature'       ]
+gr_temperature     = res['gr_temperature'    ]
+gr_mu              = res['gr_mu'             ]
+temperature_max    = res['temperature_max'   ]
+temperature_min    = res['temperature_min'   ]
+gr_temperature_max = res['gr_temperature_max']
+gr_temperature_min = res['gr_temperature_min']
 
 
 # plot the results
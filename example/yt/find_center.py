@@ -1,3 +1,5 @@
+# see tool/analysis/gamer_find_center.py for a single-pass version reading the HDF5 snapshots directly
+
 import argparse
 import sys
 import yt
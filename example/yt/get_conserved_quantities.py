@@ -1,3 +1,5 @@
+# see tool/analysis/gamer_stencil.py for the ELBDM momentum and kinetic energy computed with AMR-aware stencils
+# reading the HDF5 snapshots directly (without yt gradient fields)
 import argparse
 import sys
 import yt
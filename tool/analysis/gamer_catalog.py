@@ -0,0 +1,341 @@
+"""
+SQLite catalog of the GAMER HDF5 snapshots (Data_XXXXXX) of a run directory
+
+The catalog records the key information of every snapshot (Info/KeyInfo and a few runtime parameters) so that
+series scripts can select snapshots by time or redshift without opening hundreds of large files. Only the small
+"Info" group of each new or modified snapshot is read; snapshots whose size and modification time are unchanged
+since the last scan are skipped, so the catalog can be updated cheaply as new dumps appear.
+
+Snapshots are identified by their path relative to the directory of the catalog file, so one catalog can hold
+the snapshots of several directories and select() returns paths that exist regardless of the working directory.
+
+Tables:
+   snapshot : Filename (primary key, relative to the catalog directory), DumpID, Time, Step, ScaleFactor,
+              Redshift, Age (physical time in Myr), NLevel, MaxLevel, NPatchTotal, Par_NPar, Model, Size, MTime,
+              Checksum
+   npatch   : Filename, Level, NPatch
+
+In comoving runs, Time is the scale factor and Age is computed from the flat LCDM cosmology of OmegaM0 and
+Hubble0; otherwise Redshift is NULL and Age = Time*Unit_T (NULL if UNIT_T is unavailable).
+
+The checksum is either "quick" (hash of the file size and the first and last MiB), "full" (hash of the whole
+file), or "none".
+
+Example:
+   python gamer_catalog.py -i ./                          # create or update ./SnapshotCatalog.db
+   python gamer_catalog.py -i ./ --z 1 2                  # list the snapshots with 1 <= z <= 2
+   python gamer_catalog.py -i ./ --every 10               # one snapshot every 10 Myr
+
+   from gamer_catalog import select
+   filenames = select( "SnapshotCatalog.db", z=(1.0, 2.0) )
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+
+import h5py
+import numpy as np
+
+from gamer_snapshot import parallel_map
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+CONST_MYR    = 3.15576e13          # Myr in s
+CONST_MPC_KM = 3.08567758149e19    # Mpc in km
+CHUNK_SIZE   = 1<<20               # checksum block size in bytes
+CHECKSUM     = ( "quick", "full", "none" )
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+   Filename    TEXT PRIMARY KEY,
+   DumpID      INTEGER,
+   Time        REAL,
+   Step        INTEGER,
+   ScaleFactor REAL,
+   Redshift    REAL,
+   Age         REAL,
+   NLevel      INTEGER,
+   MaxLevel    INTEGER,
+   NPatchTotal INTEGER,
+   Par_NPar    INTEGER,
+   Model       INTEGER,
+   Size        INTEGER,
+   MTime       REAL,
+   Checksum    TEXT
+);
+CREATE TABLE IF NOT EXISTS npatch (
+   Filename    TEXT,
+   Level       INTEGER,
+   NPatch      INTEGER,
+   PRIMARY KEY ( Filename, Level )
+);
+CREATE INDEX IF NOT EXISTS snapshot_time     ON snapshot ( Time );
+CREATE INDEX IF NOT EXISTS snapshot_redshift ON snapshot ( Redshift );
+CREATE INDEX IF NOT EXISTS snapshot_age      ON snapshot ( Age );
+"""
+
+COLUMNS = ( "Filename", "DumpID", "Time", "Step", "ScaleFactor", "Redshift", "Age", "NLevel", "MaxLevel",
+            "NPatchTotal", "Par_NPar", "Model", "Size", "MTime", "Checksum" )
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def checksum( filename, mode="quick" ):
+   """
+   Hex digest of a file. mode="quick" hashes only the size and the first and last CHUNK_SIZE bytes.
+   """
+   if mode == "none":  return None
+   if mode not in CHECKSUM:  raise ValueError( "unsupported checksum mode \"%s\" (%s) !!"%(mode, "/".join(CHECKSUM)) )
+   h    = hashlib.blake2b( digest_size=16 )
+   size = os.path.getsize( filename )
+   with open( filename, "rb" ) as f:
+      if mode == "quick":
+         h.update( str(size).encode() )
+         h.update( f.read(CHUNK_SIZE) )
+         if size > CHUNK_SIZE:
+            f.seek( max(CHUNK_SIZE, size-CHUNK_SIZE) )
+            h.update( f.read(CHUNK_SIZE) )
+      else:
+         for chunk in iter( lambda: f.read(CHUNK_SIZE), b"" ):  h.update( chunk )
+   return h.hexdigest()
+
+
+def cosmic_age( a, omega_m0, hubble0 ):
+   """
+   Age of a flat LCDM universe at the scale factor a in Myr.
+   """
+   h0       = 100.0*hubble0/CONST_MPC_KM          # in 1/s
+   omega_l0 = 1.0 - omega_m0
+   if omega_l0 <= 0.0:  return 2.0/( 3.0*h0 )*a**1.5/CONST_MYR
+   return 2.0/( 3.0*h0*np.sqrt(omega_l0) )*np.arcsinh( np.sqrt(omega_l0/omega_m0)*a**1.5 )/CONST_MYR
+
+
+def _compound( f, name ):
+   if name not in f:  return {}
+   data = f[name][()]
+   return { k: data[k] for k in data.dtype.names }
+
+
+def catalog_key( db, filename ):
+   """
+   Key of a snapshot in the catalog db: its path relative to the directory of db.
+   """
+   return os.path.relpath( os.path.abspath(filename), os.path.dirname(os.path.abspath(db)) )
+
+
+def catalog_path( db, key ):
+   return os.path.normpath( os.path.join(os.path.dirname(db), key) )
+
+
+def read_info( filename, checksum_mode="quick" ):
+   """
+   Catalog entry of a snapshot. Only the "Info" group is read.
+   Return ( row of the snapshot table as a dictionary with Filename = the given filename, NPatch of each level ).
+   """
+   with h5py.File( filename, "r" ) as f:
+      key        = _compound( f, "Info/KeyInfo" )
+      makefile   = _compound( f, "Info/Makefile" )
+      input_para = _compound( f, "Info/InputPara" )
+
+   npatch   = np.array( key["NPatch"], dtype=np.int64 )
+   time     = float( np.atleast_1d(key["Time"])[0] )
+   comoving = bool( makefile.get("Comoving", 0) )
+   stat     = os.stat( filename )
+
+   if comoving:
+      a   = time
+      z   = 1.0/a - 1.0
+      age = cosmic_age( a, float(input_para["OmegaM0"]), float(input_para["Hubble0"]) ) \
+            if "OmegaM0" in input_para  and  "Hubble0" in input_para else None
+   else:
+      a   = None
+      z   = None
+      age = time*float( input_para["Unit_T"] )/CONST_MYR if "Unit_T" in input_para else None
+
+   row = { "Filename"   : filename,
+           "DumpID"     : int( key["DumpID"] ) if "DumpID" in key else None,
+           "Time"       : time,
+           "Step"       : int( key["Step"] ),
+           "ScaleFactor": a,
+           "Redshift"   : z,
+           "Age"        : age,
+           "NLevel"     : int( key["NLevel"] ),
+           "MaxLevel"   : int( np.nonzero(npatch)[0][-1] ) if npatch.any() else 0,
+           "NPatchTotal": int( npatch.sum() ),
+           "Par_NPar"   : int( key.get("Par_NPar", 0) ),
+           "Model"      : int( key["Model"] ),
+           "Size"       : stat.st_size,
+           "MTime"      : stat.st_mtime,
+           "Checksum"   : checksum( filename, checksum_mode ) }
+   return row, npatch
+
+
+def _info_task( task ):
+   filename, checksum_mode = task
+   try:
+      return read_info( filename, checksum_mode )
+   except ( OSError, KeyError ) as err:
+      print( "WARNING : skip %s (%s) !!"%( filename, err ), file=sys.stderr )
+      return None
+
+
+def connect( db ):
+   con = sqlite3.connect( db )
+   con.row_factory = sqlite3.Row
+   con.executescript( SCHEMA )
+   return con
+
+
+def update( db, prefix="./", pattern="Data_[0-9]*", checksum_mode="quick", prune=True, nproc=1 ):
+   """
+   Add the new and modified snapshots "prefix/pattern" to the catalog db. Snapshots with unchanged size and
+   modification time are skipped. Entries of files that no longer exist (in any directory) are removed when
+   prune=True.
+
+   Return ( number of added or updated entries, number of removed entries ).
+   """
+   filenames = sorted( f for f in glob.glob(os.path.join(prefix, pattern)) if re.search(r"_\d+$", f) )
+   with connect( db ) as con:
+      known   = { r["Filename"]: (r["Size"], r["MTime"]) for r in con.execute("SELECT Filename, Size, MTime FROM snapshot") }
+      tasks   = []
+      for f in filenames:
+         stat = os.stat( f )
+         if known.get( catalog_key(db, f) ) != ( stat.st_size, stat.st_mtime ):  tasks.append( (f, checksum_mode) )
+
+      nadd = 0
+      for res in parallel_map( _info_task, tasks, nproc, ordered=True ):
+         if res is None:  continue
+         row, npatch = res
+         row["Filename"] = catalog_key( db, row["Filename"] )
+         con.execute( "INSERT OR REPLACE INTO snapshot (%s) VALUES (%s)"%( ", ".join(COLUMNS), ", ".join("?"*len(COLUMNS)) ),
+                      [ row[c] for c in COLUMNS ] )
+         con.execute( "DELETE FROM npatch WHERE Filename = ?", (row["Filename"],) )
+         con.executemany( "INSERT INTO npatch VALUES (?, ?, ?)",
+                          [ (row["Filename"], lv, int(n)) for lv, n in enumerate(npatch) ] )
+         nadd += 1
+
+      removed = [ f for f in known if not os.path.isfile(catalog_path(db, f)) ] if prune else []
+      for f in removed:
+         con.execute( "DELETE FROM snapshot WHERE Filename = ?", (f,) )
+         con.execute( "DELETE FROM npatch   WHERE Filename = ?", (f,) )
+   con.close()
+   return nadd, len( removed )
+
+
+def query( db, z=None, time=None, age=None, dump_id=None, every=None, every_key="Age" ):
+   """
+   Snapshots of the catalog db ordered by time, as a list of sqlite3.Row.
+
+   z, time, age, dump_id : closed ranges ( min, max ); None for either bound means unbounded
+   every                 : keep only the first snapshot at or after each multiple of this interval of
+                           every_key (e.g., every=10 with every_key="Age" for one snapshot every 10 Myr)
+   """
+   cond, arg = [], []
+   for col, rng in ( ("Redshift", z), ("Time", time), ("Age", age), ("DumpID", dump_id) ):
+      if rng is None:  continue
+      lo, hi = rng
+      if lo is not None:  cond.append( "%s >= ?"%col );  arg.append( lo )
+      if hi is not None:  cond.append( "%s <= ?"%col );  arg.append( hi )
+   sql = "SELECT * FROM snapshot" + ( " WHERE " + " AND ".join(cond) if cond else "" ) + " ORDER BY Time, DumpID"
+
+   with connect( db ) as con:
+      rows = con.execute( sql, arg ).fetchall()
+   con.close()
+   if every is None:  return rows
+
+   if every <= 0.0:  raise ValueError( "every must be positive !!" )
+   if every_key not in ( "Time", "Age", "Step", "DumpID" ):
+      raise ValueError( "unsupported every_key \"%s\" (Time/Age/Step/DumpID) !!"%every_key )
+   rows   = [ r for r in rows if r[every_key] is not None ]
+   if not rows:  return rows
+   picked = []
+   origin = rows[0][every_key]
+   last   = None
+   for r in rows:
+      bin_ = int( np.floor((r[every_key] - origin)/every + 1.0e-10) )
+      if bin_ != last:
+         picked.append( r )
+         last = bin_
+   return picked
+
+
+def select( db, **kwargs ):
+   """
+   Paths of the snapshots returned by query().
+   """
+   return [ catalog_path(db, r["Filename"]) for r in query(db, **kwargs) ]
+
+
+def npatch( db, filename ):
+   """
+   Number of patches of each level of a cataloged snapshot.
+   """
+   with connect( db ) as con:
+      rows = con.execute( "SELECT Level, NPatch FROM npatch WHERE Filename = ? ORDER BY Level",
+                          (catalog_key(db, filename),) ).fetchall()
+   con.close()
+   return np.array( [ r["NPatch"] for r in rows ], dtype=np.int64 )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Build, update, and query the snapshot catalog of a run directory' )
+
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '--db', action='store', required=False, type=str, dest='db',
+                        help='catalog file [<prefix>/SnapshotCatalog.db]', default=None )
+   parser.add_argument( '--checksum', action='store', required=False, type=str, dest='checksum',
+                        help='checksum mode (%s) [%%(default)s]'%'/'.join(CHECKSUM), default='quick', choices=CHECKSUM )
+   parser.add_argument( '--no_update', action='store_true', required=False, dest='no_update',
+                        help='query the existing catalog without scanning the directory [%(default)s]', default=False )
+   parser.add_argument( '--z', action='store', required=False, type=float, dest='z', nargs=2,
+                        help='redshift range', default=None )
+   parser.add_argument( '--time', action='store', required=False, type=float, dest='time', nargs=2,
+                        help='range of the code time (scale factor in comoving runs)', default=None )
+   parser.add_argument( '--age', action='store', required=False, type=float, dest='age', nargs=2,
+                        help='range of the physical time in Myr', default=None )
+   parser.add_argument( '--every', action='store', required=False, type=float, dest='every',
+                        help='select one snapshot per interval of the physical time in Myr', default=None )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   db = args.db if args.db is not None else os.path.join( args.prefix, 'SnapshotCatalog.db' )
+   if not args.no_update:
+      nadd, nrm = update( db, args.prefix, checksum_mode=args.checksum, nproc=args.nproc )
+      print( '%s : %d snapshots added/updated, %d removed\n'%( db, nadd, nrm ) )
+
+   rows = query( db, z=args.z, time=args.time, age=args.age, every=args.every )
+   print( '#%19s  %8s  %20s  %10s  %14s  %14s  %10s  %12s'%( 'Filename', 'DumpID', 'Time', 'Step', 'Redshift',
+                                                          'Age[Myr]', 'NPatch', 'Par_NPar' ) )
+   for r in rows:
+      print( '%20s  %8s  %20.14e  %10d  %14s  %14s  %10d  %12d'%(
+             r['Filename'], r['DumpID'], r['Time'], r['Step'],
+             '%14.7e'%r['Redshift'] if r['Redshift'] is not None else 'N/A',
+             '%14.7e'%r['Age']      if r['Age']      is not None else 'N/A',
+             r['NPatchTotal'], r['Par_NPar'] ) )
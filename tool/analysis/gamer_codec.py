@@ -0,0 +1,138 @@
+"""
+Error-bounded lossy codec of the GridData fields for archiving GAMER HDF5 snapshots
+
+Modes "abs" and "range" quantize each patch of a field uniformly with its own offset and step:
+   q = rint( (x - offset)/step ),   x' = offset + q*step,   |x - x'| <= step/2
+where offset is the minimum value of the patch and step/2 is either the error bound ("abs") or the error bound
+times the value range max-min of the patch ("range"). Note that "range" does not bound the error relative to each
+value: values much smaller than the range of their patch (e.g., the low densities and the momenta near zero in a
+patch containing a clump) can have arbitrarily large relative errors.
+
+Mode "rel" bounds the error relative to each value, |x - x'| <= error*|x|, by quantizing log|x| uniformly and
+storing the sign separately:
+   q = 2*( rint( (log|x| - offset)/step ) + 1 ) + ( x < 0 ),   step = 2*log(1+error)
+where offset is the minimum of log|x| over the nonzero values of the patch. Zeros are stored exactly as q = 0, so
+fields crossing zero are supported.
+
+All bounds hold up to the rounding error of the original floating-point type. The integers q are stored in
+GridData/<field> with the smallest unsigned type able to hold them (compressed further by the HDF5 filters), and the
+per-patch offsets and steps are stored in Codec/<field>/Offset and Codec/<field>/Step. The field attributes record
+the codec:
+   Codec = "quantize" ("abs"/"range") or "quantize_log" ("rel"),  CodecMode = "abs"/"range"/"rel",
+   CodecError = error bound,  CodecDType = original dtype
+
+Encoded snapshots are decoded transparently by gamer_snapshot.read_grid(), so all Python tools reading through
+gamer_snapshot.py work unchanged. Other readers (e.g., yt and GAMER restarts) do not support them.
+
+Use gamer_repack.py --lossy to encode snapshots.
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import numpy as np
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+CODEC_NAME     = "quantize"
+CODEC_NAME_LOG = "quantize_log"
+CODEC_MODE     = ( "abs", "range", "rel" )
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def codec_name( mode ):
+   return CODEC_NAME_LOG if mode == "rel" else CODEC_NAME
+
+
+def quantized_dtype( mode, error ):
+   """
+   Integer type of the quantized values. For mode="range" the number of levels per patch is bounded by
+   1/(2*error); for mode="abs"/"rel" it depends on the data, so uint32 is used (its unused high bytes are removed
+   efficiently by the shuffle+gzip filters).
+   """
+   if mode == "range":
+      nmax = int( np.ceil(0.5/error) ) + 1
+      for dtype in ( np.uint8, np.uint16, np.uint32 ):
+         if nmax <= np.iinfo( dtype ).max:  return np.dtype( dtype )
+      return np.dtype( np.uint64 )
+   return np.dtype( np.uint32 )
+
+
+def encode( data, mode, error, dtype=None ):
+   """
+   Quantize a block of patches.
+
+   data  : float array [NPatch][...]
+   mode  : "abs", "range", or "rel"
+   error : error bound (absolute, relative to the value range of each patch, or relative to each value)
+
+   Return ( q [NPatch][...], offset [NPatch], step [NPatch] ).
+   """
+   if mode not in CODEC_MODE:  raise ValueError( "unsupported codec mode \"%s\" (%s) !!"%(mode, "/".join(CODEC_MODE)) )
+   if dtype is None:  dtype = quantized_dtype( mode, error )
+   flat   = data.reshape( len(data), -1 ).astype( np.float64 )
+   if not np.all( np.isfinite(flat) ):  raise ValueError( "non-finite values cannot be encoded !!" )
+
+   if mode == "rel":
+      if not 0.0 < error < 1.0:  raise ValueError( "the relative error bound must be in (0, 1) !!" )
+      nz     = flat != 0.0
+      logx   = np.log( np.abs(np.where(nz, flat, 1.0)) )
+      offset = np.where( nz, logx, np.inf ).min( axis=1 ) if flat.shape[1] else np.zeros( len(flat) )
+      offset = np.where( np.isfinite(offset), offset, 0.0 )   # patches of zeros
+      step   = np.full( len(flat), 2.0*np.log1p(error) )
+      level  = np.rint( (logx - offset[:,None])/step[:,None] )
+      q      = np.where( nz, 2.0*(level + 1.0) + (flat < 0.0), 0.0 )
+   else:
+      offset = flat.min( axis=1 )
+      vrange = flat.max( axis=1 ) - offset
+      step   = np.full( len(flat), 2.0*error ) if mode == "abs" else 2.0*error*vrange
+      step   = np.where( step > 0.0, step, 1.0 )          # constant patches
+      q      = np.rint( (flat - offset[:,None])/step[:,None] )
+
+   if q.size  and  q.max() > np.iinfo( dtype ).max:
+      raise ValueError( "too many quantization levels for %s; increase the error bound or use mode=range !!"%dtype )
+   return q.astype( dtype ).reshape( data.shape ), offset, step
+
+
+def decode_array( q, offset, step, dtype, mode="abs" ):
+   shape = ( len(q), ) + ( 1, )*( q.ndim-1 )
+   if mode == "rel":
+      q     = q.astype( np.int64 )
+      level = q//2 - 1
+      x     = np.exp( offset.reshape(shape) + level*step.reshape(shape) )
+      return np.where( q == 0, 0.0, np.where(q%2 == 1, -x, x) ).astype( dtype )
+   return ( offset.reshape(shape) + q*step.reshape(shape) ).astype( dtype )
+
+
+def decode( h5file, field, g0, g1 ):
+   """
+   Decode GridData/<field> of the patches [g0, g1) of an opened encoded snapshot.
+   """
+   dset  = h5file["GridData"][field]
+   codec = h5file["Codec"][field]
+   mode  = "rel" if is_encoded( dset, CODEC_NAME_LOG ) else "abs"
+   return decode_array( dset[g0:g1], codec["Offset"][g0:g1], codec["Step"][g0:g1], np.dtype(dset.attrs["CodecDType"]),
+                        mode )
+
+
+def is_encoded( dset, names=(CODEC_NAME, CODEC_NAME_LOG) ):
+   codec = dset.attrs.get( "Codec", None )
+   if isinstance( codec, bytes ):  codec = codec.decode()
+   return codec in ( (names,) if isinstance(names, str) else names )
+
+
+def error_stats( orig, decoded ):
+   """
+   Return ( max absolute error, max relative error (over nonzero values), number of values ).
+   """
+   x    = orig.astype( np.float64 )
+   err  = np.abs( decoded.astype(np.float64) - x )
+   nz   = x != 0.0
+   rel  = ( err[nz]/np.abs(x[nz]) ).max() if nz.any() else 0.0
+   return ( err.max() if err.size else 0.0, rel, x.size )
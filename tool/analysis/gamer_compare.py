@@ -0,0 +1,271 @@
+"""
+Compare two GAMER HDF5 snapshots patch by patch
+
+A parallel Python counterpart of tool/analysis/gamer_compare_data for regression tests. Patches of the two files
+are matched by their level and load-balance index (Tree/LBIdx), which identifies a patch independently of the
+GID ordering and the number of MPI ranks. The matched patches are split into blocks that are read as hyperslabs
+from both files, and the grid fields of the blocks are compared in a process pool. Particles are matched by
+ParPUID (or by their order in the file when ParPUID is unavailable) and compared attribute by attribute.
+
+Errors are defined as in gamer_compare_data:
+   AbsErr = Data1 - Data2,   RelErr = AbsErr/( 0.5*(Data1 + Data2) )
+and a value violates the tolerance when |RelErr| > tol or the value is finite in only one file (values identical
+in both files, including NaN, never violate). With tol = 0 (default) the comparison is bitwise. With --early_exit,
+the comparison stops at the first block or attribute with a violation, which makes bitwise-reproducibility
+checks of identical runs (the common case) and of broken runs (the case of interest) both fast.
+
+The exit status is 0 if the snapshots agree within the tolerance and 1 otherwise.
+
+Example:
+   python gamer_compare.py Data_000010 ../ref/Data_000010 -e 1.0e-12 -p 8
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import h5py
+import numpy as np
+
+from gamer_snapshot import Snapshot, imap, load, read_grid
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+_par_order = {}   # particle permutations shared with the forked workers
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def match_patches( snap1, snap2 ):
+   """
+   Match the patches of two snapshots by level and LBIdx.
+   Return ( GIDs in snap1, GIDs in snap2 ) of the matched patches sorted by the GIDs in snap1, and the number of
+   unmatched patches of each file.
+   """
+   gid1, gid2 = [], []
+   for lv in range( min(snap1.nlevel, snap2.nlevel) ):
+      g1 = snap1.level_gids( lv )
+      g2 = snap2.level_gids( lv )
+      _, i1, i2 = np.intersect1d( snap1.lbidx[g1], snap2.lbidx[g2], assume_unique=True, return_indices=True )
+      gid1.append( g1[i1] )
+      gid2.append( g2[i2] )
+   gid1  = np.concatenate( gid1 ) if gid1 else np.zeros( 0, dtype=np.int64 )
+   gid2  = np.concatenate( gid2 ) if gid2 else np.zeros( 0, dtype=np.int64 )
+   order = np.argsort( gid1 )
+   return gid1[order], gid2[order], snap1.npatch_all - len(gid1), snap2.npatch_all - len(gid2)
+
+
+def match_blocks( snap1, gid1, gid2, max_size=1024 ):
+   """
+   Split the matched patches into blocks of consecutive GIDs on the same level in snap1 whose GIDs in snap2 span
+   at most 2*max_size patches, so that both files can be read with a single hyperslab per block.
+   Return a list of ( g0 in snap1, g1 in snap1, GIDs in snap2 ).
+   """
+   out = []
+   for g0, g1 in snap1.blocks( gid1, max_size=max_size ):
+      s0, s1 = np.searchsorted( gid1, [g0, g1] )
+      other  = gid2[s0:s1]
+      start  = 0
+      lo = hi = other[0]
+      for k in range( 1, len(other)+1 ):
+         if k < len(other):
+            lo, hi = min( lo, other[k] ), max( hi, other[k] )
+            if hi - lo < 2*max_size:  continue
+         out.append( (g0+start, g0+k, other[start:k]) )
+         start = k
+         if k < len(other):  lo = hi = other[k]
+   return out
+
+
+def compare_arrays( d1, d2, tol=0.0 ):
+   """
+   Compare two arrays. Return ( max |AbsErr|, max |RelErr|, number of violations, flat index of the first
+   violation (-1 if none) ).
+   """
+   a    = d1.astype( np.float64 )
+   b    = d2.astype( np.float64 )
+   same = ( a == b ) | ( np.isnan(a) & np.isnan(b) )
+   if same.all():  return 0.0, 0.0, 0, -1
+
+   with np.errstate( divide="ignore", invalid="ignore" ):
+      err = np.where( same, 0.0, a - b )
+      rel = np.where( same, 0.0, err/(0.5*(a + b)) )
+   fin  = np.isfinite( err )
+   bad  = ~same & ( ~np.isfinite(rel) | (np.abs(rel) > tol) )
+   nbad = int( bad.sum() )
+   first = int( np.argmax(bad) ) if nbad > 0 else -1
+   return ( float(np.abs(err[fin]).max()) if fin.any() else 0.0,
+            float(np.nanmax(np.abs(rel[fin]))) if fin.any() else 0.0, nbad, first )
+
+
+def _grid_task( task ):
+   file1, file2, fields, lv, g0, g1, gid2, tol = task
+   h0  = int( gid2.min() )
+   h1  = int( gid2.max() ) + 1
+   res = {}
+   with h5py.File( file1, "r" ) as f1, h5py.File( file2, "r" ) as f2:
+      for v in fields:
+         d1 = read_grid( f1, v, g0, g1 )
+         d2 = read_grid( f2, v, h0, h1 )[ gid2 - h0 ]
+         abs_err, rel_err, nbad, idx = compare_arrays( d1, d2, tol )
+         first = None
+         if idx >= 0:
+            p, k, j, i = np.unravel_index( idx, d1.shape )
+            first = ( g0+int(p), int(gid2[p]), (int(i), int(j), int(k)), float(d1[p,k,j,i]), float(d2[p,k,j,i]) )
+         res[v] = ( abs_err, rel_err, nbad, d1.size, first )
+   return lv, res
+
+
+def _particle_task( task ):
+   file1, file2, att, tol = task
+   with h5py.File( file1, "r" ) as f1, h5py.File( file2, "r" ) as f2:
+      d1 = f1["Particle"][att][()][ _par_order[1] ]
+      d2 = f2["Particle"][att][()][ _par_order[2] ]
+   abs_err, rel_err, nbad, idx = compare_arrays( d1, d2, tol )
+   first = None if idx < 0 else ( int(_par_order[1][idx]), int(_par_order[2][idx]), d1[idx].item(), d2[idx].item() )
+   return att, ( abs_err, rel_err, nbad, d1.size, first )
+
+
+def compare_grid( file1, file2, fields=None, tol=0.0, early_exit=False, nproc=1, max_size=1024 ):
+   """
+   Compare the grid fields of the matched patches.
+
+   Return ( {(field, level): [ max |AbsErr|, max |RelErr|, number of violations, number of cells, first violation ]},
+   number of unmatched patches in file1 and file2 ), where the first violation is ( GID1, GID2, (i,j,k), Data1,
+   Data2 ) of the violating cell with the smallest GID1 (and then k, j, i) or None. With early_exit, the blocks are
+   processed in the order of GID1 so that the reported first violation is still the true first one.
+   """
+   snap1 = load( file1 )
+   snap2 = Snapshot( file2 )
+   if fields is None:  fields = [ v for v in snap1.fields if v in snap2.fields ]
+   gid1, gid2, nmiss1, nmiss2 = match_patches( snap1, snap2 )
+   blocks = match_blocks( snap1, gid1, gid2, max_size=max_size )
+   tasks  = [ (file1, file2, fields, int(snap1.level[g0]), g0, g1, other, tol) for g0, g1, other in blocks ]
+
+   stats  = {}
+   for lv, res in imap( _grid_task, tasks, nproc, ordered=early_exit ):
+      for v, ( abs_err, rel_err, nbad, ncell, first ) in res.items():
+         s = stats.setdefault( (v, lv), [0.0, 0.0, 0, 0, None] )
+         s[0]  = max( s[0], abs_err )
+         s[1]  = max( s[1], rel_err )
+         s[2] += nbad
+         s[3] += ncell
+         if s[4] is None  or  ( first is not None  and  (first[0],) + first[2][::-1] < (s[4][0],) + s[4][2][::-1] ):
+            s[4] = first
+      if early_exit  and  any( r[2] for r in res.values() ):  break
+   return stats, nmiss1, nmiss2
+
+
+def compare_particles( file1, file2, atts=None, tol=0.0, early_exit=False, nproc=1 ):
+   """
+   Compare the particle attributes after matching the particles by ParPUID.
+
+   Return ( {attribute: [ max |AbsErr|, max |RelErr|, number of violations, number of particles, first violation ]},
+   number of unmatched particles in file1 and file2 ), where the first violation is ( index in file1, index in
+   file2, Data1, Data2 ) of the violating particle with the smallest index in file1 or None.
+   """
+   snap1 = load( file1 )
+   snap2 = Snapshot( file2 )
+   if atts is None:  atts = [ v for v in snap1.par_atts if v in snap2.par_atts ]
+
+   if "ParPUID" in snap1.par_atts  and  "ParPUID" in snap2.par_atts:
+      with snap1.open() as f1, snap2.open() as f2:
+         puid1 = f1["Particle/ParPUID"][()]
+         puid2 = f2["Particle/ParPUID"][()]
+      # duplicated PUIDs (e.g., in corrupted files) are reported as unmatched particles
+      _, i1, i2 = np.intersect1d( puid1, puid2, return_indices=True )
+      nmiss1, nmiss2 = len( puid1 ) - len( i1 ), len( puid2 ) - len( i2 )
+   else:
+      n1, n2 = int( snap1.par_offset[-1] ), int( snap2.par_offset[-1] )
+      i1 = i2 = np.arange( min(n1, n2) )
+      nmiss1, nmiss2 = n1 - len( i1 ), n2 - len( i2 )
+
+   # compare in the order of file1 so that the first violation is the one with the smallest index in file1
+   order = np.argsort( i1 )
+   _par_order[1] = i1[order]
+   _par_order[2] = i2[order]
+   stats = {}
+   try:
+      tasks = [ (file1, file2, v, tol) for v in atts ]
+      for att, s in imap( _particle_task, tasks, nproc, ordered=False ):
+         stats[att] = list( s )
+         if early_exit  and  s[2]:  break
+   finally:
+      _par_order.clear()
+   return stats, nmiss1, nmiss2
+
+
+def compare( file1, file2, fields=None, atts=None, tol=0.0, early_exit=False, nproc=1, max_size=1024 ):
+   """
+   Compare the grid fields and particles of two snapshots. Return ( grid stats, particle stats, passed ).
+   See compare_grid() and compare_particles() for the statistics.
+   """
+   grid, gmiss1, gmiss2 = compare_grid( file1, file2, fields, tol, early_exit, nproc, max_size )
+   ok = gmiss1 == 0  and  gmiss2 == 0  and  not any( s[2] for s in grid.values() )
+
+   par, pmiss1, pmiss2 = {}, 0, 0
+   if ok  or  not early_exit:
+      if load( file1 ).particle:
+         par, pmiss1, pmiss2 = compare_particles( file1, file2, atts, tol, early_exit, nproc )
+   ok &= pmiss1 == 0  and  pmiss2 == 0  and  not any( s[2] for s in par.values() )
+
+   return { "stats": grid, "unmatched": (gmiss1, gmiss2) }, { "stats": par, "unmatched": (pmiss1, pmiss2) }, ok
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Compare two GAMER HDF5 snapshots patch by patch' )
+
+   parser.add_argument( 'file1', type=str, help='first snapshot' )
+   parser.add_argument( 'file2', type=str, help='second snapshot' )
+   parser.add_argument( '-e', action='store', required=False, type=float, dest='tol',
+                        help='tolerance of the relative error [%(default)g]', default=0.0 )
+   parser.add_argument( '--fields', action='store', required=False, type=str, dest='fields', nargs='+',
+                        help='grid fields to compare [all common fields]', default=None )
+   parser.add_argument( '--atts', action='store', required=False, type=str, dest='atts', nargs='+',
+                        help='particle attributes to compare [all common attributes]', default=None )
+   parser.add_argument( '--early_exit', action='store_true', required=False, dest='early_exit',
+                        help='stop at the first tolerance violation [%(default)s]', default=False )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   grid, par, ok = compare( args.file1, args.file2, fields=args.fields, atts=args.atts, tol=args.tol,
+                            early_exit=args.early_exit, nproc=args.nproc )
+
+   print( 'Unmatched patches   : %d (file1), %d (file2)'%grid['unmatched'] )
+   print( '#%15s  %5s  %14s  %14s  %14s  %12s'%( 'Field', 'Level', 'MaxAbsErr', 'MaxRelErr', 'NViolate', 'NCell' ) )
+   for ( v, lv ), s in sorted( grid['stats'].items() ):
+      print( '%16s  %5d  %14.7e  %14.7e  %14d  %12d'%( v, lv, s[0], s[1], s[2], s[3] ) )
+      if s[4] is not None:
+         print( '%16s  first violation: GID1 %d, GID2 %d, (i,j,k) = %s, Data1 = %.15e, Data2 = %.15e'%( '', s[4][0], s[4][1], s[4][2], s[4][3], s[4][4] ) )
+
+   if par['stats']  or  any( par['unmatched'] ):
+      print( '\nUnmatched particles : %d (file1), %d (file2)'%par['unmatched'] )
+      print( '#%15s  %14s  %14s  %14s  %12s'%( 'Attribute', 'MaxAbsErr', 'MaxRelErr', 'NViolate', 'NPar' ) )
+      for v, s in sorted( par['stats'].items() ):
+         print( '%16s  %14.7e  %14.7e  %14d  %12d'%( v, s[0], s[1], s[2], s[3] ) )
+         if s[4] is not None:
+            print( '%16s  first violation: index1 %d, index2 %d, Data1 = %s, Data2 = %s'%( '', s[4][0], s[4][1], s[4][2], s[4][3] ) )
+
+   print( '\n%s'%( 'PASSED' if ok else 'FAILED' ) )
+   sys.exit( 0 if ok else 1 )
@@ -0,0 +1,252 @@
+"""
+Memory-mapped Grackle/Cloudy cooling tables with fused multi-quantity trilinear lookups
+
+The Cloudy tables used by Grackle (e.g., CloudyData_UVB=HM2012.h5, see
+example/test_problem/Hydro/GrackleTest/download_CloudyData_UVB.sh) store the cooling and heating rates normalized
+by nH^2 (erg*cm^3/s) and the mean molecular weight on a grid of ( log10(nH), redshift, temperature ). The axes are
+sorted and deduplicated once, and the quantities are interleaved into a single array [nH][z][T][quantity]. When a
+cache directory is given, this array is cached there as a .npy file (plus a .json file with the axes) and
+memory-mapped afterwards, and the cache is rebuilt automatically when the table changes. Otherwise the table is
+built in memory every time.
+
+As in Grackle, the interpolation is trilinear in ( log10(nH), z, log10(T) ) and is applied to log10 of the rates
+(and to MMW directly). All quantities are interpolated together from the same 8 corners, and large queries are
+split into chunks processed by a pool of threads. Queries outside the table are clipped to its boundaries.
+
+Example:
+   table = CoolingTable( "CloudyData_UVB=HM2012.h5", cache_dir="./cooling_cache" )
+   rates = table.lookup( nH, z, T )                  # {"Cooling": ..., "Heating": ..., "MMW": ...}
+   t_cool_Myr = table.cooling_time( nH, z, T )
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+# quantity -> interpolated in log10
+LOG_QUANTITY = { "Cooling": True, "Heating": True, "MMW": False }
+
+CACHE_VERSION = 1
+
+# physical constants in CGS
+KB          = 1.3806e-16
+MYR_TO_SEC  = 1.0e6*3.154e7
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class CoolingTable():
+   def __init__( self, filename, group="CoolingRates/Primordial", quantities=("Cooling", "Heating", "MMW"),
+                 cache_dir=None, rebuild=False ):
+      """
+      filename   : string. Grackle/Cloudy HDF5 table.
+      group      : string. Group of the quantities (e.g., "CoolingRates/Metals" for the metal cooling).
+      quantities : list of datasets in the group interpolated together.
+      cache_dir  : string. Directory of the cache (created if needed). None: no cache. The table is also kept in
+                   memory when the cache cannot be written.
+      rebuild    : bool. Rebuild the cache even if it is up to date.
+      """
+      self.filename   = filename
+      self.group      = group
+      self.quantities = list( quantities )
+      self.log        = np.array( [ LOG_QUANTITY.get(q, False) for q in self.quantities ] )
+
+      if cache_dir is None:
+         self.cache = None
+      else:
+         base       = "%s.%s"%( os.path.basename(filename), "_".join([group.replace("/", "_")] + self.quantities) )
+         self.cache = os.path.join( cache_dir, base )
+
+      meta = None if rebuild or self.cache is None else self._load_meta()
+      if meta is None:
+         axes, values = self._build()
+         meta = None if self.cache is None else self._save( axes, values )
+         if meta is None:
+            self._set_axes( axes )
+            self.values = values
+            return
+      self._set_axes( [ np.array(a) for a in meta["Axes"] ] )
+      self.values = np.load( self.cache+".npy", mmap_mode="r" )
+
+   def _source_id( self ):
+      st = os.stat( self.filename )
+      return { "Version": CACHE_VERSION, "Size": st.st_size, "MTime": st.st_mtime_ns, "Group": self.group,
+               "Quantities": self.quantities }
+
+   def _load_meta( self ):
+      try:
+         with open( self.cache+".json" ) as f:  meta = json.load( f )
+      except ( OSError, ValueError ):
+         return None
+      if meta.get( "Source" ) != self._source_id()  or  not os.path.isfile( self.cache+".npy" ):  return None
+      return meta
+
+   def _build( self ):
+      """
+      Read the table, sort and deduplicate the axes, and interleave the quantities.
+      """
+      with h5py.File( self.filename, "r" ) as f:
+         dset   = f[self.group][ self.quantities[0] ]
+         axes   = [ np.asarray(dset.attrs["Parameter1"], dtype=np.float64),
+                    np.asarray(dset.attrs["Parameter2"], dtype=np.float64),
+                    np.log10( np.asarray(dset.attrs["Temperature"], dtype=np.float64) ) ]
+         values = np.stack( [ f[self.group][q][()].astype(np.float64) for q in self.quantities ], axis=-1 )
+
+      for d in range( 3 ):
+         axes[d], idx = np.unique( axes[d], return_index=True )
+         values       = np.take( values, idx, axis=d )
+
+      values[..., self.log] = np.log10( np.maximum(values[..., self.log], np.finfo(np.float64).tiny) )
+      return axes, np.ascontiguousarray( values )
+
+   def _save( self, axes, values ):
+      meta = { "Source": self._source_id(), "Axes": [ a.tolist() for a in axes ] }
+      try:
+         os.makedirs( os.path.dirname(self.cache), exist_ok=True )
+         np.save( self.cache+".tmp.npy", values )
+         os.replace( self.cache+".tmp.npy", self.cache+".npy" )
+         with open( self.cache+".json", "w" ) as f:  json.dump( meta, f )
+      except OSError as e:
+         print( "WARNING : cannot write the cache %s (%s) !!"%( self.cache, e ), file=sys.stderr )
+         return None
+      return meta
+
+   def _set_axes( self, axes ):
+      for d, a in enumerate( axes ):
+         if len( a ) < 2:  raise ValueError( "axis %d of %s has fewer than 2 values !!"%(d, self.filename) )
+      self.axes    = axes
+      self.shape   = tuple( len(a) for a in axes )
+      self.uniform = [ np.allclose(np.diff(a), a[1]-a[0], rtol=1.0e-10, atol=0.0) for a in axes ]
+
+   def __repr__( self ):
+      return "CoolingTable(%s:%s, %s, log10(nH)=[%g, %g], z=[%g, %g], log10(T)=[%g, %g])"%( self.filename, self.group,
+             self.quantities, *[ v for a in self.axes for v in (a[0], a[-1]) ] )
+
+   def _index( self, d, x ):
+      # lower cell index and weight of the upper node along axis d
+      a = self.axes[d]
+      x = np.clip( x, a[0], a[-1] )
+      if self.uniform[d]:
+         i = np.minimum( ((x - a[0])/(a[1] - a[0])).astype(np.int64), len(a)-2 )
+      else:
+         i = np.clip( np.searchsorted(a, x, side="right") - 1, 0, len(a)-2 )
+      return i, ( x - a[i] )/( a[i+1] - a[i] )
+
+   def _lookup_chunk( self, log_nh, z, log_t ):
+      n1, n2 = self.shape[1], self.shape[2]
+      flat   = self.values.reshape( -1, len(self.quantities) )
+      (i0, w0), (i1, w1), (i2, w2) = self._index( 0, log_nh ), self._index( 1, z ), self._index( 2, log_t )
+      base   = ( i0*n1 + i1 )*n2 + i2
+      out    = np.zeros( (len(base), len(self.quantities)) )
+      for c0 in ( 0, 1 ):
+         for c1 in ( 0, 1 ):
+            for c2 in ( 0, 1 ):
+               w    = ( w0 if c0 else 1.0-w0 )*( w1 if c1 else 1.0-w1 )*( w2 if c2 else 1.0-w2 )
+               out += w[:, None]*np.take( flat, base + (c0*n1 + c1)*n2 + c2, axis=0 )
+      out[:, self.log] = 10.0**out[:, self.log]
+      return out
+
+   def lookup( self, nh, z, t, nthreads=None, chunk=65536 ):
+      """
+      Interpolate all quantities at the hydrogen number density nh (cm^-3), redshift z, and temperature t (K),
+      which are broadcast against each other.
+
+      nthreads : int. Number of threads (default: all cores).
+      chunk    : int. Number of points per thread task.
+
+      Return {quantity: array of the broadcast shape}.
+      """
+      nh, z, t = np.broadcast_arrays( np.asarray(nh, dtype=np.float64), np.asarray(z, dtype=np.float64),
+                                      np.asarray(t, dtype=np.float64) )
+      shape    = nh.shape
+      log_nh   = np.log10( nh ).ravel()
+      log_t    = np.log10( t  ).ravel()
+      z        = z.ravel()
+      n        = len( z )
+      out      = np.empty( (n, len(self.quantities)) )
+
+      def task( s ):
+         out[ s:s+chunk ] = self._lookup_chunk( log_nh[s:s+chunk], z[s:s+chunk], log_t[s:s+chunk] )
+
+      starts = range( 0, n, chunk )
+      if nthreads is None:  nthreads = os.cpu_count()
+      if nthreads <= 1  or  len(starts) <= 1:
+         for s in starts:  task( s )
+      else:
+         with ThreadPoolExecutor( max_workers=nthreads ) as pool:  list( pool.map(task, starts) )
+
+      return { q: out[:, v].reshape( shape ) for v, q in enumerate(self.quantities) }
+
+   def cooling_time( self, nh, z, t, x_h=0.716, nthreads=None ):
+      """
+      Cooling time (Myr) 1.5*n*kB*T/( |Heating - Cooling|*nH^2 ) with the total number density n = nH/( MMW*x_h )
+      (x_h = hydrogen mass fraction). Requires the quantities Cooling, Heating, and MMW.
+      """
+      nh, t = np.asarray( nh, dtype=np.float64 ), np.asarray( t, dtype=np.float64 )
+      r     = self.lookup( nh, z, t, nthreads=nthreads )
+      n_tot = nh/( r["MMW"]*x_h )
+      return 1.5*n_tot*KB*t/( np.abs(r["Heating"] - r["Cooling"])*nh**2 )/MYR_TO_SEC
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Build the cache of a Grackle/Cloudy cooling table and evaluate it' )
+
+   parser.add_argument( 'filename', type=str, help='Grackle/Cloudy HDF5 table (e.g., CloudyData_UVB=HM2012.h5)' )
+   parser.add_argument( '--group', action='store', required=False, type=str, dest='group',
+                        help='group of the quantities [%(default)s]', default='CoolingRates/Primordial' )
+   parser.add_argument( '--cache_dir', action='store', required=False, type=str, dest='cache_dir',
+                        help='directory of the cache [none]', default=None )
+   parser.add_argument( '--rebuild', action='store_true', required=False, dest='rebuild',
+                        help='rebuild the cache [%(default)s]', default=False )
+   parser.add_argument( '--nh', action='store', required=False, type=float, dest='nh', nargs='+',
+                        help='hydrogen number densities (cm^-3) to evaluate [none]', default=None )
+   parser.add_argument( '--z', action='store', required=False, type=float, dest='z',
+                        help='redshift [%(default)g]', default=0.0 )
+   parser.add_argument( '--temp', action='store', required=False, type=float, dest='temp', nargs='+',
+                        help='temperatures (K) to evaluate [%(default)s]', default=[1.0e4] )
+   parser.add_argument( '-t', action='store', required=False, type=int, dest='nthreads',
+                        help='number of threads [all]', default=None )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   table = CoolingTable( args.filename, group=args.group, cache_dir=args.cache_dir, rebuild=args.rebuild )
+   print( table )
+   if table.cache is not None:  print( 'Cache: %s.npy'%table.cache )
+
+   if args.nh is not None:
+      nh, temp = np.meshgrid( args.nh, args.temp, indexing='ij' )
+      r        = table.lookup( nh, args.z, temp, nthreads=args.nthreads )
+      has_tcool = all( q in table.quantities for q in ('Cooling', 'Heating', 'MMW') )
+      tcool    = table.cooling_time( nh, args.z, temp, nthreads=args.nthreads ) if has_tcool else None
+
+      print( '#%13s  %13s'%( 'nH[cm^-3]', 'T[K]' ) + ''.join( '  %13s'%q for q in table.quantities ) +
+             ( '  %13s'%'t_cool[Myr]' if has_tcool else '' ) )
+      for idx in np.ndindex( nh.shape ):
+         print( ' %13.6e  %13.6e'%( nh[idx], temp[idx] ) + ''.join( '  %13.6e'%r[q][idx] for q in table.quantities ) +
+                ( '  %13.6e'%tcool[idx] if has_tcool else '' ) )
@@ -0,0 +1,369 @@
+"""
+Particle-to-mesh deposition (NGP/CIC/TSC) onto uniform grids and AMR patches
+
+Grids are stored as [z][y][x] in the same order as the GAMER patch data. Cell (i,j,k) of a grid with the
+left edge le and cell size dh is centered at le + (i+0.5)*dh. Particles are deposited in chunks so that the
+temporary arrays are bounded by the chunk size.
+
+For snapshots, Particle/ParPos* and the weights are streamed from the file in chunks. The particles are split
+into contiguous ranges handled by worker processes, each of which accumulates into its own buffer; the buffers
+are summed at the end. Particles can be selected by ParType (e.g., PTYPE_DARK_MATTER=2, see include/Macro.h).
+
+Example:
+   rho = deposit_uniform( pos, 256, box_size, weight=mass, scheme="CIC" ) / dh**3
+   rho = deposit_snapshot( "Data_000010", 512, scheme="TSC", par_type=[2], nproc=16 )       # density
+   rho = deposit_amr( "Data_000010", scheme="CIC", nproc=16 )       # {lv: density [NPatch][PS][PS][PS]}
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from gamer_snapshot import load
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+SCHEME_ORDER = { "NGP": 1, "CIC": 2, "TSC": 3 }   # number of cells per dimension covered by each particle
+
+_level_index_cache = {}   # ( filename, lv ) -> ( sorted patch keys, patch indices within the level ) of one snapshot
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def stencil( x, scheme ):
+   """
+   Return the cell indices and weights along one dimension.
+
+   x      : particle positions in units of the cell size measured from the left edge
+   scheme : NGP/CIC/TSC
+
+   Return ( [index arrays], [weight arrays] ) with SCHEME_ORDER[scheme] entries each.
+   """
+   if scheme == "NGP":
+      return [ np.floor(x).astype(np.int64) ], [ np.ones_like(x) ]
+
+   elif scheme == "CIC":
+      xc = x - 0.5
+      i0 = np.floor( xc )
+      f  = xc - i0
+      i0 = i0.astype( np.int64 )
+      return [ i0, i0+1 ], [ 1.0-f, f ]
+
+   elif scheme == "TSC":
+      xc = x - 0.5
+      i1 = np.rint( xc )
+      d  = xc - i1
+      i1 = i1.astype( np.int64 )
+      return [ i1-1, i1, i1+1 ], [ 0.5*(0.5-d)**2, 0.75-d**2, 0.5*(0.5+d)**2 ]
+
+   else:
+      raise ValueError( "unsupported deposition scheme \"%s\" (NGP/CIC/TSC) !!"%scheme )
+
+
+def stencil_cells( pos, le, dh, scheme, wrap=None ):
+   """
+   Iterate over the stencil points of all particles.
+
+   pos  : particle positions [3][NPar]
+   le   : left edge of the grid
+   dh   : [3] cell size
+   wrap : optional [nx, ny, nz] for wrapping the indices periodically
+
+   Yield ( ix, iy, iz, w ) with the integer cell indices and the weights of one stencil point per particle.
+   """
+   idx = []
+   wgt = []
+   for d in range(3):
+      i, w = stencil( (np.asarray(pos[d], dtype=np.float64) - le[d])/dh[d], scheme )
+      if wrap is not None:  i = [ ii%wrap[d] for ii in i ]
+      idx.append( i )
+      wgt.append( w )
+
+   for iz, wz in zip( idx[2], wgt[2] ):
+      for iy, wy in zip( idx[1], wgt[1] ):
+         for ix, wx in zip( idx[0], wgt[0] ):
+            yield ix, iy, iz, wx*wy*wz
+
+
+def deposit_uniform( pos, n, box_size, weight=None, scheme="CIC", left_edge=(0.0, 0.0, 0.0), periodic=True,
+                     out=None, chunk=4194304 ):
+   """
+   Deposit particles onto a uniform grid.
+
+   pos       : particle positions with the shape [3][NPar] (or a list of three arrays)
+   n         : int or [nx, ny, nz]. Number of cells along each dimension.
+   box_size  : float or [Lx, Ly, Lz]. Size of the grid.
+   weight    : particle weights (e.g., mass) or None for the particle number
+   scheme    : NGP/CIC/TSC
+   left_edge : left edge of the grid
+   periodic  : wrap the contributions across the grid boundaries (otherwise they are discarded)
+   out       : optional float64 array [nz][ny][nx] to accumulate into
+   chunk     : number of particles processed at once
+
+   Return the deposited (summed) weights with the shape [nz][ny][nx].
+   """
+   n        = np.broadcast_to( np.asarray(n, dtype=np.int64), (3,) )
+   box_size = np.broadcast_to( np.asarray(box_size, dtype=np.float64), (3,) )
+   le       = np.asarray( left_edge, dtype=np.float64 )
+   dh       = box_size/n
+   ncell    = int( np.prod(n) )
+   if out is None:  out = np.zeros( n[::-1], dtype=np.float64 )
+   flat     = out.reshape( -1 )
+   npar     = len( pos[0] )
+
+   for s in range( 0, npar, chunk ):
+      e  = min( s+chunk, npar )
+      wp = None if weight is None else np.asarray( weight[s:e], dtype=np.float64 )
+      for ix, iy, iz, w in stencil_cells( [pos[d][s:e] for d in range(3)], le, dh, scheme, wrap=n if periodic else None ):
+         if wp is not None:  w = w*wp
+         cell = ( iz*n[1] + iy )*n[0] + ix
+         if not periodic:
+            inside = ( ix >= 0 ) & ( ix < n[0] ) & ( iy >= 0 ) & ( iy < n[1] ) & ( iz >= 0 ) & ( iz < n[2] )
+            cell, w = cell[inside], w[inside]
+         accumulate( flat, cell, w, ncell )
+
+   return out
+
+
+def accumulate( flat, cell, w, ncell ):
+   # scatter-add w into flat[cell], using bincount for dense updates and ufunc.at for sparse ones
+   if len( cell ) >= ncell//8:
+      flat += np.bincount( cell, weights=w, minlength=ncell )
+   else:
+      np.add.at( flat, cell, w )
+
+
+def window( n, scheme ):
+   """
+   Fourier-space window functions of the deposition scheme along one dimension for the rfftn layout.
+   Return ( W for the full axes of size n, W for the last (half) axis ).
+   """
+   p  = SCHEME_ORDER[scheme]
+   kf = np.fft.fftfreq( n )           # in units of 1/dh
+   kh = np.fft.rfftfreq( n )
+   return np.sinc( kf )**p, np.sinc( kh )**p
+
+
+def particle_chunks( h5file, p0, p1, atts, par_type=None, chunk=4194304 ):
+   """
+   Stream the particle attributes [p0, p1) of an opened snapshot in chunks, optionally keeping only the
+   particles with ParType in par_type. Yield {attribute: array}.
+   """
+   par = h5file["Particle"]
+   for s in range( p0, p1, chunk ):
+      e    = min( s+chunk, p1 )
+      data = { v: par[v][s:e] for v in atts }
+      if par_type is not None:
+         keep = np.isin( par["ParType"][s:e], par_type )
+         data = { v: a[keep] for v, a in data.items() }
+      yield data
+
+
+def split_particles( npar, nproc ):
+   # contiguous particle ranges, one per worker
+   edge = np.linspace( 0, npar, max(1, nproc)+1 ).astype( np.int64 )
+   return [ (int(edge[i]), int(edge[i+1])) for i in range(len(edge)-1) if edge[i+1] > edge[i] ]
+
+
+def sum_buffers( func, tasks, nproc=1 ):
+   """
+   Apply func to all tasks with nproc processes and sum the returned arrays (or dictionaries of arrays)
+   as they arrive, so that at most one buffer per worker is alive at a time.
+   """
+   def add( total, buf ):
+      if total is None:  return buf
+      if isinstance( total, dict ):
+         for k in total:  total[k] += buf[k]
+      else:
+         total += buf
+      return total
+
+   total = None
+   if nproc is None:  nproc = os.cpu_count()
+   if nproc <= 1  or  len(tasks) <= 1:
+      for t in tasks:  total = add( total, func(t) )
+   else:
+      with multiprocessing.get_context( "fork" ).Pool( processes=min(nproc, len(tasks)) ) as pool:
+         for buf in pool.imap_unordered( func, tasks ):  total = add( total, buf )
+   return total
+
+
+def _uniform_task( task ):
+   filename, p0, p1, n, box_size, le, weight, scheme, par_type, periodic, chunk = task
+   snap = load( filename )
+   out  = np.zeros( n[::-1], dtype=np.float64 )
+   atts = [ "ParPosX", "ParPosY", "ParPosZ" ] + ( [] if weight is None else [weight] )
+   with snap.open() as f:
+      for par in particle_chunks( f, p0, p1, atts, par_type, chunk ):
+         pos = [ par["ParPosX"], par["ParPosY"], par["ParPosZ"] ]
+         deposit_uniform( pos, n, box_size, weight=None if weight is None else par[weight], scheme=scheme,
+                          left_edge=le, periodic=periodic, out=out, chunk=chunk )
+   return out
+
+
+def deposit_snapshot( filename, n=None, weight="ParMass", scheme="CIC", par_type=None, left_edge=None,
+                      box_size=None, periodic=True, density=True, nproc=1, chunk=4194304 ):
+   """
+   Deposit the particles of a snapshot onto a uniform grid.
+
+   filename  : GAMER HDF5 snapshot
+   n         : int or [nx, ny, nz] (default: the base-level resolution)
+   weight    : particle attribute used as the weight or None for the particle number
+   par_type  : list of ParType to keep (default: all particles)
+   left_edge : left edge of the grid (default: the simulation domain)
+   box_size  : size of the grid (default: the simulation domain)
+   density   : divide by the cell volume
+   nproc     : number of worker processes, each with its own accumulation buffer
+
+   Return the grid [nz][ny][nx].
+   """
+   snap     = load( filename )
+   n        = snap.nx0 if n is None else np.broadcast_to( np.asarray(n, dtype=np.int64), (3,) )
+   box_size = snap.box_size if box_size is None else np.broadcast_to( np.asarray(box_size, dtype=np.float64), (3,) )
+   le       = np.zeros( 3 ) if left_edge is None else np.asarray( left_edge, dtype=np.float64 )
+   if nproc is None:  nproc = os.cpu_count()
+
+   tasks = [ (filename, p0, p1, n, box_size, le, weight, scheme, par_type, periodic, chunk)
+             for p0, p1 in split_particles(int(snap.par_offset[-1]), nproc) ]
+   out   = sum_buffers( _uniform_task, tasks, nproc )
+   if out is None:  out = np.zeros( n[::-1], dtype=np.float64 )
+   if density:  out /= np.prod( box_size/n )
+   return out
+
+
+def level_index( snap, lv ):
+   """
+   Return ( sorted keys, patch indices within level lv ) for locating the patch containing a given cell, where
+   key = ( pz*NPz + py )*NPx + px with the patch indices p = cell index//PS at level lv.
+   """
+   key = ( snap.filename, lv )
+   if key not in _level_index_cache:
+      ps    = snap.ps
+      ng    = snap.nx0*2**lv//ps
+      scale = int( snap.key_info["CellScale"][lv] )
+      p     = snap.corner[ snap.level_gids(lv) ].astype( np.int64 )//scale//ps
+      k     = ( p[:,2]*ng[1] + p[:,1] )*ng[0] + p[:,0]
+      order = np.argsort( k, kind="stable" )
+#     keep all levels of the current snapshot only
+      if any( fn != snap.filename for fn, _ in _level_index_cache ):  _level_index_cache.clear()
+      _level_index_cache[key] = ( k[order], order )
+   return _level_index_cache[key]
+
+
+def deposit_level( snap, lv, pos, weight, scheme, periodic, flat ):
+   """
+   Deposit particles onto the patches of level lv. flat is the float64 buffer [NPatch[lv]*PS^3] in the order of
+   [patch][z][y][x]. Contributions to cells not covered by any patch at this level are discarded.
+   """
+   ps         = snap.ps
+   ng         = snap.nx0*2**lv
+   dh         = np.full( 3, snap.cell_size[lv] )
+   keys, pidx = level_index( snap, lv )
+   if len( keys ) == 0:  return flat
+   npg        = ng//ps
+
+   for ix, iy, iz, w in stencil_cells( pos, np.zeros(3), dh, scheme, wrap=ng if periodic else None ):
+      if weight is not None:  w = w*weight
+      if not periodic:
+         inside = ( ix >= 0 ) & ( ix < ng[0] ) & ( iy >= 0 ) & ( iy < ng[1] ) & ( iz >= 0 ) & ( iz < ng[2] )
+         ix, iy, iz, w = ix[inside], iy[inside], iz[inside], w[inside]
+      k    = ( (iz//ps)*npg[1] + iy//ps )*npg[0] + ix//ps
+      j    = np.minimum( np.searchsorted(keys, k), len(keys)-1 )
+      hit  = keys[j] == k
+      cell = pidx[j]*ps**3 + ( (iz%ps)*ps + iy%ps )*ps + ix%ps
+      accumulate( flat, cell[hit], w[hit], flat.size )
+   return flat
+
+
+def _amr_task( task ):
+   filename, p0, p1, levels, weight, scheme, par_type, periodic, chunk = task
+   snap = load( filename )
+   out  = { lv: np.zeros( int(snap.npatch[lv])*snap.ps**3 ) for lv in levels }
+   atts = [ "ParPosX", "ParPosY", "ParPosZ" ] + ( [] if weight is None else [weight] )
+   with snap.open() as f:
+      for par in particle_chunks( f, p0, p1, atts, par_type, chunk ):
+         pos = [ par["ParPosX"], par["ParPosY"], par["ParPosZ"] ]
+         w   = None if weight is None else np.asarray( par[weight], dtype=np.float64 )
+         for lv in levels:  deposit_level( snap, lv, pos, w, scheme, periodic, out[lv] )
+   return out
+
+
+def deposit_amr( filename, levels=None, weight="ParMass", scheme="CIC", par_type=None, periodic=True, density=True,
+                 nproc=1, chunk=4194304 ):
+   """
+   Deposit the particles of a snapshot onto its AMR patches. Every particle is deposited on all requested levels
+   (similar to the ParDens field of GAMER), and contributions to cells not covered by patches are discarded.
+
+   Return {lv: array [NPatch[lv]][PS][PS][PS]} in the GID order of each level.
+   """
+   snap   = load( filename )
+   ps     = snap.ps
+   if levels is None:  levels = [ lv for lv in range(snap.nlevel) if snap.npatch[lv] > 0 ]
+   if nproc is None:   nproc  = os.cpu_count()
+
+   tasks  = [ (filename, p0, p1, levels, weight, scheme, par_type, periodic, chunk)
+              for p0, p1 in split_particles(int(snap.par_offset[-1]), nproc) ]
+   out    = sum_buffers( _amr_task, tasks, nproc )
+   if out is None:  out = { lv: np.zeros( int(snap.npatch[lv])*ps**3 ) for lv in levels }
+   for lv in levels:
+      out[lv] = out[lv].reshape( -1, ps, ps, ps )
+      if density:  out[lv] /= snap.cell_size[lv]**3
+   return out
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   from gamer_snapshot import snapshot_filenames
+
+   parser = argparse.ArgumentParser( description='Deposit the particles of GAMER snapshots onto uniform grids' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-n', action='store', required=False, type=int, dest='ngrid',
+                        help='grid size [base-level resolution]', default=None )
+   parser.add_argument( '-w', action='store', required=False, type=str, dest='weight',
+                        help='weight attribute or "none" for the number density [%(default)s]', default='ParMass' )
+   parser.add_argument( '--scheme', action='store', required=False, type=str, dest='scheme',
+                        help='deposition scheme: NGP/CIC/TSC [%(default)s]', default='CIC' )
+   parser.add_argument( '--type', action='store', required=False, type=int, dest='par_type', nargs='+',
+                        help='particle types to deposit [all]', default=None )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   weight = None if args.weight.lower() == 'none' else args.weight
+   for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+      rho = deposit_snapshot( filename, args.ngrid, weight=weight, scheme=args.scheme, par_type=args.par_type,
+                              nproc=args.nproc )
+      filename_out = 'ParDeposit_%s_%s.npy'%( 'Number' if weight is None else weight, os.path.basename(filename) )
+      np.save( filename_out, rho )
+      print( '%s -> %s (shape %s, sum*dv %13.7e)'%( filename, filename_out, rho.shape,
+                                                      rho.sum()*np.prod(load(filename).box_size/rho.shape[::-1]) ) )
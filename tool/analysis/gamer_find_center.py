@@ -0,0 +1,76 @@
+import argparse
+import sys
+
+from gamer_reduce import ArgMax, ArgMin, CenterOfMass, reduce_snapshot
+from gamer_snapshot import load, snapshot_filenames
+
+
+# load the command-line parameters
+parser = argparse.ArgumentParser( description='Output the center (single-pass counterpart of example/yt/find_center.py)' )
+
+parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                     help='first data index' )
+parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                     help='last data index' )
+parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                     help='delta data index [%(default)d]', default=1 )
+parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                     help='data path prefix [%(default)s]', default='../' )
+parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                     help='number of processes [%(default)d]', default=1 )
+
+args=parser.parse_args()
+
+# take note
+print( '\nCommand-line arguments:' )
+print( '-------------------------------------------------------------------' )
+print( ' '.join(map(str, sys.argv)) )
+print( '-------------------------------------------------------------------\n' )
+
+
+for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+   snap = load( filename )
+
+   print( '' )
+   print( '-------------------------------------------------------------------' )
+   print( 'Data name               = ', filename )
+   print( 'Time                    = % 14.7e'%( snap.time ) )
+   print( '-------------------------------------------------------------------' )
+   print( '' )
+
+#  collect all reducers so that the snapshot is scanned only once
+   has_gas  = snap.model in ( 'HYDRO', 'ELBDM' )
+   has_par  = snap.particle
+   has_pote = 'Pote' in snap.fields
+   totdens  = 'TotalDens' if 'TotalDens' in snap.fields else 'TotDens'
+
+   reducers = {}
+   if has_gas:                                  reducers['Density']     = ArgMax( 'Dens' )
+   if has_par  and  'ParDens' in snap.fields:   reducers['Par_Density'] = ArgMax( 'ParDens' )
+   if has_par  and  ( totdens == 'TotalDens'  or  'ParDens' in snap.fields ):
+                                                reducers['Tot_Density'] = ArgMax( totdens )
+   if has_pote:                                 reducers['Potential']   = ArgMin( 'Pote' )
+   if has_gas:                                  reducers['CoM_Gas']     = CenterOfMass( use_gas=True,  use_particles=False )
+   if has_par:                                  reducers['CoM_Par']     = CenterOfMass( use_gas=False, use_particles=True  )
+   if has_par:                                  reducers['CoM_All']     = CenterOfMass( use_gas=has_gas, use_particles=True )
+
+   result = dict( zip(reducers, reduce_snapshot(filename, list(reducers.values()), nproc=args.nproc)) )
+
+   for key, label in [ ('Density', 'Max Density'), ('Par_Density', 'Max Par_Density'), ('Tot_Density', 'Max Tot_Density'),
+                       ('Potential', 'Min Potential') ]:
+      if key not in result:  continue
+      value, x, y, z = result[key]
+      print( '%-23s = % 14.7e'%( label+' Value',   value ) )
+      print( '%-23s = % 14.7e'%( label+' Coord_x', x     ) )
+      print( '%-23s = % 14.7e'%( label+' Coord_y', y     ) )
+      print( '%-23s = % 14.7e'%( label+' Coord_z', z     ) )
+      print( '' )
+
+   if not has_pote:
+      print( 'WARNING : To find the minimum gravitational potential, please turn on OPT__OUTPUT_POT in Input__Parameter !!\n' )
+
+   for key in [ 'CoM_Gas', 'CoM_Par', 'CoM_All' ]:
+      if key not in result  or  result[key] is None:  continue
+      for d in range(3):
+         print( '%-23s = % 14.7e'%( key+' Coord_'+'xyz'[d], result[key][d] ) )
+      print( '' )
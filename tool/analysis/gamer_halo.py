@@ -0,0 +1,311 @@
+"""
+Friends-of-friends (FoF) and spherical-overdensity (SO) halo finder for GAMER HDF5 snapshots
+
+FoF groups are found with the linking length b times the mean interparticle separation using periodic KD-trees
+(scipy.spatial.cKDTree). The box is split into slabs along x, each extended by one linking length on both sides
+and handled by a worker process; every worker links its particles locally and returns, for each particle, the
+smallest global particle index of its local group. Groups spanning several slabs share the particles in the
+overlapping regions, so a final connected-components pass over these (particle, representative) edges merges
+them into the global groups.
+
+The SO radius of each group is the largest radius around its center (shrinking-sphere center of the members)
+within which the mean density of all particles exceeds zeta*rho_bg, with zeta from Bryan & Norman (1998) as in
+LSS_Hybrid_Zoomin/plot_script/Profile_Functions.py:
+   zeta = ( 18*pi^2 + 82*(Omega_M-1) - 39*(Omega_M-1)^2 )/Omega_M
+For comoving runs the background density rho_bg is one in code units.
+
+The catalog is written to Halo_Data_XXXXXX.h5 with one entry per halo sorted by the FoF mass:
+   NPar, MassFoF, Center[3], Velocity[3], RVir, MVir, NParVir   (code units, comoving for comoving runs)
+   MemberOffset[NHalo+1], MemberPUID   (sorted PUIDs of the FoF members of each halo)
+and summarized in the text table Halo_Data_XXXXXX.txt.
+
+Example:
+   python gamer_halo.py -s 0 -e 10 -b 0.2 -m 32 -p 16
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import h5py
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from gamer_snapshot import load, parallel_map, snapshot_filenames
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+# particle data shared with the forked worker processes
+_pos    = None
+_mass   = None
+_box    = None
+_tree   = None
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def overdensity_zeta( omega_m0, redshift ):
+   """
+   Virial overdensity relative to the background matter density (Bryan & Norman 1998).
+   """
+   a3      = ( 1.0 + redshift )**3
+   omega_m = omega_m0*a3/( omega_m0*a3 + 1.0 - omega_m0 )
+   return ( 18.0*np.pi**2 + 82.0*(omega_m-1.0) - 39.0*(omega_m-1.0)**2 )/omega_m
+
+
+def periodic_delta( dx, box ):
+   return dx - box*np.rint( dx/box )
+
+
+def _fof_domain( task ):
+   x0, x1, ll = task
+   L   = _box[0]
+   dx  = np.mod( _pos[:,0] - x0, L )
+   sel = np.nonzero( (dx < x1-x0+ll) | (dx >= L-ll) )[0]
+   if len( sel ) == 0:  return sel, sel
+
+   tree  = cKDTree( _pos[sel], boxsize=_box )
+   pairs = tree.query_pairs( ll, output_type="ndarray" )
+   graph = coo_matrix( (np.ones(len(pairs), dtype=np.int8), (pairs[:,0], pairs[:,1])), shape=(len(sel), len(sel)) )
+   ngrp, label = connected_components( graph, directed=False )
+
+#  representative = smallest global index in each local group (sel is sorted)
+   rep = np.full( ngrp, len(_pos), dtype=np.int64 )
+   np.minimum.at( rep, label, sel )
+   keep = rep[label] != sel
+   return sel[keep], rep[label][keep]
+
+
+def friends_of_friends( pos, box_size, linking_length, ndomain=1, nproc=1 ):
+   """
+   Periodic friends-of-friends groups.
+
+   pos            : float array [N][3] in [0, box_size)
+   linking_length : absolute linking length
+   ndomain        : number of slabs along x (each must be wider than the linking length)
+
+   Return the group label of each particle (labels are the smallest particle index of each group).
+   """
+   global _pos, _box
+   _pos, _box = pos, np.asarray( box_size, dtype=np.float64 )
+   npar    = len( pos )
+   ndomain = max( 1, min(ndomain, int(_box[0]/(2.0*linking_length))) )
+   edge    = np.linspace( 0.0, _box[0], ndomain+1 )
+   tasks   = [ (edge[i], edge[i+1], linking_length) for i in range(ndomain) ]
+
+   src, dst = [], []
+   for s, d in parallel_map( _fof_domain, tasks, nproc, ordered=False ):
+      src.append( s )
+      dst.append( d )
+   src = np.concatenate( src ) if src else np.zeros( 0, dtype=np.int64 )
+   dst = np.concatenate( dst ) if dst else np.zeros( 0, dtype=np.int64 )
+   _pos = None
+
+   graph = coo_matrix( (np.ones(len(src), dtype=np.int8), (src, dst)), shape=(npar, npar) )
+   ngrp, label = connected_components( graph, directed=False )
+   rep = np.full( ngrp, npar, dtype=np.int64 )
+   np.minimum.at( rep, label, np.arange(npar) )
+   return rep[label]
+
+
+def shrinking_sphere( pos, mass, box, shrink=0.8, min_npar=20 ):
+   """
+   Shrinking-sphere center of a set of particles with periodic boundaries.
+   """
+   ref    = pos[0]
+   d      = periodic_delta( pos - ref, box )
+   center = np.average( d, axis=0, weights=mass )
+   radius = np.sqrt( ((d-center)**2).sum(axis=1) ).max()
+   while True:
+      r2     = ( (d-center)**2 ).sum( axis=1 )
+      inside = r2 <= radius**2
+      if inside.sum() < min_npar:  break
+      center = np.average( d[inside], axis=0, weights=mass[inside] )
+      radius *= shrink
+   return np.mod( ref + center, box )
+
+
+def spherical_overdensity( center, mass_guess, rho_threshold, max_iter=8 ):
+   """
+   Largest radius within which the mean enclosed density of all particles exceeds rho_threshold.
+   Return ( radius, mass, number of particles ).
+   """
+   rmax = 2.0*( 3.0*mass_guess/(4.0*np.pi*rho_threshold) )**(1.0/3.0)
+   for _ in range( max_iter ):
+      idx   = np.asarray( _tree.query_ball_point(center, rmax), dtype=np.int64 )
+      r     = np.sqrt( (periodic_delta(_pos[idx]-center, _box)**2).sum(axis=1) )
+      order = np.argsort( r )
+      r     = r[order]
+      menc  = np.cumsum( _mass[idx][order] )
+      dens  = menc/( 4.0/3.0*np.pi*np.maximum(r, 1.0e-30)**3 )
+      above = np.nonzero( dens >= rho_threshold )[0]
+      if len( above ) == 0:  return 0.0, 0.0, 0
+      i = above[-1]
+      if i < len( r )-1  or  menc[-1]/( 4.0/3.0*np.pi*rmax**3 ) < rho_threshold:
+         return r[i], menc[i], i+1
+      rmax *= 2.0
+   return r[i], menc[i], i+1
+
+
+def _so_task( task ):
+   members, rho_threshold = task
+   out = []
+   for m in members:
+      c = shrinking_sphere( _pos[m], _mass[m], _box )
+      out.append( (c,) + spherical_overdensity(c, _mass[m].sum(), rho_threshold) )
+   return out
+
+
+def find_halos( filename, b=0.2, min_npar=32, par_type=None, rho_bg=None, delta=None, ndomain=None, nproc=1 ):
+   """
+   FoF + SO halo catalog of one snapshot.
+
+   b        : linking length in units of the mean interparticle separation
+   min_npar : minimum number of FoF members
+   par_type : list of ParType to use (default: all non-tracer particles)
+   rho_bg   : background density (default: 1 for comoving runs)
+   delta    : SO overdensity relative to rho_bg (default: zeta of Bryan & Norman 1998)
+
+   Return a dictionary with the catalog (see the module docstring).
+   """
+   global _pos, _mass, _box, _tree
+   snap = load( filename )
+   if nproc is None:    nproc   = os.cpu_count()
+   if ndomain is None:  ndomain = 4*nproc
+   if rho_bg is None:
+      if not snap.comoving:  raise ValueError( "rho_bg must be given for non-comoving runs !!" )
+      rho_bg = 1.0
+   if delta is None:
+      if not snap.comoving:  raise ValueError( "delta must be given for non-comoving runs !!" )
+      delta = overdensity_zeta( float(snap.input_para["OmegaM0"]), snap.redshift )
+
+   with snap.open() as f:
+      par  = f["Particle"]
+      ptyp = par["ParType"][:]
+      sel  = np.nonzero( ptyp != 0 )[0] if par_type is None else np.nonzero( np.isin(ptyp, par_type) )[0]
+      pos  = np.stack( [ par[v][:][sel] for v in ("ParPosX", "ParPosY", "ParPosZ") ], axis=1 ).astype( np.float64 )
+      mass = par["ParMass"][:][sel].astype( np.float64 )
+      vel  = np.stack( [ par[v][:][sel] for v in ("ParVelX", "ParVelY", "ParVelZ") ], axis=1 )
+      puid = par["ParPUID"][:][sel]
+
+   box  = snap.box_size
+   pos  = np.mod( pos, box )
+   ll   = b*( np.prod(box)/len(pos) )**(1.0/3.0)
+
+#  FoF groups sorted by mass
+   label = friends_of_friends( pos, box, ll, ndomain, nproc )
+   order = np.argsort( label, kind="stable" )
+   start = np.nonzero( np.diff(label[order], prepend=-1) )[0]
+   count = np.diff( np.append(start, len(order)) )
+   big   = np.nonzero( count >= min_npar )[0]
+   groups = [ order[start[g]:start[g]+count[g]] for g in big ]
+   mfof  = np.array( [ mass[m].sum() for m in groups ] )
+   rank  = np.argsort( -mfof, kind="stable" )
+   groups, mfof = [ groups[i] for i in rank ], mfof[rank]
+
+#  SO masses
+   _pos, _mass, _box = pos, mass, box
+   _tree  = cKDTree( pos, boxsize=box )
+   tasks  = [ (groups[i::max(1, nproc)], delta*rho_bg) for i in range(max(1, nproc)) ]
+   res    = parallel_map( _so_task, tasks, nproc, ordered=True )
+   so     = [ None ]*len( groups )
+   for i, r in enumerate( res ):  so[i::max(1, nproc)] = r
+   _pos = _mass = _tree = None
+
+   member_puid = [ np.sort(puid[m]) for m in groups ]
+   return { "NPar"        : np.array( [len(m) for m in groups], dtype=np.int64 ),
+            "MassFoF"     : mfof,
+            "Center"      : np.array( [s[0] for s in so] ).reshape( -1, 3 ),
+            "Velocity"    : np.array( [np.average(vel[m], axis=0, weights=mass[m]) for m in groups] ).reshape( -1, 3 ),
+            "RVir"        : np.array( [s[1] for s in so] ),
+            "MVir"        : np.array( [s[2] for s in so] ),
+            "NParVir"     : np.array( [s[3] for s in so], dtype=np.int64 ),
+            "MemberOffset": np.concatenate( ([0], np.cumsum([len(m) for m in groups], dtype=np.int64)) ),
+            "MemberPUID"  : np.concatenate( member_puid ) if member_puid else np.zeros( 0, dtype=puid.dtype ),
+            "attrs"       : { "Time": snap.time, "DumpID": int(snap.key_info["DumpID"]), "LinkingLength": ll,
+                              "Delta": delta, "RhoBg": rho_bg, "MinNPar": min_npar } }
+
+
+def write_catalog( cat, prefix ):
+   """
+   Write a catalog returned by find_halos() to <prefix>.h5 and <prefix>.txt.
+   """
+   with h5py.File( prefix+".h5", "w" ) as f:
+      for k, v in cat["attrs"].items():  f.attrs[k] = v
+      for k, v in cat.items():
+         if k != "attrs":  f.create_dataset( k, data=v )
+
+   with open( prefix+".txt", "w" ) as f:
+      f.write( "# Time = %20.14e, LinkingLength = %13.7e, Delta = %13.7e, RhoBg = %13.7e\n"%(
+               cat["attrs"]["Time"], cat["attrs"]["LinkingLength"], cat["attrs"]["Delta"], cat["attrs"]["RhoBg"]) )
+      f.write( "#%7s %10s %14s %14s %14s %14s %14s %14s %14s %14s %14s %10s\n"%(
+               "ID", "NPar", "MassFoF", "x", "y", "z", "vx", "vy", "vz", "RVir", "MVir", "NParVir") )
+      for i in range( len(cat["NPar"]) ):
+         f.write( " %7d %10d %14.7e %14.7e %14.7e %14.7e %14.7e %14.7e %14.7e %14.7e %14.7e %10d\n"%(
+                  (i, cat["NPar"][i], cat["MassFoF"][i]) + tuple(cat["Center"][i]) + tuple(cat["Velocity"][i]) +
+                  (cat["RVir"][i], cat["MVir"][i], cat["NParVir"][i])) )
+
+
+def read_catalog( filename ):
+   """
+   Read a catalog written by write_catalog() (the .h5 file). Return a dictionary of arrays and "attrs".
+   """
+   with h5py.File( filename, "r" ) as f:
+      cat = { k: f[k][()] for k in f.keys() }
+      cat["attrs"] = dict( f.attrs )
+   return cat
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Find FoF/SO halos in GAMER snapshots' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-b', action='store', required=False, type=float, dest='b',
+                        help='linking length in units of the mean interparticle separation [%(default)g]', default=0.2 )
+   parser.add_argument( '-m', action='store', required=False, type=int, dest='min_npar',
+                        help='minimum number of particles per halo [%(default)d]', default=32 )
+   parser.add_argument( '--type', action='store', required=False, type=int, dest='par_type', nargs='+',
+                        help='particle types to use [all except tracers]', default=None )
+   parser.add_argument( '--rho_bg', action='store', required=False, type=float, dest='rho_bg',
+                        help='background density [1 for comoving runs]', default=None )
+   parser.add_argument( '--delta', action='store', required=False, type=float, dest='delta',
+                        help='SO overdensity relative to the background density [Bryan & Norman 1998]', default=None )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+      cat = find_halos( filename, b=args.b, min_npar=args.min_npar, par_type=args.par_type, rho_bg=args.rho_bg,
+                        delta=args.delta, nproc=args.nproc )
+      out = 'Halo_%s'%os.path.basename( filename )
+      write_catalog( cat, out )
+      print( '%s -> %s.h5/.txt (%d halos)'%( filename, out, len(cat["NPar"]) ) )
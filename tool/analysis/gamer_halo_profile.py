@@ -0,0 +1,304 @@
+"""
+Radial profiles of many halos from a single pass over a GAMER HDF5 snapshot
+
+All halos of a catalog (centers and maximum radii) are profiled together: the leaf patches overlapping with any
+halo sphere are found with one KD-tree query per level, each patch is read only once, and its cells and particles
+are accumulated into the radial bins of every halo overlapping with it. Blocks of patches are distributed to
+worker processes, each of which holds the partial sums of all halos.
+
+For every halo the following profiles are computed on nbin logarithmic bins between rmin and its rmax
+(cells and particles within rmin are put into the first bin):
+   density            gas: sum(cell mass)/sum(cell volume); particles: sum(ParMass)/shell volume
+   enclosed mass      cumulative cell + particle mass within the outer edge of each bin
+   circular velocity  sqrt( G*M(<r)/r )
+   velocity dispersion  mass-weighted sqrt( (sigma_x^2 + sigma_y^2 + sigma_z^2)/3 ) of the peculiar velocities
+                        in each bin (HYDRO cells and particles; ELBDM wave velocities are not included)
+
+The outputs use the file layout of LSS_Hybrid_Zoomin/plot_script/Profile_Functions.py:
+   prof_dens/Data_XXXXXX_<id>_profile_data
+   prof_mass/Data_XXXXXX_<id>_mass_accumulate
+   prof_circular_vel/Data_XXXXXX_<id>_circular_velocity
+   prof_veldisp/Data_XXXXXX_<id>_veldisp_haloRestFrame
+in ckpc, Msun, and km/s when the unit information is available (comoving units for comoving runs), and in code
+units otherwise. The values differ from those of Profile_Functions.compute_profile(), which uses yt profiles of
+the cells only:
+   prof_dens          sum(cell mass)/sum(cell volume) plus the particle density, instead of the mass-weighted
+                      mean cell density without particles
+   prof_mass          radius is the outer edge of each bin instead of its center, and the particle mass is
+                      included in the enclosed mass
+   prof_circular_vel  sqrt( G*M(<r_out)/r_out ) with the enclosed mass above, instead of the cell mass within
+                      the outer edge divided by the bin center
+   prof_veldisp       not written by Profile_Functions
+The bins (rmin, rmax, and nbin) also differ from the fixed ones of Profile_Functions. Each file starts with a
+comment line stating its convention.
+
+Halos are read from a catalog of gamer_halo.py (Halo_Data_XXXXXX.h5, rmax = -f * RVir) or a text file with the
+columns "x y z rmax".
+
+Example:
+   python gamer_halo_profile.py -s 10 -e 10 -n 100 -p 16
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from gamer_deposit import sum_buffers
+from gamer_reduce import PAR_POS, Block
+from gamer_snapshot import load, snapshot_filenames
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+CONST_KPC    = 3.08567758149e21      # cm
+CONST_MSUN   = 1.98892e33            # g
+CONST_NEWTON = 4.30091727e-6         # G in kpc*(km/s)^2/Msun
+
+# partial sums per halo and bin
+QUANTITIES   = [ "GasMass", "GasVolume", "ParMass", "VelMass", "MomX", "MomY", "MomZ", "MomV2" ]
+_IDX         = { q: i for i, q in enumerate(QUANTITIES) }
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def halo_patches( snap, center, rmax ):
+   """
+   Overlapping ( leaf GID, halo index ) pairs sorted by GID, using one periodic KD-tree per level.
+   """
+   gid_all, halo_all = [], []
+   for lv in range( snap.nlevel ):
+      gids = snap.leaf_gids( levels=[lv] )
+      if len( gids ) == 0:  continue
+      half = 0.5*snap.patch_size[lv]
+      tree = cKDTree( np.mod(snap.edge_left[gids] + half, snap.box_size), boxsize=snap.box_size )
+      hits = tree.query_ball_point( np.mod(center, snap.box_size), rmax + np.sqrt(3.0)*half )
+      for h, idx in enumerate( hits ):
+         gid_all.append( gids[idx] )
+         halo_all.append( np.full(len(idx), h, dtype=np.int64) )
+   if not gid_all:  return np.zeros( 0, dtype=np.int64 ), np.zeros( 0, dtype=np.int64 )
+   gid  = np.concatenate( gid_all )
+   halo = np.concatenate( halo_all )
+   order = np.lexsort( (halo, gid) )
+   return gid[order], halo[order]
+
+
+def velocity_fields( snap ):
+   # fields giving the cell velocity as momentum/density (HYDRO only)
+   if all( v in snap.fields for v in ("MomX", "MomY", "MomZ") ):  return [ "MomX", "MomY", "MomZ" ]
+   return None
+
+
+def _profile_task( task ):
+   filename, blocks, center, rmax, rmin, nbin = task
+   snap  = load( filename )
+   box   = snap.box_size
+   nhalo = len( center )
+   acc   = np.zeros( (len(QUANTITIES), nhalo, nbin) )
+   vfld  = velocity_fields( snap )
+   lgr   = np.log( rmax/rmin )
+
+   def add( h, dist, mass, q_mass, volume=None, vel=None ):
+      b = np.clip( (np.log(np.maximum(dist, rmin)/rmin)/lgr[h]*nbin).astype(np.int64), 0, nbin )
+      k = b < nbin
+      b, mass = b[k], mass[k]
+      acc[ _IDX[q_mass], h ] += np.bincount( b, weights=mass, minlength=nbin )
+      if volume is not None:  acc[ _IDX["GasVolume"], h ] += np.bincount( b, minlength=nbin )*volume
+      if vel is not None:
+         v = [ c[k] for c in vel ]
+         acc[ _IDX["VelMass"], h ] += np.bincount( b, weights=mass, minlength=nbin )
+         for d, q in enumerate( ("MomX", "MomY", "MomZ") ):
+            acc[ _IDX[q], h ] += np.bincount( b, weights=mass*v[d], minlength=nbin )
+         acc[ _IDX["MomV2"], h ] += np.bincount( b, weights=mass*(v[0]**2 + v[1]**2 + v[2]**2), minlength=nbin )
+
+   with snap.open() as f:
+      for g0, g1, halos in blocks:
+         block = Block( snap, f, g0, g1 )
+         if "Dens" in snap.fields:
+            xyz  = [ c.ravel() for c in block.coords() ]
+            dens = block.grid( "Dens" ).ravel()
+            mass = dens*block.dv
+            vel  = None if vfld is None else [ block.grid(v).ravel()/dens for v in vfld ]
+         if block.npar > 0:
+            ppos  = [ block.par(v) for v in PAR_POS ]
+            pmass = block.par( "ParMass" )
+            pvel  = [ block.par(v) for v in ("ParVelX", "ParVelY", "ParVelZ") ] if "ParVelX" in snap.par_atts else None
+
+         for h in halos:
+            if "Dens" in snap.fields:
+               d2 = 0.0
+               for i in range(3):
+                  dx  = xyz[i] - center[h, i]
+                  d2 += ( dx - box[i]*np.rint(dx/box[i]) )**2
+               add( h, np.sqrt(d2), mass, "GasMass", volume=block.dv, vel=vel )
+            if block.npar > 0:
+               d2 = 0.0
+               for i in range(3):
+                  dx  = ppos[i] - center[h, i]
+                  d2 += ( dx - box[i]*np.rint(dx/box[i]) )**2
+               add( h, np.sqrt(d2), pmass, "ParMass", vel=pvel )
+   return acc
+
+
+def halo_profiles( filename, center, rmax, rmin=None, nbin=64, nproc=1 ):
+   """
+   Profiles of all halos in one pass.
+
+   center : [NHalo][3] halo centers
+   rmax   : [NHalo] outer radii
+   rmin   : inner radius of the first bin (default: the finest cell size)
+   nbin   : number of logarithmic bins
+
+   Return a dictionary of arrays [NHalo][nbin] in code units: "r" (bin centers), "r_out" (outer edges),
+   "Dens", "MassEnc", and "VelDisp" (NaN in bins without velocity data).
+   """
+   snap   = load( filename )
+   center = np.atleast_2d( np.asarray(center, dtype=np.float64) )
+   rmax   = np.broadcast_to( np.asarray(rmax, dtype=np.float64), (len(center),) ).copy()
+   if rmin is None:   rmin  = snap.cell_size[ snap.max_level ]
+   if nproc is None:  nproc = os.cpu_count()
+
+#  blocks of consecutive patches with the halos overlapping with them
+   gid, halo = halo_patches( snap, center, rmax )
+   blocks    = []
+   for g0, g1 in snap.blocks( np.unique(gid), max_size=256 ):
+      s, e = np.searchsorted( gid, [g0, g1] )
+      blocks.append( (g0, g1, np.unique(halo[s:e])) )
+   ntask = max( 1, min(len(blocks), 4*nproc) )
+   tasks = [ (filename, blocks[t::ntask], center, rmax, rmin, nbin) for t in range(ntask) ]
+   acc   = sum_buffers( _profile_task, tasks, nproc )
+   if acc is None:  acc = np.zeros( (len(QUANTITIES), len(center), nbin) )
+   q     = { name: acc[i] for i, name in enumerate(QUANTITIES) }
+
+   edge  = rmin*( rmax[:,None]/rmin )**( np.arange(nbin+1)/nbin )
+   shell = 4.0/3.0*np.pi*( edge[:,1:]**3 - np.where(np.arange(nbin) == 0, 0.0, edge[:,:-1]**3) )
+   with np.errstate( divide="ignore", invalid="ignore" ):
+      dens  = np.where( q["GasVolume"] > 0.0, q["GasMass"]/q["GasVolume"], 0.0 ) + q["ParMass"]/shell
+      mean2 = sum( (q[m]/q["VelMass"])**2 for m in ("MomX", "MomY", "MomZ") )
+      sigma = np.sqrt( np.maximum(q["MomV2"]/q["VelMass"] - mean2, 0.0)/3.0 )
+
+   return { "r": np.sqrt( edge[:,1:]*edge[:,:-1] ), "r_out": edge[:,1:], "Dens": dens,
+            "MassEnc": np.cumsum( q["GasMass"] + q["ParMass"], axis=1 ), "VelDisp": sigma }
+
+
+def unit_conversion( snap ):
+   """
+   Factors converting code units into ( ckpc, Msun/ckpc^3, Msun, km/s, G ), or code units if unavailable.
+   For comoving runs the velocities are converted into the peculiar velocities a*dx/dt.
+   """
+   para = snap.input_para
+   if "Unit_L" not in para:
+      G = float( para.get("NewtonG", 1.0) )
+      return { "L": 1.0, "D": 1.0, "M": 1.0, "V": 1.0, "G": G, "units": ("code", "code", "code", "code") }
+   a = snap.time if snap.comoving else 1.0
+   return { "L": para["Unit_L"]/CONST_KPC, "D": para["Unit_D"]*CONST_KPC**3/CONST_MSUN, "M": para["Unit_M"]/CONST_MSUN,
+            "V": para["Unit_V"]/1.0e5/a, "G": CONST_NEWTON,
+            "units": ("ckpc" if snap.comoving else "kpc", "Msun/ckpc**3" if snap.comoving else "Msun/kpc**3", "Msun", "km/s") }
+
+
+def write_profiles( prof, snap, halo_ids, path ):
+   """
+   Write the profiles in the file format of Profile_Functions.compute_profile() (see the module docstring for the
+   differences of the values).
+   """
+   u     = unit_conversion( snap )
+   name  = os.path.basename( snap.filename )
+   ul, ud, um, uv = u["units"]
+   for sub in ( "prof_dens", "prof_mass", "prof_circular_vel", "prof_veldisp" ):
+      os.makedirs( os.path.join(path, sub), exist_ok=True )
+
+   def dump( filename, note, labels, x, y ):
+      with open( filename, "w" ) as f:
+         f.write( "# gamer_halo_profile.py: %s\n"%note )
+         writer = csv.writer( f, delimiter="\t" )
+         writer.writerow( [ f"{labels[0]:<15}", f"{labels[1]:<15}" ] )
+         for xx, yy in zip( x, y ):  writer.writerow( [ f"{xx:<15.8f}", f"{yy:<15.8f}" ] )
+
+   for h, hid in enumerate( halo_ids ):
+      keep = prof["Dens"][h] != 0.0
+      r    = prof["r"][h][keep]*u["L"]
+      rout = prof["r_out"][h][keep]*u["L"]
+      dens = prof["Dens"][h][keep]*u["D"]
+      menc = prof["MassEnc"][h][keep]*u["M"]
+      vcir = np.sqrt( u["G"]*menc/rout )
+      sig  = prof["VelDisp"][h]*u["V"]
+      dump( "%s/prof_dens/%s_%d_profile_data"%(path, name, hid),
+            "bin center, cell mass/cell volume + particle mass/shell volume (not mass-weighted, includes particles)",
+            ["#radius (%s)"%ul, "density (%s)"%ud], r, dens )
+      dump( "%s/prof_mass/%s_%d_mass_accumulate"%(path, name, hid),
+            "outer bin edge, cell + particle mass within it (not the bin center, includes particles)",
+            ["#radius (%s)"%ul, "mass (%s)"%um], rout, menc )
+      dump( "%s/prof_circular_vel/%s_%d_circular_velocity"%(path, name, hid),
+            "outer bin edge, sqrt(G*M/r) with the cell + particle mass within it (not the bin center, includes particles)",
+            ["#radius (%s)"%ul, "Vcir (%s)"%uv], rout, vcir )
+      ok = np.isfinite( sig )
+      dump( "%s/prof_veldisp/%s_%d_veldisp_haloRestFrame"%(path, name, hid),
+            "bin center, mass-weighted 1D velocity dispersion of the cells and particles (not in Profile_Functions)",
+            ["#radius (%s)"%ul, "VelDisp (%s)"%uv], prof["r"][h][ok]*u["L"], sig[ok] )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Compute the radial profiles of all halos in a catalog' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-c', action='store', required=False, type=str, dest='catalog',
+                        help='halo catalog: a text file with "x y z rmax" [Halo_Data_XXXXXX.h5 of gamer_halo.py]', default=None )
+   parser.add_argument( '-f', action='store', required=False, type=float, dest='rfactor',
+                        help='rmax in units of RVir for gamer_halo.py catalogs [%(default)g]', default=2.0 )
+   parser.add_argument( '-n', action='store', required=False, type=int, dest='nhalo',
+                        help='number of halos (the most massive ones) [all]', default=None )
+   parser.add_argument( '-b', action='store', required=False, type=int, dest='nbin',
+                        help='number of radial bins [%(default)d]', default=64 )
+   parser.add_argument( '--rmin', action='store', required=False, type=float, dest='rmin',
+                        help='inner radius in code units [finest cell size]', default=None )
+   parser.add_argument( '-o', action='store', required=False, type=str, dest='path',
+                        help='output path [%(default)s]', default='.' )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+      if args.catalog is not None  and  not args.catalog.endswith( '.h5' ):
+         table  = np.atleast_2d( np.loadtxt(args.catalog) )
+         center = table[:, 0:3]
+         rmax   = table[:, 3]
+      else:
+         from gamer_halo import read_catalog
+         cat    = read_catalog( args.catalog or 'Halo_%s.h5'%os.path.basename(filename) )
+         center = cat['Center']
+         rmax   = args.rfactor*np.where( cat['RVir'] > 0.0, cat['RVir'], (3.0*cat['MassFoF']/(4.0*np.pi*
+                                        cat['attrs']['Delta']*cat['attrs']['RhoBg']))**(1.0/3.0) )
+      if args.nhalo is not None:  center, rmax = center[:args.nhalo], rmax[:args.nhalo]
+
+      prof = halo_profiles( filename, center, rmax, rmin=args.rmin, nbin=args.nbin, nproc=args.nproc )
+      write_profiles( prof, load(filename), range(len(center)), args.path )
+      print( '%s : profiles of %d halos written to %s'%( filename, len(center), args.path ) )
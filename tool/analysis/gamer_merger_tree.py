@@ -0,0 +1,174 @@
+"""
+Halo merger trees from the PUIDs of the halo members
+
+The halo catalogs (Halo_Data_XXXXXX.h5 written by gamer_halo.py) of consecutive snapshots are linked by the
+particles they share. For each pair of snapshots, the member PUIDs of the later catalog are sorted once and the
+PUIDs of the earlier catalog are located with searchsorted, so that the number of shared particles of every
+(progenitor, descendant) pair is obtained from a single unique-count pass instead of set intersections of all
+halo pairs. Snapshot pairs are processed in parallel.
+
+The descendant of a halo is the later halo sharing the most particles with it, and the main progenitor of a halo
+is the progenitor sharing the most particles with it. The tree is stored in MergerTree.h5 with the halos of
+all snapshots numbered consecutively (TreeID = HaloOffset[snapshot] + halo index in its catalog):
+   DumpID[NSnap], Time[NSnap], HaloOffset[NSnap+1]
+   Snapshot, HaloID, NPar, MVir                                     [NHalo]
+   Descendant, DescendantShared, MainProgenitor, NextProgenitor     [NHalo]   (TreeIDs, -1 for none)
+where NextProgenitor links all the progenitors of the same descendant in order of decreasing shared particles.
+
+Example:
+   python gamer_merger_tree.py -s 0 -e 300 -p 16
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import h5py
+import numpy as np
+
+from gamer_snapshot import parallel_map
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def read_members( filename ):
+   """
+   Return ( member PUIDs, halo index of each member, number of halos ) of a halo catalog.
+   """
+   with h5py.File( filename, "r" ) as f:
+      puid   = f["MemberPUID"][()]
+      offset = f["MemberOffset"][()]
+   nhalo = len( offset ) - 1
+   return puid, np.repeat( np.arange(nhalo, dtype=np.int64), np.diff(offset) ), nhalo
+
+
+def shared_particles( puid_a, halo_a, puid_b, halo_b, nhalo_b ):
+   """
+   Number of particles shared by the halos of two catalogs.
+   Return ( halo in A, halo in B, number of shared particles ) for all pairs sharing at least one particle.
+   """
+   order  = np.argsort( puid_b, kind="stable" )
+   sorted_b = puid_b[ order ]
+   if len( sorted_b ) == 0:
+      empty = np.zeros( 0, dtype=np.int64 )
+      return empty, empty, empty
+   pos    = np.minimum( np.searchsorted(sorted_b, puid_a), len(sorted_b)-1 )
+   match  = sorted_b[pos] == puid_a
+   key    = halo_a[match]*nhalo_b + halo_b[ order[pos[match]] ]
+   key, count = np.unique( key, return_counts=True )
+   return key//nhalo_b, key%nhalo_b, count
+
+
+def _link_task( task ):
+   file_a, file_b = task
+   puid_a, halo_a, nhalo_a = read_members( file_a )
+   puid_b, halo_b, nhalo_b = read_members( file_b )
+   ha, hb, count = shared_particles( puid_a, halo_a, puid_b, halo_b, max(nhalo_b, 1) )
+
+#  descendant = halo in B sharing the most particles (ties -> the more massive one, i.e., the smaller index)
+   desc   = np.full( nhalo_a, -1, dtype=np.int64 )
+   shared = np.zeros( nhalo_a, dtype=np.int64 )
+   order  = np.lexsort( (hb, -count, ha) )
+   first  = np.nonzero( np.diff(ha[order], prepend=-1) )[0]
+   desc  [ ha[order[first]] ] = hb[ order[first] ]
+   shared[ ha[order[first]] ] = count[ order[first] ]
+   return desc, shared
+
+
+def build_tree( filenames, nproc=1 ):
+   """
+   Link the halo catalogs of a time-ordered list of files. Return a dictionary with the tree arrays.
+   """
+   nsnap  = len( filenames )
+   meta   = []
+   for fn in filenames:
+      with h5py.File( fn, "r" ) as f:
+         meta.append( (int(f.attrs["DumpID"]), float(f.attrs["Time"]), f["NPar"][()], f["MVir"][()]) )
+   nhalo  = np.array( [ len(m[2]) for m in meta ], dtype=np.int64 )
+   offset = np.concatenate( ([0], np.cumsum(nhalo)) )
+   ntot   = int( offset[-1] )
+
+   tree = { "DumpID"          : np.array( [m[0] for m in meta], dtype=np.int64 ),
+            "Time"            : np.array( [m[1] for m in meta] ),
+            "HaloOffset"      : offset,
+            "Snapshot"        : np.repeat( np.arange(nsnap, dtype=np.int64), nhalo ),
+            "HaloID"          : np.concatenate( [np.arange(n, dtype=np.int64) for n in nhalo] ) if nsnap else np.zeros( 0, dtype=np.int64 ),
+            "NPar"            : np.concatenate( [m[2] for m in meta] ) if nsnap else np.zeros( 0, dtype=np.int64 ),
+            "MVir"            : np.concatenate( [m[3] for m in meta] ) if nsnap else np.zeros( 0 ),
+            "Descendant"      : np.full( ntot, -1, dtype=np.int64 ),
+            "DescendantShared": np.zeros( ntot, dtype=np.int64 ),
+            "MainProgenitor"  : np.full( ntot, -1, dtype=np.int64 ),
+            "NextProgenitor"  : np.full( ntot, -1, dtype=np.int64 ) }
+
+   tasks = [ (filenames[s], filenames[s+1]) for s in range(nsnap-1) ]
+   for s, (desc, shared) in enumerate( parallel_map(_link_task, tasks, nproc, ordered=True) ):
+      has = desc >= 0
+      tree["Descendant"      ][ offset[s]:offset[s+1] ] = np.where( has, desc + offset[s+1], -1 )
+      tree["DescendantShared"][ offset[s]:offset[s+1] ] = shared
+
+#  progenitor lists sorted by the number of shared particles
+   prog  = np.nonzero( tree["Descendant"] >= 0 )[0]
+   order = prog[ np.lexsort( (prog, -tree["DescendantShared"][prog], tree["Descendant"][prog]) ) ]
+   d     = tree["Descendant"][ order ]
+   first = np.diff( d, prepend=-1 ) != 0
+   tree["MainProgenitor"][ d[first] ] = order[first]
+   same  = np.nonzero( ~first[1:] )[0]
+   tree["NextProgenitor"][ order[same] ] = order[same+1]
+   return tree
+
+
+def write_tree( tree, filename ):
+   with h5py.File( filename, "w" ) as f:
+      for k, v in tree.items():  f.create_dataset( k, data=v )
+
+
+def main_branch( tree, tree_id ):
+   """
+   TreeIDs of the main branch of a halo, from the halo back to its earliest main progenitor.
+   """
+   branch = [ tree_id ]
+   while tree["MainProgenitor"][ branch[-1] ] >= 0:
+      branch.append( int(tree["MainProgenitor"][branch[-1]]) )
+   return np.array( branch, dtype=np.int64 )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Build halo merger trees from the halo catalogs of gamer_halo.py' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='catalog path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-o', action='store', required=False, type=str, dest='output',
+                        help='output file [%(default)s]', default='MergerTree.h5' )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   filenames = [ os.path.join(args.prefix, 'Halo_Data_%06d.h5'%idx) for idx in range(args.idx_start, args.idx_end+1, args.didx) ]
+   filenames = [ f for f in filenames if os.path.isfile(f) ]
+   tree      = build_tree( filenames, nproc=args.nproc )
+   write_tree( tree, args.output )
+   print( '%s : %d snapshots, %d halos, %d links'%( args.output, len(filenames), len(tree["Snapshot"]),
+                                                   (tree["Descendant"] >= 0).sum() ) )
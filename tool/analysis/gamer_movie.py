@@ -0,0 +1,428 @@
+"""
+Batch renderer of slice and projection movies for series of GAMER HDF5 snapshots
+
+Each frame is rendered directly from the patches:
+   slice : only the leaf patches intersecting the slice plane (and the image window) are read, and every pixel
+           takes the value of the leaf cell containing its center
+   proj  : see gamer_projection.py (integrate/weighted/max)
+
+Frames are rendered by a pool of worker processes, one frame per task, so the throughput scales with the number
+of cores. All frames of a movie share the same color scale. Unless both vmin and vmax are given, the colormap
+limits of slices and of weighted/max projections are fixed in advance by a min/max reduction of the field over the
+leaf patches of the plot region in all snapshots, which bounds all pixel values without rendering anything.
+Integrated projections, whose column values are not bounded by the field extrema, are rendered once into a
+temporary file, from which both the limits and the frames are taken. Frames are either encoded directly into a
+video by piping raw RGB frames to ffmpeg or saved as PNG files.
+
+Plot specifications are given as comma-separated key=value lists (--spec, repeatable) or as a JSON list of
+dictionaries (--spec_file). Available keys (see DEFAULT_SPEC):
+   kind=slice/proj, field, axis=x/y/z, coord (slice position), center, width, depth, resolution, weight,
+   method, log, cmap, vmin, vmax
+
+Example:
+   python gamer_movie.py -s 0 -e 999 --spec kind=slice,field=Dens,axis=z --spec kind=proj,field=Dens,axis=x -p 32
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from gamer_projection import IMAGE_AXES, periodic_shifts, project
+from gamer_reduce import Block, Extrema, reduce_snapshot
+from gamer_snapshot import load, parallel_map, snapshot_filenames
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+DEFAULT_SPEC = { "kind": "slice", "field": "Dens", "axis": "z", "coord": None, "center": None, "width": None,
+                 "depth": None, "resolution": 1024, "weight": None, "method": None, "log": True,
+                 "cmap": "viridis", "vmin": None, "vmax": None }
+
+_frames = None   # frames rendered in advance (see render_movie()) shared with the worker processes
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def parse_spec( text ):
+   """
+   Convert "key=value,key=value,..." into a plot specification. Vector values are separated by ":".
+   """
+   spec = dict( DEFAULT_SPEC )
+   for item in text.split( "," ):
+      if not item:  continue
+      key, value = item.split( "=", 1 )
+      if key not in DEFAULT_SPEC:  raise ValueError( "unknown plot key \"%s\" !!"%key )
+      if key in ( "center", ):                        value = [ float(x) for x in value.split(":") ]
+      elif key in ( "coord", "width", "depth", "vmin", "vmax" ):  value = float( value )
+      elif key == "resolution":                       value = int( value )
+      elif key == "log":                              value = value.lower() in ( "1", "true", "yes" )
+      spec[key] = value
+   return spec
+
+
+def _window( snap, spec ):
+   # image window [le, re] and number of pixels of a plot specification
+   axis   = "xyz".index( spec["axis"] )
+   u, v   = IMAGE_AXES[axis]
+   center = 0.5*snap.box_size if spec["center"] is None else np.asarray( spec["center"], dtype=np.float64 )
+   if spec["coord"] is not None:  center[axis] = spec["coord"]
+   width  = snap.box_size[[u, v]] if spec["width"] is None else np.full( 2, spec["width"] )
+   depth  = snap.box_size[axis] if spec["depth"] is None else spec["depth"]
+   le, re = center.copy(), center.copy()
+   le[u], re[u] = center[u] - 0.5*width[0], center[u] + 0.5*width[0]
+   le[v], re[v] = center[v] - 0.5*width[1], center[v] + 0.5*width[1]
+   le[axis], re[axis] = center[axis] - 0.5*depth, center[axis] + 0.5*depth
+   return axis, center, le, re
+
+
+def _pixel_hits( edge, dh, lo, px, npix ):
+   """
+   Pixels whose centers lie in the cells [edge, edge+dh). edge has the shape [..., PS].
+   Return ( pixel indices, mask ) with the shape [..., PS, m].
+   """
+   m    = int( np.ceil(dh/px) ) + 1
+   ist  = np.floor( (edge-lo)/px - 0.5 ).astype( np.int64 )
+   idx  = ist[...,None] + np.arange( m )
+   c    = lo + ( idx+0.5 )*px
+   hit  = ( c >= edge[...,None] ) & ( c < edge[...,None]+dh ) & ( idx >= 0 ) & ( idx < npix )
+   return np.clip( idx, 0, npix-1 ), hit
+
+
+def render_slice( filename, field, axis, coord, le, re, npix, periodic=None ):
+   """
+   Slice of a grid field at x[axis]=coord sampled at the pixel centers of the window [le, re] (along the two image
+   axes). The window is wrapped across the periodic boundaries (default: Snapshot.periodic). Return the image
+   [nv][nu] with NaN outside the non-periodic boundaries.
+   """
+   snap   = load( filename )
+   u, v   = IMAGE_AXES[axis]
+   w      = axis
+   nu, nv = npix
+   px     = ( re[u]-le[u] )/nu, ( re[v]-le[v] )/nv
+   image  = np.full( nu*nv, np.nan )
+
+   periodic = snap.periodic.copy() if periodic is None else np.array( np.broadcast_to(periodic, (3,)), dtype=bool )
+   if periodic[w]:  coord %= snap.box_size[w]
+   periodic[w] = False
+
+   ps     = snap.ps
+   perm   = [ 0, 3-v, 3-u, 3-w ]    # [GID][z][y][x] -> [GID][v][u][w]
+   pl     = snap.edge_left
+   pr     = snap.edge_right()
+   with snap.open() as f:
+      for shift in periodic_shifts( snap, le, re, periodic ):
+#        leaf patches intersecting the slice plane and the image window in this periodic image
+         sl, sr = pl + shift, pr + shift
+         mask   = ( snap.son == -1 ) & ( sl[:,w] <= coord ) & ( coord < sr[:,w] ) & \
+                  ( sr[:,u] > le[u] ) & ( sl[:,u] < re[u] ) & ( sr[:,v] > le[v] ) & ( sl[:,v] < re[v] )
+         gids   = np.nonzero( mask )[0]
+
+         for g0, g1 in snap.blocks( gids, max_size=1024 ):
+            block = Block( snap, f, g0, g1 )
+            dh    = snap.cell_size[ snap.level[g0] ]
+            el    = sl[g0:g1]
+            cell  = np.arange( ps )*dh
+            k     = np.clip( np.floor((coord-el[:,w])/dh).astype(np.int64), 0, ps-1 )
+            data  = block.grid( field ).transpose( perm )
+            col   = np.take_along_axis( data, k[:,None,None,None], axis=3 )[...,0]         # [np][v][u]
+
+            iu, hu = _pixel_hits( el[:,u,None] + cell, dh, le[u], px[0], nu )             # [np][PS(u)][mu]
+            iv, hv = _pixel_hits( el[:,v,None] + cell, dh, le[v], px[1], nv )             # [np][PS(v)][mv]
+            pix    = iv[:,:,None,:,None]*nu + iu[:,None,:,None,:]
+            hit    = hv[:,:,None,:,None] & hu[:,None,:,None,:]
+            val    = np.broadcast_to( col[:,:,:,None,None], hit.shape )
+            image[ pix[hit] ] = val[hit]
+
+   return image.reshape( nv, nu )
+
+
+def render( filename, spec, resolution=None ):
+   """
+   Render the image of a plot specification. Return ( image [nv][nu], extent ).
+   """
+   snap          = load( filename )
+   axis, c, le, re = _window( snap, spec )
+   u, v          = IMAGE_AXES[axis]
+   npix          = np.full( 2, spec["resolution"] if resolution is None else resolution, dtype=np.int64 )
+   extent        = [ le[u], re[u], le[v], re[v] ]
+
+   if spec["kind"] == "slice":
+      return render_slice( filename, spec["field"], axis, c[axis], le, re, npix ), extent
+
+   elif spec["kind"] == "proj":
+      return project( filename, spec["field"], axis, center=c, width=[ re[u]-le[u], re[v]-le[v] ], depth=re[axis]-le[axis],
+                      resolution=npix, weight=spec["weight"], method=spec["method"], nproc=1, ntile=1 )
+
+   else:
+      raise ValueError( "unsupported plot kind \"%s\" (slice/proj) !!"%spec["kind"] )
+
+
+def needs_prerender( spec ):
+   # column integrals are not bounded by the extrema of the field
+   method = spec["method"] or ( "weighted" if spec["weight"] is not None else "integrate" )
+   return spec["kind"] == "proj"  and  method == "integrate"
+
+
+def region_gids( snap, spec ):
+   """
+   Leaf patches of the plot region (the slice plane or the projection volume within the image window).
+   """
+   axis, c, le, re = _window( snap, spec )
+   if spec["kind"] == "slice":
+      le[axis] = c[axis]
+      re[axis] = np.nextafter( c[axis], np.inf )
+   return snap.patches_in_box( le, re, leaf_only=True, periodic=bool(snap.periodic.all()) )
+
+
+def _extrema_task( task ):
+   filename, spec = task
+   snap = load( filename )
+   gids = region_gids( snap, spec )
+   if len( gids ) == 0:  return None
+   return reduce_snapshot( filename, [ Extrema(spec["field"]), Extrema(spec["field"], positive=True) ], gids=gids )
+
+
+def _image_extrema( image ):
+   image = image[ np.isfinite(image) ]
+   if image.size == 0:  return None
+   pos   = image[ image > 0.0 ]
+   return [ ( image.min(), image.max() ), ( pos.min(), pos.max() ) if pos.size else None ]
+
+
+def _final_limits( res, spec ):
+   """
+   Combine the [ (min, max), (positive min, positive max) ] of all frames into ( vmin, vmax ), with fallbacks when
+   there is no finite (or, for a log scale, no positive) value and when all values are the same.
+   """
+   k    = 1 if spec["log"] else 0
+   res  = [ r[k] for r in res if r is not None  and  r[k] is not None ]
+   name = spec_name( spec )
+   if not res:
+      print( "WARNING : %s has no %s values; use the default colormap limits !!"%( name, "positive" if spec["log"] else "finite" ),
+             file=sys.stderr )
+      lo, hi = ( 1.0, 10.0 ) if spec["log"] else ( 0.0, 1.0 )
+   else:
+      lo, hi = min( r[0] for r in res ), max( r[1] for r in res )
+   vmin = lo if spec["vmin"] is None else spec["vmin"]
+   vmax = hi if spec["vmax"] is None else spec["vmax"]
+   if vmin >= vmax:
+      if spec["vmax"] is None:  vmax = vmin*10.0 if spec["log"] else vmin + max( abs(vmin), 1.0 )
+      else:                     vmin = vmax/10.0 if spec["log"] else vmax - max( abs(vmax), 1.0 )
+   return vmin, vmax
+
+
+def colormap_limits( filenames, spec, nproc=1 ):
+   """
+   Colormap limits of a plot over all snapshots from a min/max reduction of the field over the leaf patches of the
+   plot region, which bound the pixel values of slices and of weighted/max projections. Not applicable to
+   integrated projections (see needs_prerender()). Return ( vmin, vmax ).
+   """
+   if spec["vmin"] is not None  and  spec["vmax"] is not None:  return spec["vmin"], spec["vmax"]
+   if needs_prerender( spec ):  raise ValueError( "the limits of integrated projections require the rendered frames !!" )
+
+   res = parallel_map( _extrema_task, [ (f, spec) for f in filenames ], nproc, ordered=False )
+   return _final_limits( res, spec )
+
+
+def _prerender_task( task ):
+   n, filename, spec = task
+   image = render( filename, spec )[0]
+   _frames[n] = image
+   return _image_extrema( image )
+
+
+def colorize( image, spec, vmin, vmax ):
+   """
+   Convert an image into an RGB array [row][column][3] of uint8 with the first row at the top.
+   """
+   import matplotlib
+   from matplotlib.colors import LogNorm, Normalize
+
+   cmap = matplotlib.colormaps[ spec["cmap"] ].with_extremes( bad="black" )
+   norm = LogNorm( vmin=vmin, vmax=vmax, clip=True ) if spec["log"] else Normalize( vmin=vmin, vmax=vmax, clip=True )
+   data = np.ma.masked_invalid( np.where(image > 0.0, image, np.nan) if spec["log"] else image )
+   rgb  = ( cmap( norm(data) )[..., :3]*255.0 ).astype( np.uint8 )
+   return rgb[::-1]
+
+
+def annotate( image, extent, spec, vmin, vmax, title ):
+   """
+   Draw an image with axes, a colorbar, and a title into a fixed-size figure. Return the RGB array.
+   """
+   import matplotlib
+   matplotlib.use( "Agg" )
+   import matplotlib.pyplot as plt
+   from matplotlib.colors import LogNorm, Normalize
+
+   axis  = "xyz".index( spec["axis"] )
+   u, v  = IMAGE_AXES[axis]
+   norm  = LogNorm( vmin=vmin, vmax=vmax ) if spec["log"] else Normalize( vmin=vmin, vmax=vmax )
+   data  = np.where( image > 0.0, image, np.nan ) if spec["log"] else image
+
+   fig, ax = plt.subplots( figsize=(6.4, 5.12), dpi=150 )
+   im = ax.imshow( data, origin="lower", extent=extent, norm=norm, cmap=spec["cmap"], interpolation="nearest" )
+   fig.colorbar( im, ax=ax, label=spec["field"] )
+   ax.set_xlabel( "xyz"[u] )
+   ax.set_ylabel( "xyz"[v] )
+   ax.set_title( title )
+   fig.canvas.draw()
+   rgb = np.asarray( fig.canvas.buffer_rgba() )[..., :3].copy()
+   plt.close( fig )
+   return rgb
+
+
+def _frame_task( task ):
+   n, filename, spec, vmin, vmax, do_annotate, png = task
+   if _frames is None:
+      image, extent = render( filename, spec )
+   else:
+      axis, _, le, re = _window( load(filename), spec )
+      u, v   = IMAGE_AXES[axis]
+      image  = np.asarray( _frames[n], dtype=np.float64 )
+      extent = [ le[u], re[u], le[v], re[v] ]
+   if do_annotate:
+      rgb = annotate( image, extent, spec, vmin, vmax, "%s  Time = %13.7e"%(os.path.basename(filename), load(filename).time) )
+   else:
+      rgb = colorize( image, spec, vmin, vmax )
+
+#  pad to even dimensions as required by most video codecs
+   rgb = np.pad( rgb, ((0, rgb.shape[0]%2), (0, rgb.shape[1]%2), (0, 0)) )
+
+   if png is not None:
+      import matplotlib.image
+      matplotlib.image.imsave( png, rgb )
+      return None
+   return rgb
+
+
+def spec_name( spec ):
+   return "%s_%s_%s"%( "Slice" if spec["kind"] == "slice" else "Proj", spec["axis"], spec["field"] )
+
+
+def render_movie( filenames, spec, output, fps=24, nproc=1, do_annotate=False, codec="libx264" ):
+   """
+   Render one movie of a plot specification over a series of snapshots.
+
+   output : *.mp4/*.mkv/... for a video encoded by ffmpeg, or a directory to store the PNG frames
+   """
+   global _frames
+
+   if not needs_prerender( spec )  or  ( spec["vmin"] is not None  and  spec["vmax"] is not None ):
+      vmin, vmax = colormap_limits( filenames, spec, nproc=nproc )
+      print( '%s : colormap limits = [%13.7e, %13.7e]'%( spec_name(spec), vmin, vmax ) )
+      _write_movie( filenames, spec, output, vmin, vmax, fps, nproc, do_annotate, codec )
+      return
+
+#  render the frames once into a temporary file (in single precision) to obtain the limits
+   npix = int( spec["resolution"] )
+   with tempfile.TemporaryDirectory() as tmpdir:
+      _frames = np.lib.format.open_memmap( os.path.join(tmpdir, "frames.npy"), mode="w+", dtype=np.float32,
+                                           shape=(len(filenames), npix, npix) )
+      try:
+         res = parallel_map( _prerender_task, [ (n, f, spec) for n, f in enumerate(filenames) ], nproc, ordered=False )
+         vmin, vmax = _final_limits( res, spec )
+         print( '%s : colormap limits = [%13.7e, %13.7e]'%( spec_name(spec), vmin, vmax ) )
+         _write_movie( filenames, spec, output, vmin, vmax, fps, nproc, do_annotate, codec )
+      finally:
+         _frames = None
+
+
+def _write_movie( filenames, spec, output, vmin, vmax, fps, nproc, do_annotate, codec ):
+   if os.path.splitext( output )[1] == "":
+      os.makedirs( output, exist_ok=True )
+      tasks = [ (n, f, spec, vmin, vmax, do_annotate, os.path.join(output, "%s_%s.png"%(os.path.basename(f), spec_name(spec))))
+                for n, f in enumerate(filenames) ]
+      parallel_map( _frame_task, tasks, nproc, ordered=False )
+      return
+
+   ffmpeg = shutil.which( "ffmpeg" )
+   if ffmpeg is None:  raise RuntimeError( "ffmpeg is not found; give a directory as the output to save PNG frames instead !!" )
+
+   tasks = [ (n, f, spec, vmin, vmax, do_annotate, None) for n, f in enumerate(filenames) ]
+   proc  = None
+   if nproc is None:  nproc = os.cpu_count()
+
+   import multiprocessing
+   with multiprocessing.get_context( "fork" ).Pool( processes=max(1, nproc) ) as pool:
+      for n, rgb in enumerate( pool.imap(_frame_task, tasks) ):
+         if proc is None:
+            proc = subprocess.Popen( [ ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                                       "-s", "%dx%d"%(rgb.shape[1], rgb.shape[0]), "-r", str(fps), "-i", "-",
+                                       "-c:v", codec, "-pix_fmt", "yuv420p", output ], stdin=subprocess.PIPE )
+         proc.stdin.write( np.ascontiguousarray(rgb).tobytes() )
+         print( '%s : frame %6d / %6d'%( output, n+1, len(tasks) ), end='\r' )
+   print( '' )
+
+   if proc is not None:
+      proc.stdin.close()
+      if proc.wait() != 0:  raise RuntimeError( "ffmpeg failed (exit code %d) !!"%proc.returncode )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Render slice/projection movies of a series of snapshots' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '--spec', action='append', required=False, type=str, dest='specs',
+                        help='plot specification "key=value,..." (repeatable) [kind=slice,field=Dens,axis=z]', default=None )
+   parser.add_argument( '--spec_file', action='store', required=False, type=str, dest='spec_file',
+                        help='JSON file with a list of plot specifications [%(default)s]', default=None )
+   parser.add_argument( '-o', action='store', required=False, type=str, dest='output',
+                        help='output format: a video extension (e.g., mp4) or "png" [%(default)s]', default='mp4' )
+   parser.add_argument( '--fps', action='store', required=False, type=int, dest='fps',
+                        help='frames per second [%(default)d]', default=24 )
+   parser.add_argument( '--annotate', action='store_true', dest='annotate',
+                        help='draw axes, colorbar, and time with matplotlib (slower) [False]' )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   specs = []
+   if args.spec_file is not None:
+      with open( args.spec_file ) as f:
+         for s in json.load( f ):
+            spec = dict( DEFAULT_SPEC )
+            spec.update( s )
+            specs.append( spec )
+   for s in ( args.specs or [] ):  specs.append( parse_spec(s) )
+   if not specs:  specs.append( dict(DEFAULT_SPEC) )
+
+   filenames = [ f for f in snapshot_filenames(args.prefix, args.idx_start, args.idx_end, args.didx) if os.path.isfile(f) ]
+   print( 'Number of snapshots = %d'%len(filenames) )
+
+   for spec in specs:
+      tag    = 'Data_%06d_%06d_%s'%( args.idx_start, args.idx_end, spec_name(spec) )
+      output = tag if args.output == 'png' else tag+'.'+args.output
+      render_movie( filenames, spec, output, fps=args.fps, nproc=args.nproc, do_annotate=args.annotate )
+      print( '%s complete'%output )
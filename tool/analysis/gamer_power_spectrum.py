@@ -0,0 +1,210 @@
+"""
+Power-spectrum estimator for uniform grids and particles
+
+The |k| bin index of every Fourier mode depends only on the grid shape, so it is computed once per shape and
+cached for all subsequent fields and snapshots. The shell sums are evaluated with a single bincount pass, and
+the real-to-complex FFTs are multi-threaded with scipy.fft.
+
+The binning and normalization follow Output_BasePowerSpectrum() in GAMER (src/Output/Output_BasePowerSpectrum.cpp):
+modes are assigned to the nearest integer multiple of the fundamental wavenumber 2*pi/L, only the
+non-redundant half of the rfftn modes is counted, and for overdensity=True the field is normalized by its mean
+value (the DC mode), so that P(k) = V*<|delta_k|^2>/N^2. The output of this module can therefore be compared
+directly with the PowerSpec_XXXXXX files of GAMER.
+
+Example:
+   k, Pk, count = power_spectrum( rho, box_size=30.0, nthreads=8 )
+   k, Pk, count = particle_power_spectrum( pos, 512, box_size=30.0, weight=mass, scheme="TSC" )
+   k, Pk, count = power_spectrum( rho_gas, box_size=30.0, field2=rho_dm )    # cross spectrum
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import numpy as np
+import scipy.fft as sfft
+
+from gamer_deposit import deposit_uniform, window
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+_kbin_cache = {}   # grid shape -> ( flat bin index of each rfftn mode, number of modes per bin )
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def kbins( shape ):
+   """
+   Return the flat |k| bin indices of all modes of rfftn( array with the given shape ) and the number of modes
+   in each bin. Bins are the nearest integer of |k| in units of the fundamental mode of the longest axis, and
+   modes beyond the largest full shell (min(shape)//2 for cubic grids) are put in an overflow bin that is discarded.
+   """
+   shape = tuple( int(s) for s in shape )
+   if shape not in _kbin_cache:
+      nmax = max( shape )
+      nbin = min( shape )//2 + 1
+      k2   = np.zeros( shape[:-1] + (shape[-1]//2+1,), dtype=np.float64 )
+      for d, n in enumerate( shape ):
+         f  = np.fft.rfftfreq( n, 1.0/n ) if d == len(shape)-1 else np.fft.fftfreq( n, 1.0/n )
+         f  = f*( nmax/n )                  # in units of the fundamental mode of the longest axis
+         sl = [ None ]*len( shape )
+         sl[d] = slice( None )
+         k2 = k2 + f[tuple(sl)]**2
+      idx   = np.rint( np.sqrt(k2) ).astype( np.int64 )
+      idx[ idx > nbin ] = nbin
+      dtype = np.uint16 if nbin < np.iinfo(np.uint16).max else np.uint32
+      idx   = idx.astype( dtype ).ravel()
+      count = np.bincount( idx, minlength=nbin+1 )[:nbin]
+      _kbin_cache[shape] = ( idx, count )
+   return _kbin_cache[shape]
+
+
+def shell_average( power, shape ):
+   """
+   Average the flattened rfftn mode power over the |k| shells of a grid with the given shape.
+   Return ( sum over each shell / number of modes, number of modes ).
+   """
+   idx, count = kbins( shape )
+   total      = np.bincount( idx, weights=power.ravel(), minlength=len(count)+1 )[:len(count)]
+   return total/np.maximum( count, 1 ), count
+
+
+def deconvolve( fk, shape, scheme ):
+   # divide the rfftn modes in place by the window function of the particle deposition scheme
+   nd = len( shape )
+   for d, n in enumerate( shape ):
+      w_full, w_half = window( n, scheme )
+      w  = w_half if d == nd-1 else w_full
+      sl = [ None ]*nd
+      sl[d] = slice( None )
+      fk /= w[tuple(sl)]
+   return fk
+
+
+def power_spectrum( field, box_size, field2=None, overdensity=True, scheme=None, nthreads=None ):
+   """
+   Power spectrum (or cross spectrum with field2) of a uniform periodic grid.
+
+   field       : 1D/2D/3D array
+   box_size    : float. Box size along the longest axis (cells are assumed to be cubic).
+   field2      : optional array of the same shape for the cross spectrum Re( F1*conj(F2) )
+   overdensity : bool. Normalize each field by its mean value (i.e., use the overdensity delta=field/mean).
+   scheme      : None or NGP/CIC/TSC. Deconvolve the window function of the particle deposition scheme.
+   nthreads    : int. Number of FFT threads (default: all cores).
+
+   Return ( k, P(k), number of modes ), excluding the DC mode.
+   """
+   if nthreads is None:  nthreads = os.cpu_count()
+   shape = field.shape
+   ncell = float( np.prod(shape) )
+   ndim  = len( shape )
+   kf    = 2.0*np.pi/box_size
+
+   def transform( f ):
+      fk = sfft.rfftn( f, workers=nthreads )
+      if overdensity:
+         mean = np.abs( fk.flat[0] )/ncell
+         if mean == 0.0:  raise ValueError( "zero mean value for overdensity=True !!" )
+         fk  /= mean
+      if scheme is not None:  deconvolve( fk, shape, scheme )
+      return fk
+
+   fk = transform( field )
+   if field2 is None:
+      power = fk.real**2 + fk.imag**2
+   else:
+      fk2   = transform( field2 )
+      power = fk.real*fk2.real + fk.imag*fk2.imag
+      del fk2
+   del fk
+
+   pk, count = shell_average( power, shape )
+   pk       *= box_size**ndim/ncell**2
+   k         = kf*np.arange( len(pk) )
+   return k[1:], pk[1:], count[1:]
+
+
+def particle_power_spectrum( pos, n, box_size, weight=None, pos2=None, weight2=None, scheme="CIC",
+                             left_edge=(0.0, 0.0, 0.0), nthreads=None ):
+   """
+   Power spectrum of the particle overdensity deposited onto an n^3 periodic grid with the window function
+   deconvolved. Provide pos2/weight2 for the cross spectrum of two particle sets. Shot noise is not subtracted.
+
+   Return ( k, P(k), number of modes ).
+   """
+   rho  = deposit_uniform( pos, n, box_size, weight=weight, scheme=scheme, left_edge=left_edge )
+   rho2 = None if pos2 is None else \
+          deposit_uniform( pos2, n, box_size, weight=weight2, scheme=scheme, left_edge=left_edge )
+   return power_spectrum( rho, box_size, field2=rho2, overdensity=True, scheme=scheme, nthreads=nthreads )
+
+
+def correlation_coefficient( P12, P11, P22 ):
+   return P12/np.sqrt( P11*P22 )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   from gamer_snapshot import Snapshot, snapshot_filenames
+
+   parser = argparse.ArgumentParser( description='Compute the power spectra of GAMER snapshots' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-f', action='store', required=False, type=str, dest='field',
+                        help='grid field, or "particle" for the particle mass [%(default)s]', default='Dens' )
+   parser.add_argument( '-lv', action='store', required=False, type=int, dest='lv',
+                        help='sampling level of the grid field (must cover the whole box) [%(default)d]', default=0 )
+   parser.add_argument( '-n', action='store', required=False, type=int, dest='ngrid',
+                        help='grid size for particles [base-level resolution]', default=None )
+   parser.add_argument( '--scheme', action='store', required=False, type=str, dest='scheme',
+                        help='particle deposition scheme: NGP/CIC/TSC [%(default)s]', default='CIC' )
+   parser.add_argument( '-t', action='store', required=False, type=int, dest='nthreads',
+                        help='number of FFT threads [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+      snap = Snapshot( filename )
+      L    = snap.box_size.max()
+
+      if args.field == 'particle':
+         ngrid = args.ngrid if args.ngrid is not None else int( snap.nx0.max() )
+         par   = snap.read_particles( ['ParPosX', 'ParPosY', 'ParPosZ', 'ParMass'] )
+         k, pk, count = particle_power_spectrum( [ par['ParPosX'], par['ParPosY'], par['ParPosZ'] ], ngrid, L,
+                                                 weight=par['ParMass'], scheme=args.scheme, nthreads=args.nthreads )
+         del par
+      else:
+         k, pk, count = power_spectrum( snap.read_uniform(args.field, args.lv), L, nthreads=args.nthreads )
+
+      filename_out = 'PowerSpec_%s_%s'%( args.field, os.path.basename(filename) )
+      with open( filename_out, 'w' ) as f:
+         f.write( '# %s of %s (Time = %20.14e)\n'%(args.field, filename, snap.time) )
+         f.write( '\n' )
+         f.write( '#%20s %21s %21s\n'%('k', 'Power', 'NMode') )
+         for kk, pp, cc in zip( k, pk, count ):
+            f.write( ' %21.14e %21.14e %21d\n'%(kk, pp, cc) )
+      print( '%s -> %s'%(filename, filename_out) )
@@ -0,0 +1,285 @@
+"""
+Axis-aligned projections rendered directly from the patches of GAMER HDF5 snapshots
+
+Each leaf patch overlapping the projection region is integrated along the line of sight (only the part of each
+cell inside the region is counted), and the resulting column map is added into a fixed-resolution image with the
+exact overlap area of every cell column and pixel. Since leaf patches never overlap, every volume element is
+counted exactly once and no quadtree is needed. The image is split into tiles rendered by a pool of worker
+processes, each of which reads only the patches overlapping its own tile. Regions extending beyond a periodic
+boundary (Snapshot.periodic) are wrapped by also rendering the periodic images of the patches.
+
+Methods:
+   integrate : sum of field*dl along the line of sight (e.g., column density for "Dens")
+   weighted  : sum of field*weight*dl / sum of weight*dl
+   max       : maximum of field along the line of sight (max-intensity projection)
+
+The image axes follow yt: x-projection -> (y, z), y-projection -> (z, x), z-projection -> (x, y), and the image
+is stored as [v][u] (i.e., [row][column] with the row corresponding to the vertical image axis).
+
+Example:
+   image, extent = project( "Data_000010", "Dens", axis=2, resolution=1024, nproc=8 )
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from gamer_reduce import Block
+from gamer_snapshot import load, parallel_map, snapshot_filenames
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+IMAGE_AXES = { 0: (1, 2), 1: (2, 0), 2: (0, 1) }   # projection axis -> (horizontal, vertical) image axes
+METHODS    = [ "integrate", "weighted", "max" ]
+MAX_CONTRIBUTION = 4194304                          # maximum number of (cell, pixel) pairs processed at once
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def _overlap( edge, dh, lo, px, i0, i1 ):
+   """
+   Pixel indices and overlap lengths of cells [edge, edge+dh) with the pixels [lo+i*px, lo+(i+1)*px), i0<=i<i1.
+   edge has the shape [..., PS]. Return arrays with the shape [..., PS, m], where m is the maximum number of
+   pixels overlapping with a cell. Indices outside [i0, i1) have zero overlaps.
+   """
+   m    = int( np.ceil(dh/px) ) + 1
+   ist  = np.floor( (edge-lo)/px ).astype( np.int64 )
+   idx  = ist[...,None] + np.arange( m )
+   pl   = lo + idx*px
+   ovl  = np.minimum( edge[...,None]+dh, pl+px ) - np.maximum( edge[...,None], pl )
+   ovl  = np.where( (idx >= i0) & (idx < i1), np.maximum(ovl, 0.0), 0.0 )
+   return np.clip( idx, i0, i1-1 ) - i0, ovl
+
+
+def periodic_shifts( snap, le, re, periodic ):
+   """
+   Offsets of the periodic images of the simulation domain overlapping with the box [le, re).
+   """
+   ks = []
+   for d in range( 3 ):
+      L = snap.box_size[d]
+      ks.append( range(int(np.floor(le[d]/L)), int(np.ceil(re[d]/L))) if periodic[d] else [0] )
+   k  = np.stack( np.meshgrid(*ks, indexing="ij"), axis=-1 ).reshape( -1, 3 )
+   return list( k*snap.box_size )
+
+
+def _render_tile( task ):
+   filename, field, weight, method, axis, le, re, npix, tile, periodic = task
+   snap       = load( filename )
+   u, v       = IMAGE_AXES[axis]
+   w          = axis
+   px         = ( re[u]-le[u] )/npix[0], ( re[v]-le[v] )/npix[1]
+   (iu0, iu1), (iv0, iv1) = tile
+   tnu, tnv   = iu1-iu0, iv1-iv0
+
+#  region of this tile
+   tle, tre   = np.array( le, dtype=np.float64 ), np.array( re, dtype=np.float64 )
+   tle[u], tre[u] = le[u] + iu0*px[0], le[u] + iu1*px[0]
+   tle[v], tre[v] = le[v] + iv0*px[1], le[v] + iv1*px[1]
+
+   if method == "max":
+      image = np.full( tnu*tnv, -np.inf )
+   else:
+      image = np.zeros( tnu*tnv )
+      norm  = np.zeros( tnu*tnv ) if method == "weighted" else None
+
+   ps   = snap.ps
+   perm = [ 0, 3-v, 3-u, 3-w ]    # [GID][z][y][x] -> [GID][v][u][w]
+   with snap.open() as f:
+#     patches overlapping this tile in each periodic image of the domain
+      for shift in periodic_shifts( snap, tle, tre, periodic ):
+         gids = snap.patches_in_box( tle-shift, tre-shift, leaf_only=True, periodic=False )
+         for g0, g1 in snap.blocks( gids, max_size=1024 ):
+            block = Block( snap, f, g0, g1 )
+            dh    = snap.cell_size[ snap.level[g0] ]
+            el    = snap.edge_left[g0:g1] + shift
+            cell  = np.arange( ps )*dh
+
+#           line-of-sight integration within [le[w], re[w])
+            ew    = el[:,w,None] + cell
+            dl    = np.clip( np.minimum(ew+dh, re[w]) - np.maximum(ew, le[w]), 0.0, None )[:,None,None,:]
+            data  = block.grid( field ).transpose( perm )
+            if method == "max":
+               col  = np.where( dl > 0.0, data, -np.inf ).max( axis=3 )
+            elif method == "weighted":
+               wgt  = block.grid( weight ).transpose( perm )*dl
+               col  = np.sum( data*wgt, axis=3 )
+               colw = np.sum( wgt, axis=3 )
+            else:
+               col  = np.sum( data*dl, axis=3 )
+
+#           pixel overlaps of the cell columns along the two image axes
+            iu, ou = _overlap( el[:,u,None] + cell, dh, le[u], px[0], iu0, iu1 )   # [np][PS(u)][mu]
+            iv, ov = _overlap( el[:,v,None] + cell, dh, le[v], px[1], iv0, iv1 )   # [np][PS(v)][mv]
+            mu, mv = iu.shape[-1], iv.shape[-1]
+            nsub   = max( 1, MAX_CONTRIBUTION//( ps*ps*mu*mv ) )
+
+            for s in range( 0, g1-g0, nsub ):
+               e    = min( s+nsub, g1-g0 )
+               area = ov[s:e,:,None,:,None]*ou[s:e,None,:,None,:]/( px[0]*px[1] )       # [np][v][u][mv][mu]
+               pix  = ( iv[s:e,:,None,:,None]*tnu + iu[s:e,None,:,None,:] ).ravel()
+               area = area.ravel()
+               if method == "max":
+                  val = np.broadcast_to( col[s:e,:,:,None,None], (e-s, ps, ps, mv, mu) ).ravel()
+                  hit = area > 0.0
+                  np.maximum.at( image, pix[hit], val[hit] )
+               else:
+                  image += np.bincount( pix, weights=( col[s:e,:,:,None,None]*area.reshape(e-s, ps, ps, mv, mu) ).ravel(),
+                                        minlength=tnu*tnv )
+                  if method == "weighted":
+                     norm += np.bincount( pix, weights=( colw[s:e,:,:,None,None]*area.reshape(e-s, ps, ps, mv, mu) ).ravel(),
+                                          minlength=tnu*tnv )
+
+   if method == "weighted":
+      image = np.divide( image, norm, out=np.zeros_like(image), where=norm > 0.0 )
+   return tile, image.reshape( tnv, tnu )
+
+
+def project( filename, field, axis=2, center=None, width=None, depth=None, resolution=512, weight=None,
+             method=None, periodic=None, nproc=1, ntile=None ):
+   """
+   Axis-aligned projection of a grid field.
+
+   filename   : string. Snapshot filename.
+   field      : string. Grid field (including the derived fields of gamer_reduce.DERIVED_FIELDS).
+   axis       : int. Projection axis (0/1/2 = x/y/z).
+   center     : [x, y, z]. Center of the projection region (default: box center).
+   width      : float or [wu, wv]. Width of the image (default: box size).
+   depth      : float. Depth along the line of sight (default: box size).
+   resolution : int or [nu, nv]. Number of pixels along the image axes.
+   weight     : string. Weight field for method="weighted".
+   method     : integrate/weighted/max (default: "weighted" if weight is given and "integrate" otherwise).
+   periodic   : bool or [bool]*3. Wrap the region across the periodic boundaries (default: Snapshot.periodic).
+                Parts of the region outside a non-periodic boundary are left empty.
+   nproc      : int. Number of worker processes.
+   ntile      : int. Number of tiles along each image axis (default: enough tiles for all workers).
+
+   Return ( image [nv][nu], extent [umin, umax, vmin, vmax] ).
+   """
+   snap   = load( filename )
+   u, v   = IMAGE_AXES[axis]
+   if method is None:  method = "weighted" if weight is not None else "integrate"
+   if method not in METHODS:  raise ValueError( "unsupported method \"%s\" (%s) !!"%(method, "/".join(METHODS)) )
+   if method == "weighted"  and  weight is None:  raise ValueError( "weight must be given for method=weighted !!" )
+
+   center = 0.5*snap.box_size if center is None else np.asarray( center, dtype=np.float64 )
+   width  = np.broadcast_to( snap.box_size[[u, v]] if width is None else np.asarray(width, dtype=np.float64), (2,) )
+   depth  = snap.box_size[axis] if depth is None else float( depth )
+   npix   = np.broadcast_to( np.asarray(resolution, dtype=np.int64), (2,) )
+
+   le, re = center.copy(), center.copy()
+   le[u], re[u] = center[u] - 0.5*width[0], center[u] + 0.5*width[0]
+   le[v], re[v] = center[v] - 0.5*width[1], center[v] + 0.5*width[1]
+   le[axis], re[axis] = center[axis] - 0.5*depth, center[axis] + 0.5*depth
+   periodic = snap.periodic if periodic is None else np.broadcast_to( np.asarray(periodic, dtype=bool), (3,) )
+
+   if ntile is None:  ntile = int( np.ceil(np.sqrt(max(1, 2*(nproc or 1)))) )
+   ntile  = min( ntile, int(npix.min()) )
+   eu     = np.linspace( 0, npix[0], ntile+1 ).astype( np.int64 )
+   ev     = np.linspace( 0, npix[1], ntile+1 ).astype( np.int64 )
+   tasks  = [ (filename, field, weight, method, axis, le, re, npix, ((eu[i], eu[i+1]), (ev[j], ev[j+1])), periodic)
+              for j in range(ntile) for i in range(ntile) ]
+
+   image  = np.empty( (npix[1], npix[0]) )
+   for ((iu0, iu1), (iv0, iv1)), tile_image in parallel_map( _render_tile, tasks, nproc, ordered=False ):
+      image[ iv0:iv1, iu0:iu1 ] = tile_image
+
+   return image, [ le[u], re[u], le[v], re[v] ]
+
+
+def save_image( filename, image, extent, label="", log=True, vmin=None, vmax=None, cmap="viridis", axis_labels=("", "") ):
+   """
+   Save an image as PNG with matplotlib.
+   """
+   import matplotlib
+   matplotlib.use( "Agg" )
+   import matplotlib.pyplot as plt
+   from matplotlib.colors import LogNorm, Normalize
+
+   data = np.where( np.isfinite(image), image, np.nan )
+   if log:
+      pos  = data[ data > 0.0 ]
+      norm = LogNorm( vmin=vmin if vmin is not None else (pos.min() if pos.size else 1.0),
+                      vmax=vmax if vmax is not None else (pos.max() if pos.size else 10.0) )
+      data = np.where( data > 0.0, data, np.nan )
+   else:
+      norm = Normalize( vmin=vmin, vmax=vmax )
+
+   fig, ax = plt.subplots()
+   im = ax.imshow( data, origin="lower", extent=extent, norm=norm, cmap=cmap, interpolation="nearest" )
+   fig.colorbar( im, ax=ax, label=label )
+   ax.set_xlabel( axis_labels[0] )
+   ax.set_ylabel( axis_labels[1] )
+   fig.savefig( filename, bbox_inches="tight", dpi=150 )
+   plt.close( fig )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Plot axis-aligned projections directly from the patches' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-f', action='store', required=False, type=str, dest='field',
+                        help='field [%(default)s]', default='Dens' )
+   parser.add_argument( '-a', action='store', required=False, type=str, dest='axis',
+                        help='projection axis: x/y/z [%(default)s]', default='z' )
+   parser.add_argument( '-w', action='store', required=False, type=str, dest='weight',
+                        help='weight field [%(default)s]', default=None )
+   parser.add_argument( '-m', action='store', required=False, type=str, dest='method',
+                        help='method: integrate/weighted/max [integrate, or weighted if -w is set]', default=None )
+   parser.add_argument( '-c', action='store', required=False, type=float, dest='center', nargs=3,
+                        help='center [box center]', default=None )
+   parser.add_argument( '--width', action='store', required=False, type=float, dest='width',
+                        help='image width [box size]', default=None )
+   parser.add_argument( '--depth', action='store', required=False, type=float, dest='depth',
+                        help='projection depth [box size]', default=None )
+   parser.add_argument( '-r', action='store', required=False, type=int, dest='resolution',
+                        help='number of pixels along each image axis [%(default)d]', default=1024 )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+   parser.add_argument( '--linear', action='store_true', dest='linear',
+                        help='use a linear color scale [False]' )
+   parser.add_argument( '--npy', action='store_true', dest='save_npy',
+                        help='also save the image as a .npy file [False]' )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   axis = 'xyz'.index( args.axis )
+   for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+      image, extent = project( filename, args.field, axis=axis, center=args.center, width=args.width,
+                               depth=args.depth, resolution=args.resolution, weight=args.weight,
+                               method=args.method, nproc=args.nproc )
+
+      name = '%s_Proj_%s_%s'%( os.path.basename(filename), args.axis, args.field )
+      if args.save_npy:  np.save( name+'.npy', image )
+      u, v = IMAGE_AXES[axis]
+      save_image( name+'.png', image, extent, label=args.field, log=not args.linear,
+                  axis_labels=('xyz'[u], 'xyz'[v]) )
+      print( '%s -> %s.png'%(filename, name) )
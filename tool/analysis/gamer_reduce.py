@@ -0,0 +1,315 @@
+"""
+Single-pass multi-reduction engine for GAMER HDF5 snapshots
+
+All reducers are evaluated together in one streaming pass over the leaf patches, so each field needed by any
+reducer is read only once per snapshot. The leaf patches are split into blocks of consecutive GIDs, which are
+processed by a pool of worker processes, and the partial results are combined afterwards.
+
+Grid reducers only use the leaf cells (i.e., cells not covered by finer patches), which is equivalent to yt's
+"all_data()". Particle reducers use all particles, which are stored in the leaf patches only.
+
+Example:
+   reducers = [ ArgMax("Dens"), ArgMin("Pote"), CenterOfMass(use_gas=True, use_particles=True) ]
+   (max_dens, x, y, z), (min_pote, x, y, z), com = reduce_snapshot( "Data_000010", reducers, nproc=8 )
+
+Derived grid fields can be registered in DERIVED_FIELDS as
+   name: ( [dependent fields], function(dict of dependent fields) )
+Fields requiring finite differences (e.g., "Dens_gradient_x" and "ElbdmMomX") are computed with the ghost-zone-aware
+stencils of gamer_stencil.py.
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import numpy as np
+
+from gamer_snapshot import load, parallel_map
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+DERIVED_FIELDS = { "TotDens": ( ["Dens", "ParDens"], lambda d: d["Dens"] + d["ParDens"] ) }
+
+PAR_POS = [ "ParPosX", "ParPosY", "ParPosZ" ]
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class Block():
+   def __init__( self, snap, h5file, g0, g1, order=2, monotonic=False ):
+      """
+      Data of the leaf patches [g0, g1) shared by all reducers. Fields, coordinates, and particle attributes
+      are loaded on first access and cached.
+
+      order, monotonic : stencil order and coarse-fine interpolation of the stencil fields (see gamer_stencil.py)
+      """
+      self.snap      = snap
+      self.h5file    = h5file
+      self.g0        = g0
+      self.g1        = g1
+      self.dv        = snap.cell_volume( g0 )
+      self.order     = order
+      self.monotonic = monotonic
+      self._grid     = {}
+      self._par      = None
+      self._xyz      = None
+      self._stencil  = None
+
+   def grid( self, name ):
+      if name not in self._grid:
+         if name in DERIVED_FIELDS  and  name not in self.snap.fields:
+            deps, func = DERIVED_FIELDS[name]
+            self._grid[name] = func( { v: self.grid(v) for v in deps } )
+         elif name not in self.snap.fields  and  self._is_stencil_field( name ):
+            import gamer_stencil
+            self._grid[name] = gamer_stencil.evaluate( self, name )
+         else:
+            self._grid[name] = self.snap.read_grid( name, self.g0, self.g1, self.h5file ).astype( np.float64 )
+      return self._grid[name]
+
+   @staticmethod
+   def _is_stencil_field( name ):
+      import gamer_stencil
+      return gamer_stencil.is_stencil_field( name )
+
+   @property
+   def stencil( self ):
+      if self._stencil is None:
+         import gamer_stencil
+         self._stencil = gamer_stencil.StencilCache( self, self.order, self.monotonic )
+      return self._stencil
+
+   def coords( self ):
+      if self._xyz is None:
+         shape     = ( self.g1-self.g0, ) + ( self.snap.ps, )*3
+         self._xyz = [ np.broadcast_to(c, shape) for c in self.snap.cell_coords(self.g0, self.g1) ]
+      return self._xyz
+
+   def par( self, name ):
+      if self._par is None:  self._par = {}
+      if name not in self._par:
+         p0, p1 = self.snap.particle_range( self.g0, self.g1 )
+         self._par[name] = self.h5file["Particle"][name][p0:p1].astype( np.float64 )
+      return self._par[name]
+
+   @property
+   def npar( self ):
+      p0, p1 = self.snap.particle_range( self.g0, self.g1 )
+      return p1 - p0
+
+
+
+class Reducer():
+   """
+   Base class of all reducers.
+
+   reduce( block )     : return the partial result of a block (None if nothing to reduce)
+   combine( a, b )     : combine two non-None partial results
+   finalize( partial ) : convert the combined partial result into the final result
+   """
+   grid_fields = []
+   par_atts    = []
+
+   def reduce( self, block ):
+      raise NotImplementedError
+
+   def combine( self, a, b ):
+      return a + b
+
+   def finalize( self, partial ):
+      return partial
+
+
+
+class ArgMax( Reducer ):
+   def __init__( self, field ):
+      """
+      Maximum value of a grid field and the coordinates of the corresponding cell center.
+      Return ( value, x, y, z ).
+      """
+      self.field       = field
+      self.grid_fields = [ field ]
+      self.sign        = 1.0
+
+   def reduce( self, block ):
+      data = self.sign*block.grid( self.field )
+      idx  = int( np.argmax(data) )
+      return ( data.flat[idx], ) + tuple( float(c.flat[idx]) for c in block.coords() )
+
+   def combine( self, a, b ):
+      return a if a[0] >= b[0] else b
+
+   def finalize( self, partial ):
+      if partial is None:  return None
+      return ( self.sign*partial[0], ) + tuple( partial[1:] )
+
+
+
+class ArgMin( ArgMax ):
+   def __init__( self, field ):
+      """
+      Minimum value of a grid field and the coordinates of the corresponding cell center.
+      Return ( value, x, y, z ).
+      """
+      ArgMax.__init__( self, field )
+      self.sign = -1.0
+
+
+
+class Extrema( Reducer ):
+   def __init__( self, field, positive=False ):
+      """
+      Minimum and maximum of a grid field (of positive values only when positive=True). Return ( min, max ).
+      """
+      self.field       = field
+      self.grid_fields = [ field ]
+      self.positive    = positive
+
+   def reduce( self, block ):
+      data = block.grid( self.field )
+      if self.positive:  data = data[ data > 0.0 ]
+      if data.size == 0:  return None
+      return ( data.min(), data.max() )
+
+   def combine( self, a, b ):
+      return ( min(a[0], b[0]), max(a[1], b[1]) )
+
+
+
+class Sum( Reducer ):
+   def __init__( self, field=None, weight=None, volume=True ):
+      """
+      Volume integral of a grid field, sum_cells field*weight*dV (the cell volume is excluded when volume=False).
+      field=None integrates the weight (or the volume) only.
+      """
+      self.field       = field
+      self.weight      = weight
+      self.volume      = volume
+      self.grid_fields = [ v for v in (field, weight) if v is not None ]
+
+   def reduce( self, block ):
+      data = 1.0
+      if self.field  is not None:  data = data*block.grid( self.field )
+      if self.weight is not None:  data = data*block.grid( self.weight )
+      total = np.sum( data ) if np.ndim( data ) else data*( block.g1-block.g0 )*block.snap.ps**3
+      return total*( block.dv if self.volume else 1.0 )
+
+
+
+class Moments( Reducer ):
+   def __init__( self, field, weight=None, order=2, source="grid" ):
+      """
+      Weighted raw moments <field^n>, n=1~order, of a grid field (weighted by weight*dV, or dV when weight=None)
+      or of a particle attribute (source="par", weighted by a particle attribute or equally).
+      Return ( total weight, [mean, <field^2>, ...], variance ).
+      """
+      self.field  = field
+      self.weight = weight
+      self.order  = order
+      self.source = source
+      if source == "par":  self.par_atts    = [ v for v in (field, weight) if v is not None ]
+      else:                self.grid_fields = [ v for v in (field, weight) if v is not None ]
+
+   def reduce( self, block ):
+      if self.source == "par":
+         if block.npar == 0:  return None
+         data = block.par( self.field )
+         w    = block.par( self.weight ) if self.weight is not None else np.ones_like( data )
+      else:
+         data = block.grid( self.field )
+         w    = ( block.grid(self.weight) if self.weight is not None else np.ones_like(data) )*block.dv
+      sums = [ np.sum(w) ]
+      pw   = w
+      for n in range( self.order ):
+         pw = pw*data
+         sums.append( np.sum(pw) )
+      return np.array( sums )
+
+   def finalize( self, partial ):
+      if partial is None  or  partial[0] == 0.0:  return None
+      raw = partial[1:]/partial[0]
+      var = raw[1] - raw[0]**2 if self.order >= 2 else None
+      return ( partial[0], list(raw), var )
+
+
+
+class CenterOfMass( Reducer ):
+   def __init__( self, use_gas=True, use_particles=False, mass_field="Dens" ):
+      """
+      Center of mass of the gas (cell mass = mass_field*dV) and/or particles (ParMass). Return [x, y, z].
+      """
+      self.use_gas       = use_gas
+      self.use_particles = use_particles
+      self.mass_field    = mass_field
+      self.grid_fields   = [ mass_field ] if use_gas else []
+      self.par_atts      = [ "ParMass" ] + PAR_POS if use_particles else []
+
+   def reduce( self, block ):
+      out = np.zeros( 4 )
+      if self.use_gas:
+         m       = block.grid( self.mass_field )*block.dv
+         out[0] += np.sum( m )
+         for d, c in enumerate( block.coords() ):  out[1+d] += np.sum( m*c )
+      if self.use_particles  and  block.npar > 0:
+         m       = block.par( "ParMass" )
+         out[0] += np.sum( m )
+         for d, v in enumerate( PAR_POS ):  out[1+d] += np.sum( m*block.par(v) )
+      return out
+
+   def finalize( self, partial ):
+      if partial is None  or  partial[0] == 0.0:  return None
+      return list( partial[1:]/partial[0] )
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def _reduce_blocks( task ):
+   filename, blocks, reducers, order, monotonic = task
+   snap     = load( filename )
+   partials = [ None ]*len( reducers )
+   with snap.open() as f:
+      for g0, g1 in blocks:
+         block = Block( snap, f, g0, g1, order, monotonic )
+         for r, reducer in enumerate( reducers ):
+            p = reducer.reduce( block )
+            if p is None:  continue
+            partials[r] = p if partials[r] is None else reducer.combine( partials[r], p )
+   return partials
+
+
+def reduce_snapshot( filename, reducers, nproc=1, gids=None, block_size=4096, order=2, monotonic=False ):
+   """
+   Evaluate all reducers in a single pass over the leaf patches of a snapshot.
+
+   filename   : string. Snapshot filename.
+   reducers   : list of Reducer.
+   nproc      : int. Number of worker processes.
+   gids       : optional GIDs to be reduced (default: all leaf patches). Non-leaf patches are excluded.
+   block_size : int. Maximum number of patches per block.
+   order      : int. Order of the stencil fields (see gamer_stencil.py).
+   monotonic  : bool. Use min-mod limited slopes in the coarse-fine interpolation of the stencil fields.
+
+   Return the list of the final results in the order of the reducers.
+   """
+   snap   = load( filename )
+   leaf   = snap.leaf_gids()
+   gids   = leaf if gids is None else np.intersect1d( gids, leaf )
+   blocks = snap.blocks( gids, max_size=block_size )
+
+#  distribute the blocks to the workers in a round-robin fashion to balance the levels
+   ntask = max( 1, min(len(blocks), 4*(nproc or 1)) )
+   tasks = [ (filename, blocks[t::ntask], reducers, order, monotonic) for t in range(ntask) ]
+
+   partials = [ None ]*len( reducers )
+   for res in parallel_map( _reduce_blocks, tasks, nproc, ordered=False ):
+      for r, p in enumerate( res ):
+         if p is None:  continue
+         partials[r] = p if partials[r] is None else reducers[r].combine( partials[r], p )
+
+   return [ reducer.finalize(p) for reducer, p in zip(reducers, partials) ]
@@ -0,0 +1,277 @@
+"""
+Repack a GAMER HDF5 snapshot with per-patch chunking, compression, and optional level/field/region subsetting
+
+GAMER writes GridData/<field> as contiguous arrays, so reading a few patches touches unaligned byte ranges and the
+files cannot be compressed. This tool rewrites a snapshot with
+   - GridData chunks of exactly one patch ([1][PS][PS][PS], or the face-centered shape for magnetic fields)
+   - an optional lossless filter (gzip/lzf) with or without byte shuffling
+   - optionally only the levels <= max_level, a subset of the grid fields, and/or the patches overlapping a sub-box
+   - optionally (--lossy) the error-bounded quantization of gamer_codec.py, encoded in parallel over patch blocks,
+     with the achieved errors reported per field
+
+Info, Tree, and Particle are kept consistent with the selected patches:
+   - patches are kept or removed in whole families (the 8 sons of a father), so Son always points to 8 kept patches
+   - GIDs are renumbered in the original order; Father/Son/Sibling are remapped, and links to removed patches
+     become -1 (removed sons turn their fathers into leaf patches)
+   - particles of removed patches are moved to their closest kept ancestor (which is a leaf patch) or dropped
+     when no ancestor is kept, and Tree/NPar and KeyInfo.NPatch/Par_NPar are updated accordingly
+
+Snapshots subset by level only (and not encoded with --lossy) remain valid for restarts. Snapshots with a subset of
+the grid fields or restricted to a sub-box are intended for analysis only, since restarts require all fluid fields
+in GridData and the full base level.
+
+Example:
+   python gamer_repack.py Data_000010 Data_000010_packed -c gzip --shuffle
+   python gamer_repack.py Data_000010 Data_000010_lv3 --max_level 3 --fields Dens Pote
+   python gamer_repack.py Data_000010 Data_000010_box --box 0.4 0.4 0.4 0.6 0.6 0.6 -c lzf
+   python gamer_repack.py Data_000010 Data_000010_archive --lossy rel -E 1e-3 --shuffle -p 16
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import h5py
+import numpy as np
+
+from gamer_codec import CODEC_MODE, codec_name, encode, decode_array, error_stats, is_encoded, quantized_dtype
+from gamer_snapshot import Snapshot, imap
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def select_patches( snap, max_level=None, box=None ):
+   """
+   Patches to keep. Return a boolean array [NPatch] where the 8 sons of a father are either all kept or all removed.
+
+   max_level : keep only the levels <= max_level
+   box       : [x0, y0, z0, x1, y1, z1]. Keep only the patches (families) overlapping with this box.
+   """
+   keep = np.ones( snap.npatch_all, dtype=bool )
+   if max_level is not None:  keep &= snap.level <= max_level
+   if box is None:  return keep
+
+   le, re = np.asarray( box[:3], dtype=np.float64 ), np.asarray( box[3:], dtype=np.float64 )
+   inside = np.zeros( snap.npatch_all, dtype=bool )
+   inside[ snap.patches_in_box(le, re, periodic=False) ] = True
+
+   for lv in range( snap.nlevel ):
+      g = snap.level_gids( lv )
+      if len( g ) == 0:  continue
+      if lv == 0:
+         keep[g] &= inside[g]
+         continue
+      fa      = snap.father[g]
+      family  = np.zeros( snap.npatch_all, dtype=bool )
+      family[ fa[inside[g]] ] = True
+      keep[g] &= keep[fa] & family[fa]
+   return keep
+
+
+def remap( ids, new_gid ):
+   # map old GIDs to new ones, keeping negative values (no patch/boundary flags) and removed patches -> -1
+   ids = np.asarray( ids )
+   out = ids.copy()
+   pos = ids >= 0
+   out[pos] = new_gid[ ids[pos] ]
+   return out
+
+
+def particle_order( snap, keep, new_gid ):
+   """
+   New order of the particles and the number of particles of each new patch.
+   Return ( old particle indices in the new order, NPar [NPatch_new] ).
+   """
+   host = np.repeat( np.arange(snap.npatch_all, dtype=np.int64), snap.npar )
+   anc  = np.arange( snap.npatch_all, dtype=np.int64 )
+   for _ in range( snap.nlevel ):
+      up      = ( anc >= 0 ) & ~keep[ np.maximum(anc, 0) ]
+      anc[up] = snap.father[ anc[up] ]
+   new_host = np.where( anc[host] >= 0, new_gid[np.maximum(anc[host], 0)], -1 )
+   valid    = np.nonzero( new_host >= 0 )[0]
+   order    = valid[ np.argsort(new_host[valid], kind="stable") ]
+   npar     = np.bincount( new_host[valid], minlength=int(keep.sum()) ).astype( snap.npar.dtype )
+   return order, npar
+
+
+def filter_kwargs( compression, level, shuffle ):
+   kw = {}
+   if compression == "gzip":   kw.update( compression="gzip", compression_opts=level )
+   elif compression == "lzf":  kw.update( compression="lzf" )
+   elif compression not in ( None, "none" ):
+      raise ValueError( "unsupported compression \"%s\" (gzip/lzf/none) !!"%compression )
+   if shuffle:  kw["shuffle"] = True
+   return kw
+
+
+def _encode_task( task ):
+   filename, field, g0, g1, mode, error, dtype = task
+   with h5py.File( filename, "r" ) as f:
+      data = f["GridData"][field][g0:g1]
+   q, offset, step = encode( data, mode, error, dtype )
+   return q, offset, step, error_stats( data, decode_array(q, offset, step, data.dtype, mode) )
+
+
+def repack( filename_in, filename_out, max_level=None, fields=None, box=None, compression="gzip", level=4,
+            shuffle=True, lossy=None, error=1.0e-3, lossy_fields=None, nproc=1, par_chunk=65536, block=4096 ):
+   """
+   Repack a snapshot (see the module docstring).
+
+   lossy        : None, "abs", "range", or "rel". Encode the grid fields with gamer_codec.py.
+   error        : error bound of the lossy codec
+   lossy_fields : fields to encode (default: all grid fields)
+   nproc        : number of processes for encoding
+
+   Return ( selection mask of the original patches, {field: ( max abs error, max rel error, number of values )}
+   for the encoded fields ).
+   """
+   snap     = Snapshot( filename_in )
+   keep     = select_patches( snap, max_level, box )
+   new_gid  = np.full( snap.npatch_all, -1, dtype=np.int64 )
+   new_gid[keep] = np.arange( keep.sum() )
+   kept     = np.nonzero( keep )[0]
+   nnew     = len( kept )
+   kw       = filter_kwargs( compression, level, shuffle )
+   runs     = snap.blocks( kept, max_size=block )
+
+   with h5py.File( filename_in, "r" ) as fi, h5py.File( filename_out, "w" ) as fo:
+      for k, v in fi.attrs.items():  fo.attrs[k] = v
+
+#     groups copied as is
+      for name in fi:
+         if name not in ( "Tree", "GridData", "Particle", "Codec" ):  fi.copy( fi[name], fo, name=name )
+
+#     Tree
+      tree_in  = fi["Tree"]
+      tree_out = fo.create_group( "Tree" )
+      for name, dset in tree_in.items():
+         data = dset[()][keep]
+         if name in ( "Father", "Son", "Sibling" ):  data = remap( data, new_gid ).astype( dset.dtype )
+         out  = tree_out.create_dataset( name, data=data )
+         for k, v in dset.attrs.items():  out.attrs[k] = v
+
+#     Particle
+      par_npar = None
+      if "Particle" in fi:
+         order, npar = particle_order( snap, keep, new_gid )
+         if "NPar" in tree_out:  tree_out["NPar"][...] = npar
+         par_out = fo.create_group( "Particle" )
+         for name, dset in fi["Particle"].items():
+            out = par_out.create_dataset( name, shape=(len(order),), dtype=dset.dtype,
+                                          chunks=(max(1, min(par_chunk, len(order))),) if len(order) else None,
+                                          **(kw if len(order) else {}) )
+            for k, v in dset.attrs.items():  out.attrs[k] = v
+            if len( order ):  out[...] = dset[()][order]
+         par_npar = len( order )
+
+#     GridData with one patch per chunk
+      grid_out = fo.create_group( "GridData" )
+      stats    = {}
+      for name, dset in fi.get( "GridData", {} ).items():
+         if fields is not None  and  name not in fields:  continue
+         encoded = is_encoded( dset )
+         encode_ = lossy is not None  and  not encoded  and  ( lossy_fields is None  or  name in lossy_fields )
+         dtype   = quantized_dtype( lossy, error ) if encode_ else dset.dtype
+         shape   = ( nnew, ) + dset.shape[1:]
+         out     = grid_out.create_dataset( name, shape=shape, dtype=dtype,
+                                            chunks=(1,)+dset.shape[1:] if nnew else None, **(kw if nnew else {}) )
+         for k, v in dset.attrs.items():  out.attrs[k] = v
+
+         if encoded  or  encode_:
+            codec_out = fo.require_group( "Codec" ).create_group( name )
+            offset    = codec_out.create_dataset( "Offset", shape=(nnew,), dtype=np.float64 )
+            step      = codec_out.create_dataset( "Step",   shape=(nnew,), dtype=np.float64 )
+
+         if encode_:
+            out.attrs["Codec"]      = codec_name( lossy )
+            out.attrs["CodecMode"]  = lossy
+            out.attrs["CodecError"] = error
+            out.attrs["CodecDType"] = dset.dtype.str
+            tasks = [ (filename_in, name, g0, g1, lossy, error, dtype) for g0, g1 in runs ]
+            total = [ 0.0, 0.0, 0 ]
+            for ( g0, g1 ), ( q, off, stp, st ) in zip( runs, imap(_encode_task, tasks, nproc) ):
+               s = new_gid[g0]
+               out   [ s:s+(g1-g0) ] = q
+               offset[ s:s+(g1-g0) ] = off
+               step  [ s:s+(g1-g0) ] = stp
+               total = [ max(total[0], st[0]), max(total[1], st[1]), total[2]+st[2] ]
+            stats[name] = tuple( total )
+         else:
+            for g0, g1 in runs:
+               s = new_gid[g0]
+               out[ s:s+(g1-g0) ] = dset[g0:g1]
+               if encoded:
+                  offset[ s:s+(g1-g0) ] = fi["Codec"][name]["Offset"][g0:g1]
+                  step  [ s:s+(g1-g0) ] = fi["Codec"][name]["Step"  ][g0:g1]
+
+#     KeyInfo
+      key = fi["Info/KeyInfo"][...]
+      key["NPatch"] = np.bincount( snap.level[keep], minlength=len(np.atleast_1d(key["NPatch"])) )
+      if par_npar is not None  and  "Par_NPar" in key.dtype.names:  key["Par_NPar"] = par_npar
+      fo["Info/KeyInfo"][...] = key
+
+   return keep, stats
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Repack a GAMER snapshot with per-patch chunks and compression' )
+
+   parser.add_argument( 'input',  type=str, help='input snapshot' )
+   parser.add_argument( 'output', type=str, help='output snapshot' )
+   parser.add_argument( '--max_level', action='store', required=False, type=int, dest='max_level',
+                        help='keep only the levels <= max_level [all]', default=None )
+   parser.add_argument( '--fields', action='store', required=False, type=str, dest='fields', nargs='+',
+                        help='grid fields to keep (analysis only) [all]', default=None )
+   parser.add_argument( '--box', action='store', required=False, type=float, dest='box', nargs=6,
+                        help='keep only the patches overlapping with [x0 y0 z0 x1 y1 z1] (analysis only) [None]', default=None )
+   parser.add_argument( '-c', action='store', required=False, type=str, dest='compression',
+                        help='compression filter: gzip/lzf/none [%(default)s]', default='gzip' )
+   parser.add_argument( '-l', action='store', required=False, type=int, dest='level',
+                        help='gzip level [%(default)d]', default=4 )
+   parser.add_argument( '--shuffle', action='store_true', dest='shuffle',
+                        help='apply the byte-shuffle filter [False]' )
+   parser.add_argument( '--lossy', action='store', required=False, type=str, dest='lossy', choices=CODEC_MODE,
+                        help='lossy archive mode: error bound absolute (abs), relative to each value (rel), or relative '
+                             'to the value range of each patch (range; no per-value relative bound) '
+                             '(see gamer_codec.py) [%(default)s]', default=None )
+   parser.add_argument( '-E', action='store', required=False, type=float, dest='error',
+                        help='error bound of the lossy mode [%(default)g]', default=1.0e-3 )
+   parser.add_argument( '--lossy_fields', action='store', required=False, type=str, dest='lossy_fields', nargs='+',
+                        help='grid fields to encode in the lossy mode [all]', default=None )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes for the lossy mode [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   if os.path.abspath( args.input ) == os.path.abspath( args.output ):
+      raise ValueError( "the output file must differ from the input file !!" )
+   if args.box is not None:
+      print( 'WARNING : snapshots restricted to a sub-box cannot be used for restarts !!' )
+   if args.fields is not None:
+      print( 'WARNING : snapshots with a subset of the grid fields cannot be used for restarts !!' )
+
+   keep, stats = repack( args.input, args.output, max_level=args.max_level, fields=args.fields, box=args.box,
+                         compression=args.compression, level=args.level, shuffle=args.shuffle, lossy=args.lossy,
+                         error=args.error, lossy_fields=args.lossy_fields, nproc=args.nproc )
+   if stats:
+      print( '%-16s %14s %14s %14s'%( 'Field', 'MaxAbsErr', 'MaxRelErr', 'NValue' ) )
+      for name, ( err_abs, err_rel, nvalue ) in stats.items():
+         print( '%-16s %14.7e %14.7e %14d'%( name, err_abs, err_rel, nvalue ) )
+   print( '%s -> %s : %d/%d patches, %.3f -> %.3f GB'%( args.input, args.output, keep.sum(), len(keep),
+          os.path.getsize(args.input)/1024**3, os.path.getsize(args.output)/1024**3 ) )
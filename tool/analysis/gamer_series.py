@@ -0,0 +1,131 @@
+"""
+Incremental per-snapshot reductions of a simulation time series
+
+reduce_series() evaluates a user function func( filename ) -> {column: scalar} for each snapshot with a pool of
+worker processes and stores the results in preallocated columns (one entry per snapshot). The results are cached
+in a .npz file together with the size and modification time of each snapshot, so that only new or modified
+snapshots are processed when the series is reduced again (e.g., re-plotting while a run advances). The cache also
+stores a key identifying the reduction (e.g., a version string to be changed whenever func changes) and the
+requested columns, and all cached results are discarded when either of them differs.
+
+Example:
+   def reduce_one( filename ):
+      snap = Snapshot( filename )
+      return { "Time": snap.time, "MaxDens": reduce_snapshot( filename, [Extrema("Dens")] )[0][1] }
+
+   res = reduce_series( snapshot_filenames("./", 0, 100), reduce_one, cache="Series.npz", key="MaxDens-v1",
+                        columns=["Time", "MaxDens"], nproc=8 )
+   plt.plot( res["Time"], res["MaxDens"] )
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import os
+
+import numpy as np
+
+from gamer_snapshot import parallel_map
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+_func = None   # reduction function shared with the worker processes
+
+_META = ( "Filename", "Size", "MTime", "CacheKey", "Columns" )   # non-column entries of the cache files
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def _stat( filename ):
+   st = os.stat( filename )
+   return st.st_size, st.st_mtime_ns
+
+
+def load_cache( cache, key="", columns=() ):
+   """
+   Return {filename: ( size, mtime, {column: value} )} of a cache file (empty if it does not exist or if it was
+   written with a different key or set of columns).
+   """
+   if cache is None  or  not os.path.isfile( cache ):  return {}
+   with np.load( cache ) as data:
+      if "CacheKey" not in data.files  or  str( data["CacheKey"] ) != str( key )  or \
+         sorted( map(str, data["Columns"]) ) != sorted( set(columns) ):
+         print( "Discarding the cache %s created for a different key or set of columns"%cache )
+         return {}
+      cols  = [ k for k in data.files if k not in _META ]
+      names = data["Filename"]
+      size  = data["Size"]
+      mtime = data["MTime"]
+      value = { c: data[c] for c in cols }
+   return { str(f): ( int(size[r]), int(mtime[r]), {c: value[c][r] for c in cols if not np.isnan(value[c][r])} )
+            for r, f in enumerate(names) }
+
+
+def save_cache( cache, entries, key="", columns=() ):
+   """
+   Write {filename: ( size, mtime, {column: value} )} to a cache file as columns (NaN for missing values)
+   together with the key and the requested columns (see load_cache()).
+   """
+   names = sorted( entries )
+   cols  = sorted( { c for e in entries.values() for c in e[2] } )
+   bad   = [ c for c in cols if c in _META ]
+   if bad:  raise ValueError( "reserved column name(s) %s !!"%bad )
+   data  = { "Filename": np.array( names, dtype=str ),
+             "Size"    : np.array( [ entries[f][0] for f in names ], dtype=np.int64 ),
+             "MTime"   : np.array( [ entries[f][1] for f in names ], dtype=np.int64 ),
+             "CacheKey": np.array( str(key) ),
+             "Columns" : np.array( sorted(set(columns)), dtype=str ) }
+   for c in cols:
+      data[c] = np.array( [ entries[f][2].get(c, np.nan) for f in names ], dtype=np.float64 )
+   tmp = cache + ".tmp.npz"
+   np.savez( tmp, **data )
+   os.replace( tmp, cache )
+
+
+def _reduce_task( filename ):
+   return filename, _stat( filename ), _func( filename )
+
+
+def reduce_series( filenames, func, cache=None, nproc=1, columns=None, key=None, verbose=True ):
+   """
+   Reduce a series of snapshots.
+
+   filenames : list of snapshot filenames.
+   func      : function( filename ) -> {column: scalar}. It runs in the worker processes.
+   cache     : .npz file of the cached results (None: no cache). Snapshots whose size and modification time are
+               unchanged since they were cached are not processed again.
+   nproc     : int. Number of worker processes.
+   columns   : optional list of columns that always exist in the output (NaN when func does not return them).
+   key       : optional string identifying func (e.g., a version string). The cache is discarded when key or
+               the set of columns differs from those it was created with.
+
+   Return {column: array [len(filenames)]} in the order of filenames, with NaN for the values not returned.
+   """
+   global _func
+
+   key     = "" if key is None else str( key )
+   entries = load_cache( cache, key, columns or () )
+   todo    = [ f for f in filenames if f not in entries  or  entries[f][:2] != _stat(f) ]
+   if verbose:
+      print( "Reducing %d snapshot(s) (%d cached)"%( len(todo), len(filenames)-len(todo) ) )
+
+   if todo:
+      _func = func
+      try:
+         for f, stat, res in parallel_map( _reduce_task, todo, nproc, ordered=False ):
+            entries[f] = ( stat[0], stat[1], { c: float(v) for c, v in res.items() } )
+      finally:
+         _func = None
+      if cache is not None:  save_cache( cache, entries, key, columns or () )
+
+#  preallocated columns in the order of filenames
+   cols = set( columns or [] ) | { c for f in filenames for c in entries[f][2] }
+   out  = { c: np.full( len(filenames), np.nan ) for c in sorted(cols) }
+   for r, f in enumerate( filenames ):
+      for c, v in entries[f][2].items():  out[c][r] = v
+   return out
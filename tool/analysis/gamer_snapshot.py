@@ -0,0 +1,357 @@
+"""
+Lightweight reader of the GAMER HDF5 snapshots (Data_XXXXXX) for the Python analysis tools
+
+It reads the "Info", "Tree", "GridData", and "Particle" groups directly with h5py (see the data structure
+described in src/Output/Output_DumpData_Total_HDF5.cpp) without building any global cell array. Patches are
+identified by their GID, which are sorted by level, so that a range of GIDs [g0, g1) can be read as a single
+contiguous hyperslab. Particles are stored in the order of their host patches, so the particles of [g0, g1)
+are also contiguous.
+
+Patch data are stored as [GID][z][y][x], with the cell (i,j,k) of a patch located at
+   x = Corner[GID][0]*Cvt2Phy + (i+0.5)*CellSize[lv]
+
+Example:
+   snap = Snapshot( "Data_000010" )
+   for g0, g1 in snap.blocks( snap.leaf_gids() ):
+      dens = snap.read_grid( "Dens", g0, g1 )
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import mmap
+import multiprocessing
+import os
+
+import h5py
+import numpy as np
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+MODEL_NAME = { 1: "HYDRO", 3: "ELBDM", 4: "PAR_ONLY" }
+
+# sibling direction [0~25] -> offset (x,y,z) in units of the patch width (see src/Auxiliary/Table_01.cpp)
+SIB_OFFSET = np.array( [ (-1, 0, 0), ( 1, 0, 0), ( 0,-1, 0), ( 0, 1, 0), ( 0, 0,-1), ( 0, 0, 1),
+                         (-1,-1, 0), ( 1,-1, 0), (-1, 1, 0), ( 1, 1, 0), ( 0,-1,-1), ( 0, 1,-1),
+                         ( 0,-1, 1), ( 0, 1, 1), (-1, 0,-1), (-1, 0, 1), ( 1, 0,-1), ( 1, 0, 1),
+                         (-1,-1,-1), ( 1,-1,-1), (-1, 1,-1), ( 1, 1,-1), (-1,-1, 1), ( 1,-1, 1),
+                         (-1, 1, 1), ( 1, 1, 1) ], dtype=np.int32 )
+
+_cache = {}   # snapshots opened in the current process
+
+_uniform_out = None   # output array of Snapshot.read_uniform() shared with the worker processes
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class Snapshot():
+   def __init__( self, filename ):
+      """
+      filename : string. GAMER HDF5 snapshot.
+
+      Only the "Info" and "Tree" groups are loaded here. The object holds no open file handle so that it can
+      be sent to (or inherited by) worker processes, which reopen the file on demand.
+      """
+      self.filename = filename
+
+      with h5py.File( filename, "r" ) as f:
+         key = f["Info/KeyInfo"][()]
+         self.key_info = { k: key[k] for k in key.dtype.names }
+         self.makefile = self._compound( f, "Info/Makefile" )
+         self.input_para = self._compound( f, "Info/InputPara" )
+
+         self.corner   = f["Tree/Corner"][()]
+         self.cvt2phy  = float( f["Tree/Corner"].attrs["Cvt2Phy"] )
+         self.lbidx    = f["Tree/LBIdx"][()]
+         self.father   = f["Tree/Father"][()]
+         self.son      = f["Tree/Son"][()]
+         self.sibling  = f["Tree/Sibling"][()]
+         self.npar     = f["Tree/NPar"][()] if "NPar" in f["Tree"] else np.zeros( len(self.corner), dtype=np.int32 )
+
+         self.fields   = list( f["GridData"].keys() ) if "GridData" in f else []
+         self.par_atts = list( f["Particle"].keys() ) if "Particle" in f else []
+         self.field_dtype = { v: np.dtype( f["GridData"][v].attrs.get("CodecDType", f["GridData"][v].dtype) )
+                              for v in self.fields }
+
+      self.nlevel    = int( self.key_info["NLevel"] )
+      self.ps        = int( self.key_info["PatchSize"] )
+      self.npatch    = np.array( self.key_info["NPatch"], dtype=np.int64 )
+      self.lv_offset = np.concatenate( ([0], np.cumsum(self.npatch)) )
+      self.box_size  = np.array( self.key_info["BoxSize"], dtype=np.float64 )
+      self.cell_size = np.array( self.key_info["CellSize"], dtype=np.float64 )
+      self.nx0       = np.array( self.key_info["NX0"], dtype=np.int64 )
+      self.time      = float( np.atleast_1d(self.key_info["Time"])[0] )
+      self.step      = int( self.key_info["Step"] )
+      self.model     = MODEL_NAME.get( int(self.key_info["Model"]), str(self.key_info["Model"]) )
+      self.particle  = bool( self.key_info.get("Particle", 0) )
+      self.npatch_all = int( self.lv_offset[-1] )
+
+      self.level      = np.repeat( np.arange(self.nlevel, dtype=np.int8), self.npatch )
+      self.edge_left  = self.corner*self.cvt2phy
+      self.patch_size = self.ps*self.cell_size
+      self.par_offset = np.concatenate( ([0], np.cumsum(self.npar, dtype=np.int64)) )
+
+   @staticmethod
+   def _compound( f, name ):
+      if name not in f:  return {}
+      data = f[name][()]
+      return { k: data[k] for k in data.dtype.names }
+
+   def __repr__( self ):
+      return "Snapshot(%s: Model=%s, Time=%.7e, NPatch=%s)"%( self.filename, self.model, self.time,
+                                                             list(self.npatch[self.npatch > 0]) )
+
+   @property
+   def comoving( self ):
+      return bool( self.makefile.get("Comoving", 0) )
+
+   @property
+   def redshift( self ):
+      # Time[0] is the scale factor in comoving runs
+      return 1.0/self.time - 1.0 if self.comoving else None
+
+   @property
+   def periodic( self ):
+      # periodic fluid boundaries along x/y/z (BC_FLU_PERIODIC=1), assumed when Opt__BC_Flu is not recorded
+      bc = self.input_para.get( "Opt__BC_Flu" )
+      if bc is None:  return np.ones( 3, dtype=bool )
+      return np.asarray( bc ).ravel()[0::2] == 1
+
+   @property
+   def max_level( self ):
+      return int( np.nonzero(self.npatch)[0][-1] )
+
+   def open( self ):
+      return h5py.File( self.filename, "r" )
+
+   def level_gids( self, lv ):
+      return np.arange( self.lv_offset[lv], self.lv_offset[lv+1] )
+
+   def leaf_gids( self, levels=None ):
+      leaf = self.son == -1
+      if levels is not None:  leaf &= np.isin( self.level, levels )
+      return np.nonzero( leaf )[0]
+
+   def edge_right( self, gids=slice(None) ):
+      return self.edge_left[gids] + self.patch_size[self.level[gids]][:,None]
+
+   def patches_in_box( self, le, re, levels=None, leaf_only=False, periodic=True ):
+      """
+      Return the GIDs of all patches overlapping with the box [le, re). The box may extend beyond the
+      simulation domain when periodic=True.
+      """
+      le, re = np.asarray( le, dtype=np.float64 ), np.asarray( re, dtype=np.float64 )
+      pl     = self.edge_left
+      pr     = self.edge_right()
+      if periodic:
+         mask = np.ones( len(pl), dtype=bool )
+         for d in range(3):
+            L      = self.box_size[d]
+            lo, hi = le[d], re[d]
+            if hi - lo >= L:  continue
+            lo = lo%L
+            hi = lo + ( re[d] - le[d] )
+            m  = ( pr[:,d] > lo ) & ( pl[:,d] < hi )
+            if hi > L:  m |= pl[:,d] < hi - L
+            mask &= m
+      else:
+         mask = np.all( (pr > le) & (pl < re), axis=1 )
+      if levels is not None:  mask &= np.isin( self.level, levels )
+      if leaf_only:           mask &= self.son == -1
+      return np.nonzero( mask )[0]
+
+   def patches_in_sphere( self, center, radius, levels=None, leaf_only=False, periodic=True ):
+      """
+      Return the GIDs of all patches overlapping with the sphere (using the minimum image when periodic=True).
+      """
+      center = np.asarray( center, dtype=np.float64 )
+      gids   = self.patches_in_box( center-radius, center+radius, levels=levels, leaf_only=leaf_only, periodic=periodic )
+      half   = 0.5*self.patch_size[self.level[gids]][:,None]
+      dist   = self.edge_left[gids] + half - center
+      if periodic:  dist -= np.round( dist/self.box_size )*self.box_size
+      dist   = np.maximum( np.abs(dist) - half, 0.0 )
+      return gids[ np.sum(dist**2, axis=1) <= radius**2 ]
+
+   def blocks( self, gids=None, max_size=None ):
+      """
+      Split the sorted GIDs into ranges [g0, g1) of consecutive GIDs on the same level with at most
+      max_size patches each (default: all patches on a level), which can be read with single hyperslabs.
+      """
+      gids = np.arange( self.npatch_all ) if gids is None else np.unique( gids )
+      if len(gids) == 0:  return []
+      if max_size is None:  max_size = self.npatch_all
+      brk  = np.nonzero( (np.diff(gids) != 1) | (np.diff(self.level[gids]) != 0) )[0] + 1
+      out  = []
+      for run in np.split( gids, brk ):
+         for s in range( 0, len(run), max_size ):
+            out.append( (int(run[s]), int(run[min(s+max_size, len(run))-1])+1) )
+      return out
+
+   def cell_coords( self, g0, g1 ):
+      """
+      Return the cell-center coordinates x, y, z of the patches [g0, g1) as arrays broadcastable to
+      [g1-g0][PS][PS][PS] (patches must be on the same level).
+      """
+      dh  = self.cell_size[ self.level[g0] ]
+      idx = ( np.arange(self.ps) + 0.5 )*dh
+      el  = self.edge_left[g0:g1]
+      return ( el[:,0,None,None,None] + idx[None,None,None,:],
+               el[:,1,None,None,None] + idx[None,None,:,None],
+               el[:,2,None,None,None] + idx[None,:,None,None] )
+
+   def cell_volume( self, g0 ):
+      return self.cell_size[ self.level[g0] ]**3
+
+   def read_grid( self, field, g0, g1, h5file=None ):
+      """
+      Read GridData/<field> of the patches [g0, g1) with the shape [g1-g0][PS][PS][PS].
+      h5file : optional opened h5py.File to avoid reopening the file.
+      """
+      if h5file is None:
+         with self.open() as f:  return read_grid( f, field, g0, g1 )
+      return read_grid( h5file, field, g0, g1 )
+
+   def read_uniform( self, field, lv=0, out=None, nproc=1, max_size=4096 ):
+      """
+      Return GridData/<field> of level lv as a uniform array [nz][ny][nx]. Level lv must cover the whole box.
+      Each patch is copied straight to the position given by Tree/Corner, so no coordinate sorting is needed.
+
+      out      : None (allocate in memory), filename of a new .npy file to be memory-mapped, or a preallocated
+                 array [nz][ny][nx]. With nproc>1, a preallocated array must be an np.memmap opened for writing
+                 (other arrays are filled by the current process only).
+      nproc    : int. Number of processes.
+      max_size : int. Maximum number of patches read at once.
+      """
+      global _uniform_out
+
+      n = self.nx0*2**lv
+      if self.npatch[lv]*self.ps**3 != np.prod( n ):
+         raise ValueError( "level %d does not cover the whole box !!"%lv )
+
+      shape = tuple( int(v) for v in n[::-1] )
+      dtype = self.field_dtype[field]
+      if nproc is None:  nproc = os.cpu_count()
+      if out is None:
+         if nproc > 1:
+#           anonymous shared memory so that the forked workers can write to it
+            buf = mmap.mmap( -1, int(np.prod(shape))*dtype.itemsize )
+            out = np.frombuffer( buf, dtype=dtype ).reshape( shape )
+         else:
+            out = np.empty( shape, dtype=dtype )
+      elif isinstance( out, str ):
+         out = np.lib.format.open_memmap( out, mode="w+", dtype=dtype, shape=shape )
+      else:
+         if out.shape != shape:  raise ValueError( "out.shape %s != %s !!"%(out.shape, shape) )
+         if not isinstance( out, np.memmap ):  nproc = 1
+
+      blocks = self.blocks( self.level_gids(lv), max_size=max_size )
+      if nproc <= 1  or  len(blocks) <= 1:
+         with self.open() as f:
+            for g0, g1 in blocks:  self._place( out, lv, read_grid(f, field, g0, g1), g0, g1 )
+      else:
+         _uniform_out = out
+         try:
+            parallel_map( _read_uniform_block, [ (self.filename, field, lv, g0, g1) for g0, g1 in blocks ], nproc )
+         finally:
+            _uniform_out = None
+
+      if isinstance( out, np.memmap ):  out.flush()
+      return out
+
+   def _place( self, out, lv, data, g0, g1 ):
+      # view the uniform array as [nz/PS][PS][ny/PS][PS][nx/PS][PS] and scatter the patches [g0, g1)
+      ps      = self.ps
+      nz, ny, nx = out.shape
+      i, j, k = ( self.corner[g0:g1]//(self.key_info["CellScale"][lv]*ps) ).T
+      out.reshape( nz//ps, ps, ny//ps, ps, nx//ps, ps )[ k, :, j, :, i, : ] = data
+
+   def read_particles( self, atts, g0=None, g1=None, h5file=None ):
+      """
+      Read the particle attributes of the patches [g0, g1) (default: all particles). Return a dictionary.
+      """
+      p0 = 0 if g0 is None else int( self.par_offset[g0] )
+      p1 = int( self.par_offset[-1] ) if g1 is None else int( self.par_offset[g1] )
+      if h5file is None:
+         with self.open() as f:  return { v: f["Particle"][v][p0:p1] for v in atts }
+      return { v: h5file["Particle"][v][p0:p1] for v in atts }
+
+   def particle_range( self, g0, g1 ):
+      return int( self.par_offset[g0] ), int( self.par_offset[g1] )
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def read_grid( h5file, field, g0, g1 ):
+   """
+   Read GridData/<field> of the patches [g0, g1) from an opened snapshot. Fields encoded by gamer_codec.py
+   are decoded transparently.
+   """
+   dset = h5file["GridData"][field]
+   if "Codec" in dset.attrs:
+      import gamer_codec
+      return gamer_codec.decode( h5file, field, g0, g1 )
+   return dset[g0:g1]
+
+
+def _read_uniform_block( task ):
+   filename, field, lv, g0, g1 = task
+   snap = load( filename )
+   with snap.open() as f:
+      snap._place( _uniform_out, lv, read_grid(f, field, g0, g1), g0, g1 )
+
+
+def read_key_info( filename ):
+   """
+   Return Info/KeyInfo of a snapshot as a dictionary without loading the tree (e.g., to check its DumpID).
+   """
+   with h5py.File( filename, "r" ) as f:
+      key = f["Info/KeyInfo"][()]
+   return { k: key[k] for k in key.dtype.names }
+
+
+def load( filename ):
+   """
+   Return the Snapshot of "filename" cached in the current process (e.g., for worker processes).
+   """
+   snap = _cache.get( filename )
+   if snap is None:
+      _cache.clear()
+      snap = _cache[filename] = Snapshot( filename )
+   return snap
+
+
+def parallel_map( func, tasks, nproc=1, ordered=True ):
+   """
+   Apply func to all tasks with nproc processes (in the current process when nproc<=1). Tasks should carry
+   the snapshot filename instead of Snapshot objects so that workers can use load().
+   """
+   if nproc is None:  nproc = os.cpu_count()
+   if nproc <= 1  or  len(tasks) <= 1:
+      return [ func(t) for t in tasks ]
+   with multiprocessing.get_context( "fork" ).Pool( processes=min(nproc, len(tasks)) ) as pool:
+      if ordered:  return pool.map( func, tasks, chunksize=1 )
+      return list( pool.imap_unordered(func, tasks) )
+
+
+def imap( func, tasks, nproc=1, ordered=True ):
+   """
+   Lazy version of parallel_map() so that the results can be consumed (e.g., written) as they arrive. Leaving the
+   loop early terminates the pool.
+   """
+   if nproc is None:  nproc = os.cpu_count()
+   if nproc <= 1  or  len(tasks) <= 1:
+      for t in tasks:  yield func( t )
+      return
+   with multiprocessing.get_context( "fork" ).Pool( processes=min(nproc, len(tasks)) ) as pool:
+      for r in ( pool.imap if ordered else pool.imap_unordered )( func, tasks ):  yield r
+
+
+def snapshot_filenames( prefix, idx_start, idx_end, didx=1 ):
+   return [ os.path.join(prefix, "Data_%06d"%idx) for idx in range(idx_start, idx_end+1, didx) ]
@@ -0,0 +1,404 @@
+"""
+Ghost-zone-aware finite-difference stencils on the patches of GAMER HDF5 snapshots
+
+For each batch of patches on the same level, the ghost zones of width NGhost are filled from the same-level
+siblings (Tree/Sibling). Where a sibling does not exist, the ghost cells are interpolated from the father level
+(Tree/Father), whose own ghost zones are filled recursively in the same way. The interpolation is the conservative
+dimension-by-dimension quartic interpolation (as INT_CQUAR in GAMER), which uses INT_GHOST=2 coarse cells on each
+side and is exact for the cell averages of quartic polynomials. With monotonic=True, its corrections are limited
+so that no new extrema are created.
+Ghost cells beyond a non-periodic boundary copy the nearest interior cell (outflow).
+
+Vectorized 2nd- and 4th-order central stencils are then applied to the patches with ghost zones:
+   order  gradient                                          Laplacian (per direction)         NGhost
+     2    ( u[i+1] - u[i-1] )/2h                            ( u[i+1] - 2u[i] + u[i-1] )/h^2      1
+     4    ( -u[i+2] + 8u[i+1] - 8u[i-1] + u[i-2] )/12h      ( -u[i+2] + 16u[i+1] - 30u[i]
+                                                              + 16u[i-1] - u[i-2] )/12h^2        2
+The interpolation error of the ghost cells is 5th order, so the gradients keep their order near the coarse-fine
+boundaries, whereas the 4th-order Laplacian drops to 3rd order there (the 2nd-order one is unaffected). The
+limiter of monotonic=True reduces the interpolation to 2nd order at the local extrema.
+
+Stencil fields are available in gamer_reduce.py (e.g., Sum("ElbdmMomX")) and through derived_fields(), which
+streams the fields of the leaf patches batch by batch without building any global array:
+   <field>_gradient_x/y/z, <field>_gradient_magnitude, <field>_laplacian   for any grid field
+   ElbdmMomX/Y/Z       : ELBDM momentum density ( R*grad(I) - I*grad(R) )/eta
+   ElbdmAngMomX/Y/Z    : ELBDM angular momentum density about the box center
+   ElbdmVelX/Y/Z       : ELBDM bulk velocity ElbdmMom/Dens
+   ElbdmVelQPX/Y/Z     : ELBDM "quantum-pressure" velocity ( R*grad(R) + I*grad(I) )/( eta*Dens )
+   ElbdmEkin           : ELBDM kinetic energy density 0.5*( |grad(R)|^2 + |grad(I)|^2 )/eta^2
+where R/I are the real/imaginary parts of the wave function and eta = ELBDM_Mass/ELBDM_PlanckConst.
+
+Example:
+   python gamer_stencil.py -s 0 -e 10 -i ../ --order 4 -p 8
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import sys
+
+import numpy as np
+
+from gamer_reduce import Block, Moments, Sum, reduce_snapshot
+from gamer_snapshot import SIB_OFFSET, imap, load, read_grid, snapshot_filenames
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+NGHOST = { 2: 1, 4: 2 }   # stencil order -> number of ghost cells
+
+INT_GHOST = 2             # coarse cells required on each side by the coarse-fine interpolation
+
+# maximum gap (in patches) between GIDs read with a single hyperslab
+READ_GAP = 64
+
+_SIB_INDEX = { tuple(o): s for s, o in enumerate(SIB_OFFSET) }   # offset (x,y,z) -> sibling direction
+
+_GRAD_SUFFIX = { "_gradient_x": 0, "_gradient_y": 1, "_gradient_z": 2 }
+
+# ELBDM stencil fields: name -> function( block ) using the StencilCache of the block
+ELBDM_FIELDS = {}
+for _d, _x in enumerate( "XYZ" ):
+   ELBDM_FIELDS[ "ElbdmMom"   +_x ] = lambda b, d=_d: _elbdm_mom( b, d )
+   ELBDM_FIELDS[ "ElbdmAngMom"+_x ] = lambda b, d=_d: _elbdm_ang_mom( b, d )
+   ELBDM_FIELDS[ "ElbdmVel"   +_x ] = lambda b, d=_d: _elbdm_mom( b, d )/b.grid( "Dens" )
+   ELBDM_FIELDS[ "ElbdmVelQP" +_x ] = lambda b, d=_d: _elbdm_vel_qp( b, d )
+ELBDM_FIELDS[ "ElbdmEkin" ] = lambda b: _elbdm_ekin( b )
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class GhostZone():
+   def __init__( self, snap, h5file, monotonic=False ):
+      """
+      Fill the ghost zones of patches from an opened snapshot.
+
+      snap      : Snapshot.
+      h5file    : opened h5py.File of the snapshot.
+      monotonic : bool. Use min-mod limited slopes in the coarse-fine interpolation.
+      """
+      self.snap      = snap
+      self.h5file    = h5file
+      self.monotonic = monotonic
+
+   def read( self, field, gids ):
+      """
+      Read GridData/<field> of the sorted unique GIDs, coalescing nearby GIDs into single hyperslabs.
+      """
+      out = np.empty( (len(gids),) + (self.snap.ps,)*3, dtype=np.float64 )
+      brk = np.nonzero( np.diff(gids) > READ_GAP )[0] + 1
+      s   = 0
+      for run in np.split( gids, brk ):
+         g0, g1 = int( run[0] ), int( run[-1] ) + 1
+         out[ s:s+len(run) ] = read_grid( self.h5file, field, g0, g1 )[ run-g0 ]
+         s += len( run )
+      return out
+
+   def fill( self, field, gids, ng ):
+      """
+      Return GridData/<field> of the patches gids (on the same level) with ng ghost cells on each side as an
+      array [len(gids)][PS+2*ng][PS+2*ng][PS+2*ng] in double precision.
+      """
+      snap = self.snap
+      ps   = snap.ps
+      gids = np.asarray( gids, dtype=np.int64 )
+      if ng > ps:  raise ValueError( "number of ghost cells (%d) > patch size (%d) !!"%(ng, ps) )
+
+      n      = len( gids )
+      L      = ps + 2*ng
+      sib    = snap.sibling[gids]
+      ext    = np.empty( (n, L, L, L), dtype=np.float64 )
+      need   = np.unique( np.concatenate([gids, sib[sib >= 0]]) )
+      data   = self.read( field, need )
+      self_i = np.searchsorted( need, gids )
+
+#     1. ghost zones without same-level siblings: interpolate from the father level or apply the outflow B.C.
+      missing = np.any( sib < 0, axis=1 )
+      coarse  = missing & ( snap.father[gids] >= 0 )
+      outflow = missing & ~coarse
+      if outflow.any():
+         ext[outflow] = np.pad( data[ self_i[outflow] ], ((0, 0),) + ((ng, ng),)*3, mode="edge" )
+      if coarse.any():
+         ext[coarse] = self._interpolate( field, gids[coarse], ng )
+
+#     2. interior and same-level siblings
+      src = { -1: slice(ps-ng, ps), 0: slice(0, ps), 1: slice(0, ng) }
+      dst = { -1: slice(0, ng),     0: slice(ng, ng+ps), 1: slice(ng+ps, L) }
+      for (ox, oy, oz) in np.ndindex( 3, 3, 3 ):
+         ox, oy, oz = ox-1, oy-1, oz-1
+         if ( ox, oy, oz ) == ( 0, 0, 0 ):
+            mask, idx = np.ones( n, dtype=bool ), self_i
+         else:
+            col  = sib[ :, _SIB_INDEX[(ox, oy, oz)] ]
+            mask = col >= 0
+            idx  = np.searchsorted( need, col[mask] )
+         if not mask.any():  continue
+         ext[ mask, dst[oz], dst[oy], dst[ox] ] = data[ idx, src[oz], src[oy], src[ox] ]
+
+      return ext
+
+   def _interpolate( self, field, gids, ng ):
+      """
+      Interpolate the patches gids with ng ghost cells from their fathers.
+      """
+      snap = self.snap
+      ps   = snap.ps
+      lv   = int( snap.level[gids[0]] )
+      ngc  = ( ng+1 )//2 + INT_GHOST
+      fa   = snap.father[gids]
+      ufa, inv = np.unique( fa, return_inverse=True )
+
+#     refine the fathers with ghost zones dimension by dimension, which drops INT_GHOST coarse cells on each side
+      fine = self.fill( field, ufa, ngc )
+      for axis in ( 3, 2, 1 ):
+         fine = _refine( fine, axis, self.monotonic )
+
+#     extract the sons, where the fine cell 0 of the refined fathers is the coarse cell INT_GHOST-ngc
+      scale = int( snap.key_info["CellScale"][lv] )
+      off   = ( snap.corner[gids] - snap.corner[fa] )//( ps*scale )
+      start = off*ps - ng + 2*( ngc-INT_GHOST )
+      L     = ps + 2*ng
+      out   = np.empty( (len(gids), L, L, L), dtype=np.float64 )
+      for ( ox, oy, oz ) in np.ndindex( 2, 2, 2 ):
+         mask = np.all( off == (ox, oy, oz), axis=1 )
+         if not mask.any():  continue
+         x0, y0, z0 = start[ mask ][0]
+         out[mask] = fine[ inv[mask], z0:z0+L, y0:y0+L, x0:x0+L ]
+      return out
+
+
+
+class StencilCache():
+   def __init__( self, block, order=2, monotonic=False ):
+      """
+      Ghost zones, gradients, and Laplacians of the fields of a gamer_reduce.Block, computed on first access.
+      """
+      if order not in NGHOST:  raise ValueError( "unsupported stencil order %d (%s) !!"%(order, list(NGHOST)) )
+      self.block = block
+      self.order = order
+      self.ng    = NGHOST[order]
+      self.dh    = block.snap.cell_size[ block.snap.level[block.g0] ]
+      self.ghost = GhostZone( block.snap, block.h5file, monotonic )
+      self._ext  = {}
+      self._grad = {}
+      self._lap  = {}
+
+   def ext( self, field ):
+      if field not in self._ext:  self._ext[field] = self.ghost.fill( field, np.arange(self.block.g0, self.block.g1), self.ng )
+      return self._ext[field]
+
+   def grad( self, field ):
+      if field not in self._grad:  self._grad[field] = gradient( self.ext(field), self.ng, self.dh, self.order )
+      return self._grad[field]
+
+   def lap( self, field ):
+      if field not in self._lap:  self._lap[field] = laplacian( self.ext(field), self.ng, self.dh, self.order )
+      return self._lap[field]
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def _refine( u, axis, monotonic=False ):
+   """
+   Conservative quartic interpolation of the cells of u along axis onto two fine cells each, dropping the
+   INT_GHOST cells on each side required by the interpolation. The fine cells are
+      u[i] -/+ ( 22*( u[i+1] - u[i-1] ) - 3*( u[i+2] - u[i-2] ) )/128
+   which are exact for the cell averages of quartic polynomials. When monotonic=True, the correction is limited
+   so that the fine cells stay between the neighboring coarse cells, and it vanishes at the local extrema.
+   """
+   n   = u.shape[axis]
+   ng  = INT_GHOST
+   def s( k ):
+      idx       = [ slice(None) ]*u.ndim
+      idx[axis] = slice( ng+k, n-ng+k )
+      return u[ tuple(idx) ]
+
+   u0 = s( 0 )
+   du = ( 22.0*( s(1) - s(-1) ) - 3.0*( s(2) - s(-2) ) )/128.0
+   if monotonic:
+      dl, dr = u0 - s(-1), s(1) - u0
+      lim    = np.where( dl*dr > 0.0, np.sign(dl)*np.minimum(np.abs(dl), np.abs(dr)), 0.0 )
+      du     = np.where( du*lim > 0.0, np.sign(du)*np.minimum(np.abs(du), np.abs(lim)), 0.0 )
+
+   out   = np.stack( [u0 - du, u0 + du], axis=axis+1 )
+   shape = list( u0.shape )
+   shape[axis] *= 2
+   return out.reshape( shape )
+
+
+def _shift( ext, ng, axis, k ):
+   # interior cells of ext shifted by k cells along axis (0/1/2 = x/y/z)
+   ps  = ext.shape[1] - 2*ng
+   idx = [ slice(None) ] + [ slice(ng, ng+ps) ]*3
+   idx[3-axis] = slice( ng+k, ng+k+ps )
+   return ext[ tuple(idx) ]
+
+
+def gradient( ext, ng, dh, order=2 ):
+   """
+   Gradient [gx, gy, gz] of the patches ext [N][PS+2*ng]^3 (see GhostZone.fill()) with the cell size dh.
+   """
+   out = []
+   for d in range( 3 ):
+      if order == 2:
+         g = ( _shift(ext, ng, d, 1) - _shift(ext, ng, d, -1) )/( 2.0*dh )
+      else:
+         g = ( 8.0*( _shift(ext, ng, d, 1) - _shift(ext, ng, d, -1) )
+                 - ( _shift(ext, ng, d, 2) - _shift(ext, ng, d, -2) ) )/( 12.0*dh )
+      out.append( g )
+   return out
+
+
+def laplacian( ext, ng, dh, order=2 ):
+   """
+   Laplacian of the patches ext [N][PS+2*ng]^3 (see GhostZone.fill()) with the cell size dh.
+   """
+   u   = _shift( ext, ng, 0, 0 )
+   out = np.zeros_like( u )
+   for d in range( 3 ):
+      if order == 2:
+         out += _shift( ext, ng, d, 1 ) + _shift( ext, ng, d, -1 ) - 2.0*u
+      else:
+         out += ( 16.0*( _shift(ext, ng, d, 1) + _shift(ext, ng, d, -1) )
+                     - ( _shift(ext, ng, d, 2) + _shift(ext, ng, d, -2) ) - 30.0*u )/12.0
+   return out/dh**2
+
+
+def is_stencil_field( name ):
+   if name in ELBDM_FIELDS:  return True
+   return name.endswith( tuple(_GRAD_SUFFIX) + ("_gradient_magnitude", "_laplacian") )
+
+
+def evaluate( block, name ):
+   """
+   Stencil field "name" of a gamer_reduce.Block with the shape [g1-g0][PS][PS][PS].
+   """
+   st = block.stencil
+   if name in ELBDM_FIELDS:  return ELBDM_FIELDS[name]( block )
+   for suffix, d in _GRAD_SUFFIX.items():
+      if name.endswith( suffix ):  return st.grad( name[:-len(suffix)] )[d]
+   if name.endswith( "_gradient_magnitude" ):
+      return np.sqrt( sum( g**2 for g in st.grad(name[:-len("_gradient_magnitude")]) ) )
+   if name.endswith( "_laplacian" ):
+      return st.lap( name[:-len("_laplacian")] )
+   raise KeyError( "unknown stencil field \"%s\" !!"%name )
+
+
+def elbdm_eta( snap ):
+   para = snap.input_para
+   if "ELBDM_Mass" not in para  or  "ELBDM_PlanckConst" not in para:
+      raise KeyError( "ELBDM_Mass and ELBDM_PlanckConst are not found in Info/InputPara of %s !!"%snap.filename )
+   return float( para["ELBDM_Mass"] )/float( para["ELBDM_PlanckConst"] )
+
+
+def _elbdm_mom( b, d ):
+   return ( b.grid("Real")*b.stencil.grad("Imag")[d] - b.grid("Imag")*b.stencil.grad("Real")[d] )/elbdm_eta( b.snap )
+
+
+def _elbdm_vel_qp( b, d ):
+   return ( b.grid("Real")*b.stencil.grad("Real")[d] + b.grid("Imag")*b.stencil.grad("Imag")[d] ) \
+          /( elbdm_eta(b.snap)*b.grid("Dens") )
+
+
+def _elbdm_ang_mom( b, d ):
+   # L = ( r - r_center ) x p
+   d1, d2 = ( d+1 )%3, ( d+2 )%3
+   xyz    = b.coords()
+   center = 0.5*b.snap.box_size
+   return ( xyz[d1] - center[d1] )*b.grid( "ElbdmMom"+"XYZ"[d2] ) - ( xyz[d2] - center[d2] )*b.grid( "ElbdmMom"+"XYZ"[d1] )
+
+
+def _elbdm_ekin( b ):
+   gr, gi = b.stencil.grad( "Real" ), b.stencil.grad( "Imag" )
+   return 0.5*sum( gr[d]**2 + gi[d]**2 for d in range(3) )/elbdm_eta( b.snap )**2
+
+
+def _derived_block( task ):
+   filename, g0, g1, names, order, monotonic = task
+   snap = load( filename )
+   with snap.open() as f:
+      block = Block( snap, f, g0, g1, order=order, monotonic=monotonic )
+      return g0, g1, { v: block.grid(v) for v in names }
+
+
+def derived_fields( filename, names, gids=None, order=2, monotonic=False, nproc=1, block_size=256 ):
+   """
+   Stream stencil (or any other) fields of the leaf patches of a snapshot.
+
+   filename   : string. Snapshot filename.
+   names      : list of field names (see the module docstring and gamer_reduce.DERIVED_FIELDS).
+   gids       : optional GIDs (default: all leaf patches). Non-leaf patches are excluded.
+   order      : int. Stencil order (2 or 4).
+   monotonic  : bool. Use min-mod limited slopes in the coarse-fine interpolation.
+   nproc      : int. Number of worker processes.
+   block_size : int. Maximum number of patches per batch.
+
+   Yield ( g0, g1, {name: array [g1-g0][PS][PS][PS]} ) for each batch of consecutive GIDs in the order of GIDs.
+   """
+   snap  = load( filename )
+   leaf  = snap.leaf_gids()
+   gids  = leaf if gids is None else np.intersect1d( gids, leaf )
+   tasks = [ (filename, g0, g1, list(names), order, monotonic) for g0, g1 in snap.blocks(gids, max_size=block_size) ]
+   for res in imap( _derived_block, tasks, nproc ):  yield res
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Conserved quantities and velocity dispersion of ELBDM snapshots '
+                                                 'computed with ghost-zone-aware stencils' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='../' )
+   parser.add_argument( '--order', action='store', required=False, type=int, dest='order',
+                        help='stencil order (2/4) [%(default)d]', default=2, choices=[2, 4] )
+   parser.add_argument( '--monotonic', action='store_true', required=False, dest='monotonic',
+                        help='min-mod limited coarse-fine interpolation [%(default)s]', default=False )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=1 )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   names    = [ 'Mass', 'MomX', 'MomY', 'MomZ', 'AngMomX', 'AngMomY', 'AngMomZ', 'Ekin' ]
+   reducers = [ Sum('Dens'), Sum('ElbdmMomX'), Sum('ElbdmMomY'), Sum('ElbdmMomZ'),
+                Sum('ElbdmAngMomX'), Sum('ElbdmAngMomY'), Sum('ElbdmAngMomZ'), Sum('ElbdmEkin') ] + \
+              [ Moments('ElbdmVel'+x, weight='Dens') for x in 'XYZ' ] + \
+              [ Moments('ElbdmVelQP'+x, weight='Dens') for x in 'XYZ' ]
+
+   for filename in snapshot_filenames( args.prefix, args.idx_start, args.idx_end, args.didx ):
+      snap = load( filename )
+      res  = reduce_snapshot( filename, reducers, nproc=args.nproc, order=args.order, monotonic=args.monotonic )
+      sigma_bk = np.sqrt( sum( r[2] for r in res[ 8:11] )/3.0 )
+      sigma_qp = np.sqrt( sum( r[2] for r in res[11:14] )/3.0 )
+
+      print( '' )
+      print( '-------------------------------------------------------------------' )
+      print( 'Data name   = ', filename )
+      print( 'Time        = % 14.7e'%snap.time )
+      print( '-------------------------------------------------------------------' )
+      for name, value in zip( names, res ):
+         print( '%-11s = % 14.7e'%( name+'_Psi', value ) )
+      print( 'velocity dispersion (bulk, thermal, total) = (% 14.7e, % 14.7e, % 14.7e)'%
+             ( sigma_bk, sigma_qp, np.sqrt(sigma_bk**2 + sigma_qp**2) ) )
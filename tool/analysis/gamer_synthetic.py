@@ -0,0 +1,562 @@
+"""
+Generate synthetic GAMER HDF5 snapshots for testing and benchmarking the analysis tools
+
+The output follows the layout of src/Output/Output_DumpData_Total_HDF5.cpp (FormatVersion 2508):
+   Info/KeyInfo                                      complete KeyInfo_t compound
+   Info/Makefile, Info/SymConst, Info/InputPara      the subset used by the Python tools
+   Tree/Corner (attr Cvt2Phy), LBIdx, Father, Son, Sibling, NPar
+   GridData/<field>                                  [GID][z][y][x]
+   Particle/<attribute>                              stored in the order of the host (leaf) patches
+
+The AMR hierarchy is built level by level. A patch is flagged when it or one of its siblings (a flag buffer of one
+patch) overlaps with one of the refinement spheres shrunk by a factor of two per level, and, as in GAMER, it is
+refined only when all its 26 siblings exist (proper nesting).
+Patches on each level are ordered by their load-balance index, which is the Hilbert curve index of
+src/LoadBalance/LB_HilbertCurve.cpp (LB_Corner2Index), and sons are stored in families of eight in the LocalID
+order of src/Tables/Table_02.cpp. The refinement spheres are either nested spheres around one center
+("nested") or randomly placed clumps with log-uniform radii ("clumps"). The box is assumed periodic.
+
+Grid fields are evaluated at the cell centers of all patches from an analytic model of Gaussian clumps in
+solid-body rotation: Dens, MomX/Y/Z, Engy, Pote, and ParDens (NGP deposit of the particles of each leaf patch)
+are supported, and any other field is filled with uniform random numbers in [0, 1). Particles are distributed
+among the leaf patches according to the gas mass and placed uniformly within each patch.
+
+Patches are generated in blocks by worker processes and written to preallocated datasets as they arrive, so the
+memory usage is set by the tree and the block size (-b) rather than by the file size. Use --dry_run to estimate
+the file size before generating large files.
+
+Example:
+   python gamer_synthetic.py Data_000000 --nx0 128 --max_level 4 --pattern clumps --nclump 20 --npar 1000000 -p 8
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import re
+import sys
+import time
+
+import h5py
+import numpy as np
+
+from gamer_snapshot import SIB_OFFSET, imap
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+FORMAT_VERSION = 2508
+NCONREF_MAX    = 60
+MODEL_ID       = { "HYDRO": 1, "ELBDM": 3, "PAR_ONLY": 4 }
+PTYPE_DARK_MATTER = 2
+GAMMA          = 5.0/3.0
+RNG_BLOCK      = 256               # number of patches per random-number stream
+
+# cell offsets of the eight sons of a patch in the order of LocalID (see src/Tables/Table_02.cpp)
+SON_OFFSET = np.array( [ (0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
+                         (1, 1, 0), (0, 1, 1), (1, 0, 1), (1, 1, 1) ], dtype=np.int64 )
+
+PAR_ATT_FLT = ( "ParMass", "ParPosX", "ParPosY", "ParPosZ", "ParVelX", "ParVelY", "ParVelZ" )
+PAR_ATT_INT = ( "ParType", "ParPUID" )
+FIELDS      = ( "Dens", "MomX", "MomY", "MomZ", "Engy", "Pote" )
+
+_tree  = {}   # tree and model shared with the forked workers
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def hilbert_c2i( coord, nbits ):
+   """
+   Hilbert curve index of the integer coordinates coord [N][3] (x, y, z) with nbits bits per axis.
+   Vectorized port of LB_Hilbert_c2i() in src/LoadBalance/LB_HilbertCurve.cpp, which returns identical indices.
+   """
+   ndims  = 3
+   coord  = np.asarray( coord, dtype=np.uint64 ).reshape( -1, ndims )
+   if ndims*nbits > 64:  raise ValueError( "ndims (%d) * nbits (%d) must not exceed 64 !!"%(ndims, nbits) )
+   if np.any( coord >= np.uint64(1 << nbits) ):  raise ValueError( "coordinates must be smaller than 2^%d !!"%nbits )
+   one    = np.uint64( 1 )
+   if nbits <= 1:
+      index = coord[:,0] | ( coord[:,1] << one ) | ( coord[:,2] << np.uint64(2) )
+
+   else:
+#     bit transpose: interleave the bits of the three coordinates (coords = x | y<<nbits | z<<2*nbits)
+      coords = np.zeros( len(coord), dtype=np.uint64 )
+      for d in range( ndims ):
+         for b in range( nbits ):
+            coords |= ( (coord[:,d] >> np.uint64(b)) & one ) << np.uint64( b*ndims + d )
+      coords ^= coords >> np.uint64( ndims )
+
+      nd_ones  = np.uint64( (1 << ndims) - 1 )
+      nthbits  = np.uint64( ((1 << (ndims*nbits)) - 1)//((1 << ndims) - 1) )
+      index    = np.zeros( len(coord), dtype=np.uint64 )
+      rotation = np.zeros( len(coord), dtype=np.uint64 )
+      flip     = np.zeros( len(coord), dtype=np.uint64 )
+      for b in range( ndims*(nbits-1), -1, -ndims ):
+         bits     = ( coords >> np.uint64(b) ) & nd_ones
+         bits     = flip ^ bits
+         bits     = ( (bits >> rotation) | (bits << (np.uint64(ndims) - rotation)) ) & nd_ones     # rotate right
+         index    = ( index << np.uint64(ndims) ) | bits
+         flip     = one << rotation
+#        rotation = (rotation + 1 + ffs(bits)) % ndims, with bits restricted to its lowest two bits
+         low      = bits & ( ~bits + one ) & np.uint64( 3 )
+         rotation = ( rotation + np.where(low == 0, 0, np.where(low == 1, 1, 2)).astype(np.uint64) + one )%np.uint64( ndims )
+      index ^= nthbits >> one
+
+   d = 1
+   while d < ndims*nbits:
+      index ^= index >> np.uint64( d )
+      d *= 2
+   return index.astype( np.int64 )
+
+
+def level_nbits( nx0, ps, lv ):
+   """
+   Number of bits per axis of the patch coordinates on level lv (amr->ResPower2[lv] - log2(PS1)).
+   """
+   nbits0 = int( np.ceil(np.log2(max(nx0))) )
+   return nbits0 + lv - int( np.log2(ps) )
+
+
+def spheres( pattern, box_size, center=None, radius=0.25, nclump=8, amplitude=100.0, seed=0 ):
+   """
+   Refinement spheres and density clumps ( centers [N][3], radii [N], amplitudes [N] ) in physical units.
+
+   pattern : "nested" (one sphere of radius radius*BoxSize at center) or "clumps" (nclump random spheres with
+             log-uniform radii between radius/8 and radius in units of BoxSize)
+   """
+   box_size = np.asarray( box_size, dtype=np.float64 )
+   scale    = box_size.min()
+   if pattern == "nested":
+      c = 0.5*box_size if center is None else np.asarray( center, dtype=np.float64 )
+      return c.reshape( 1, 3 ), np.array( [radius*scale] ), np.array( [amplitude] )
+   if pattern == "clumps":
+      rng = np.random.default_rng( seed )
+      c   = rng.random( (nclump, 3) )*box_size
+      r   = radius*scale*np.exp( rng.uniform(np.log(0.125), 0.0, nclump) )
+      a   = amplitude*( r/r.max() )**-1.0
+      return c, r, a
+   raise ValueError( "unsupported pattern \"%s\" (nested/clumps) !!"%pattern )
+
+
+def build_tree( nx0, ps, max_level, sph_center, sph_radius, box_size ):
+   """
+   Build the AMR hierarchy (see the module docstring).
+   Return a dictionary with Corner [N][3], LBIdx, Father, Son, Sibling [N][26], NPatch [NLevel], and Level.
+   """
+   nx0      = np.asarray( nx0, dtype=np.int64 )
+   nlevel   = max_level + 1
+   scale    = [ 2**(max_level-lv) for lv in range(nlevel) ]
+   boxscale = nx0*scale[0]
+   dh_min   = box_size[0]/boxscale[0]
+
+   coords, lbidx, father = [], [], []
+#  level 0: all root patches sorted by LBIdx
+   n0  = nx0//ps
+   c   = np.stack( np.meshgrid(*[np.arange(n) for n in n0], indexing="ij"), axis=-1 ).reshape( -1, 3 )
+   idx = hilbert_c2i( c, level_nbits(nx0, ps, 0) )
+   order = np.argsort( idx )
+   coords.append( c[order] )
+   lbidx .append( idx[order] )
+   father.append( np.full(len(c), -1, dtype=np.int64) )
+
+   sibling = []
+   offset  = 0
+   for lv in range( nlevel ):
+      c      = coords[lv]
+      if len( c ) == 0:  break
+      nb     = level_nbits( nx0, ps, lv )
+      npc    = n0*2**lv                                   # number of patches per axis on this level
+      sib    = np.empty( (len(c), 26), dtype=np.int64 )
+      sorter = np.argsort( lbidx[lv] )                    # sons are in the LocalID order within families
+      for s0 in range( 0, len(c), 1<<18 ):
+         cc   = c[s0:s0+(1<<18)]
+         nbr  = ( cc[:,None,:] + SIB_OFFSET[None,:,:] )%npc
+         key  = hilbert_c2i( nbr.reshape(-1, 3), nb )
+         pos  = sorter[ np.minimum(np.searchsorted(lbidx[lv], key, sorter=sorter), len(c)-1) ]
+         sib[s0:s0+len(cc)] = np.where( lbidx[lv][pos] == key, pos + offset, -1 ).reshape( -1, 26 )
+      sibling.append( sib )
+      if lv == max_level:  break
+
+#     refine the patches overlapping with the shrunk spheres when all their siblings exist
+      pw   = ps*scale[lv]*dh_min
+      le   = c*pw
+      flag = np.zeros( len(c), dtype=bool )
+      for cen, r in zip( sph_center, sph_radius ):
+         d    = np.clip( cen, le, le + pw ) - cen
+         d    = d - box_size*np.rint( d/box_size )
+         flag |= np.sum( d**2, axis=1 ) <= ( r/2**lv )**2
+#     flag buffer of one patch (FLAG_BUFFER_SIZE) so that small refined regions can be properly nested
+      nbr   = np.where( sib >= 0, sib - offset, len(c) )
+      flag |= np.any( np.append(flag, False)[nbr], axis=1 )
+      flag &= np.all( sib >= 0, axis=1 )
+      fa    = np.nonzero( flag )[0]
+#     sort the families by the LBIdx of their fathers, which equals the family LBIdx/8 on a Hilbert curve, so
+#     that each level is sorted by LBIdx up to the LocalID order within families
+      fa    = fa[ np.argsort(lbidx[lv][fa], kind="stable") ]
+      son_c = ( 2*c[fa][:,None,:] + SON_OFFSET[None,:,:] ).reshape( -1, 3 )
+      coords.append( son_c )
+      lbidx .append( hilbert_c2i(son_c, level_nbits(nx0, ps, lv+1)) )
+      father.append( np.repeat(fa + offset, 8) )
+      offset += len( c )
+
+   npatch = np.array( [ len(c) for c in coords ] + [ 0 ]*( nlevel-len(coords) ), dtype=np.int64 )
+   lv_off = np.concatenate( ([0], np.cumsum(npatch)) )
+   level  = np.repeat( np.arange(nlevel, dtype=np.int64), npatch )
+   corner = np.concatenate( [ c*ps*scale[lv] for lv, c in enumerate(coords) ] )
+   fath   = np.concatenate( father )
+   son    = np.full( len(corner), -1, dtype=np.int64 )
+   for lv in range( 1, len(coords) ):
+      g     = np.arange( lv_off[lv], lv_off[lv+1], 8 )
+      son[ fath[g] ] = g
+   return { "Corner" : corner.astype( np.int32 ),
+            "LBIdx"  : np.concatenate( lbidx ),
+            "Father" : fath.astype( np.int32 ),
+            "Son"    : son.astype( np.int32 ),
+            "Sibling": np.concatenate( sibling ).astype( np.int32 ),
+            "NPatch" : npatch,
+            "Level"  : level,
+            "Scale"  : np.array( scale, dtype=np.int64 ),
+            "BoxScale": boxscale }
+
+
+def clump_model( x, y, z, box_size, centers, radii, amp, omega=1.0 ):
+   """
+   Density, velocity (vx, vy, vz), and potential of Gaussian clumps in solid-body rotation about the z axis.
+   """
+   shape = np.broadcast_shapes( np.shape(x), np.shape(y), np.shape(z) )
+   dens  = np.ones ( shape )
+   pote  = np.zeros( shape )
+   vx    = np.zeros( shape )
+   vy    = np.zeros( shape )
+   for c, r, a in zip( centers, radii, amp ):
+      dx  = x - c[0];  dx -= box_size[0]*np.rint( dx/box_size[0] )
+      dy  = y - c[1];  dy -= box_size[1]*np.rint( dy/box_size[1] )
+      dz  = z - c[2];  dz -= box_size[2]*np.rint( dz/box_size[2] )
+      r2  = dx**2 + dy**2 + dz**2
+      g   = np.exp( -r2/r**2 )
+      dens += a*g
+      pote -= a*r**2/np.sqrt( r2 + r**2 )
+      vx  -= omega*g*dy
+      vy  += omega*g*dx
+   return dens, ( vx, vy, np.zeros(shape) ), pote
+
+
+def _cell_coords( g0, g1 ):
+   t    = _tree
+   lv   = t["Level"][g0:g1]
+   dh   = t["CellSize"][lv]
+   edge = t["Corner"][g0:g1]*t["Cvt2Phy"]
+   i    = np.arange( t["PS"] ) + 0.5
+   x    = edge[:,0,None,None,None] + i[None,None,None,:]*dh[:,None,None,None]
+   y    = edge[:,1,None,None,None] + i[None,None,:,None]*dh[:,None,None,None]
+   z    = edge[:,2,None,None,None] + i[None,:,None,None]*dh[:,None,None,None]
+   return x, y, z, dh
+
+
+def _block_task( task ):
+   g0, g1 = task
+   t      = _tree
+   ps     = t["PS"]
+   x, y, z, dh = _cell_coords( g0, g1 )
+   shape  = ( g1-g0, ps, ps, ps )
+
+#  random numbers are drawn per group of RNG_BLOCK patches so that the output does not depend on the block size
+   rngs   = [ (s0, min(s0+RNG_BLOCK, g1), np.random.default_rng([t["Seed"], s0])) for s0 in range(g0, g1, RNG_BLOCK) ]
+
+#  particles of the leaf patches, uniformly distributed within each patch
+   npar   = t["NPar"][g0:g1]
+   p0, p1 = int( t["ParOffset"][g0] ), int( t["ParOffset"][g1] )
+   par    = {}
+   if t["Particle"]:
+      n    = [ int(t["ParOffset"][s1] - t["ParOffset"][s0]) for s0, s1, _ in rngs ]
+      u    = np.concatenate( [ rng.random((m, 3))          for m, (_, _, rng) in zip(n, rngs) ] )
+      dv   = np.concatenate( [ rng.standard_normal((m, 3)) for m, (_, _, rng) in zip(n, rngs) ] )
+      host = np.repeat( np.arange(g1-g0), npar )
+      edge = t["Corner"][g0:g1][host]*t["Cvt2Phy"]
+      pw   = ( ps*dh )[host]
+      pos  = np.mod( edge + u*pw[:,None], t["BoxSize"] )
+      _, vel, _ = clump_model( pos[:,0], pos[:,1], pos[:,2], t["BoxSize"], *t["Model"] )
+      par["ParMass"] = np.full( len(host), t["ParMass"] )
+      for d, v in enumerate( "XYZ" ):
+         par["ParPos"+v] = pos[:,d]
+         par["ParVel"+v] = vel[d] + t["ParVelDisp"]*dv[:,d]
+      par["ParType"] = np.full( len(host), PTYPE_DARK_MATTER, dtype=np.int64 )
+      par["ParPUID"] = 1 + ( np.arange(p0, p1, dtype=np.int64)*t["PUIDStride"] )%max( t["NParTotal"], 1 )
+
+   grid = {}
+   need = set( t["Fields"] )
+   if need & { "Dens", "MomX", "MomY", "MomZ", "Engy", "Pote" }:
+      dens, vel, pote = clump_model( x, y, z, t["BoxSize"], *t["Model"] )
+   for v in t["Fields"]:
+      if   v == "Dens":  data = dens
+      elif v == "MomX":  data = dens*vel[0]
+      elif v == "MomY":  data = dens*vel[1]
+      elif v == "MomZ":  data = dens*vel[2]
+      elif v == "Engy":  data = dens*( t["Cs"]**2/(GAMMA*(GAMMA - 1.0)) + 0.5*(vel[0]**2 + vel[1]**2 + vel[2]**2) )
+      elif v == "Pote":  data = pote
+      elif v == "ParDens":
+         data = np.zeros( shape )
+         if par:
+            ijk  = np.floor( (pos - edge)/dh[host][:,None] ).astype( np.int64 ).clip( 0, ps-1 )
+            np.add.at( data, (host, ijk[:,2], ijk[:,1], ijk[:,0]), t["ParMass"]/dh[host]**3 )
+      else:
+         data = np.concatenate( [ rng.random((s1-s0, ps, ps, ps)) for s0, s1, rng in rngs ] )
+      grid[v] = data.astype( t["FloatType"] )
+
+   for v in PAR_ATT_FLT:
+      if v in par:  par[v] = par[v].astype( t["FloatTypePar"] )
+   return g0, g1, p0, p1, grid, par
+
+
+def key_info_dtype( nlevel, model, gravity, particle ):
+   """
+   Compound type of Info/KeyInfo in the field order of KeyInfo_t (see FillIn_KeyInfo()).
+   """
+   vstr = h5py.string_dtype()
+   dt   = [ ("FormatVersion", "i4"), ("Model", "i4"), ("Float8", "i4"), ("Gravity", "i4"), ("Particle", "i4"),
+            ("NLevel", "i4"), ("NCompFluid", "i4"), ("NCompPassive", "i4"), ("PatchSize", "i4"), ("DumpID", "i4"),
+            ("NX0", "i4", (3,)), ("BoxScale", "i4", (3,)), ("NPatch", "i4", (nlevel,)), ("CellScale", "i4", (nlevel,)) ]
+   if model == "HYDRO":
+      dt += [ ("Magnetohydrodynamics", "i4"), ("SRHydrodynamics", "i4"), ("CosmicRay", "i4") ]
+   dt  += [ ("Step", "i8"), ("AdvanceCounter", "i8", (nlevel,)), ("NFieldStored", "i4"), ("NMagStored", "i4") ]
+   if particle:
+      dt += [ ("Par_NPar", "i8"), ("Par_NextPUID", "i8"), ("Par_NAttFltStored", "i4"), ("Par_NAttIntStored", "i4"),
+              ("Float8_Par", "i4"), ("Int8_Par", "i4") ]
+   dt  += [ ("BoxSize", "f8", (3,)), ("Time", "f8", (nlevel,)), ("CellSize", "f8", (nlevel,)),
+            ("dTime_AllLv", "f8", (nlevel,)) ]
+   if gravity:
+      dt += [ ("AveDens_Init", "f8") ]
+   dt  += [ ("CodeVersion", vstr), ("DumpWallTime", vstr), ("GitBranch", vstr), ("GitCommit", vstr),
+            ("UniqueDataID", "i8"), ("ConRef", "f8", (1+NCONREF_MAX,)) ]
+   return np.dtype( dt )
+
+
+def _scalar_compound( values ):
+   # Python ints are stored as C int as in the structures of include/HDF5_Typedef.h
+   values = { k: np.int32(v) if isinstance(v, int) else v for k, v in values.items() }
+   dt  = np.dtype( [ (k, np.asarray(v).dtype, np.shape(v)) for k, v in values.items() ] )
+   out = np.zeros( (), dtype=dt )
+   for k, v in values.items():  out[k] = v
+   return out
+
+
+def estimate_size( npatch, ps, nfield, npar, float8=False, float8_par=False ):
+   """
+   Approximate file size in bytes.
+   """
+   npatch = int( np.sum(npatch) )
+   tree   = npatch*( 3*4 + 8 + 4 + 4 + 26*4 + 4 )
+   grid   = npatch*ps**3*nfield*( 8 if float8 else 4 )
+   par    = npar*( len(PAR_ATT_FLT)*(8 if float8_par else 4) + len(PAR_ATT_INT)*8 )
+   return tree + grid + par
+
+
+def generate( filename, nx0=64, box_size=1.0, ps=8, max_level=2, nlevel=None, pattern="nested", center=None,
+              radius=0.25, nclump=8, amplitude=100.0, fields=FIELDS, npar=0, par_vel_disp=0.1, float8=False,
+              float8_par=False, sim_time=0.0, step=0, dump_id=0, comoving=False, seed=0, nproc=1, block=1024,
+              dry_run=False ):
+   """
+   Generate a synthetic snapshot (see the module docstring).
+
+   nx0      : number of root-level cells along each axis (int or [3]), a multiple of ps
+   box_size : box size along x; the other sides follow the aspect ratio of nx0
+   nlevel   : NLEVEL of the snapshot (>= max_level+1; default max_level+1)
+   fields   : grid fields
+   npar     : total number of particles (0 for no particles)
+   sim_time : Time[] of all levels (scale factor in comoving runs)
+   dry_run  : only build the tree and return the estimated size
+
+   Return ( NPatch of each level, file size in bytes ).
+   """
+   nx0  = np.broadcast_to( np.asarray(nx0, dtype=np.int64), 3 ).copy()
+   if np.any( nx0%ps ):  raise ValueError( "nx0 (%s) must be a multiple of the patch size (%d) !!"%(nx0, ps) )
+   if ps & ( ps-1 ):     raise ValueError( "patch size (%d) must be a power of two !!"%ps )
+   if nlevel is None:    nlevel = max_level + 1
+   if nlevel < max_level+1:  raise ValueError( "nlevel (%d) must be > max_level (%d) !!"%(nlevel, max_level) )
+   fields = list( fields )
+
+   box    = box_size*nx0/nx0[0]
+   model  = spheres( pattern, box, center=center, radius=radius, nclump=nclump, amplitude=amplitude, seed=seed )
+   tree   = build_tree( nx0, ps, max_level, model[0], model[1], box )
+   npatch = np.zeros( nlevel, dtype=np.int64 )
+   npatch[:len(tree["NPatch"])] = tree["NPatch"]
+   nall   = int( npatch.sum() )
+   scale  = np.array( [ 2**(nlevel-1-lv) for lv in range(nlevel) ], dtype=np.int64 )
+   corner = tree["Corner"].astype( np.int64 )*2**( nlevel-1-max_level )
+   dh     = box[0]/nx0[0]/2.0**np.arange( nlevel )
+   size   = estimate_size( npatch, ps, len(fields), npar, float8, float8_par )
+   if dry_run:  return npatch, size
+
+#  particle counts of the leaf patches weighted by the gas mass at the patch centers
+   leaf   = tree["Son"] == -1
+   npar_p = np.zeros( nall, dtype=np.int64 )
+   pmass  = 0.0
+   if npar > 0:
+      pw     = ps*dh[ tree["Level"] ]
+      ctr    = corner*dh[-1] + 0.5*pw[:,None]
+      dens, _, _ = clump_model( ctr[:,0], ctr[:,1], ctr[:,2], box, *model )
+      w      = np.where( leaf, dens*pw**3, 0.0 )
+      npar_p = np.random.default_rng( [seed, 1] ).multinomial( npar, w/w.sum() )
+      pmass  = w.sum()/npar
+   stride = 1
+   if npar > 1:
+      stride = int( 0.6180339887*npar ) | 1
+      while np.gcd( stride, npar ) != 1:  stride += 2
+
+   ftype  = np.float64 if float8     else np.float32
+   ptype  = np.float64 if float8_par else np.float32
+   _tree.update( { "Corner": corner, "Level": tree["Level"], "CellSize": dh, "Cvt2Phy": dh[-1], "PS": ps,
+                   "BoxSize": box, "Model": model, "Fields": fields, "FloatType": ftype, "FloatTypePar": ptype,
+                   "Particle": npar > 0, "NPar": npar_p, "ParOffset": np.concatenate(([0], np.cumsum(npar_p))),
+                   "ParMass": pmass, "ParVelDisp": par_vel_disp, "NParTotal": npar, "PUIDStride": stride,
+                   "Seed": seed, "Cs": 1.0 } )
+
+   gravity  = "Pote" in fields  or  npar > 0
+   key = np.zeros( (), dtype=key_info_dtype(nlevel, "HYDRO", gravity, npar > 0) )
+   key["FormatVersion"] = FORMAT_VERSION
+   key["Model"]         = MODEL_ID["HYDRO"]
+   key["Float8"]        = int( float8 )
+   key["Gravity"]       = int( gravity )
+   key["Particle"]      = int( npar > 0 )
+   key["NLevel"]        = nlevel
+   key["NCompFluid"]    = 5
+   key["PatchSize"]     = ps
+   key["DumpID"]        = dump_id
+   key["NX0"]           = nx0
+   key["BoxScale"]      = nx0*scale[0]
+   key["NPatch"]        = npatch
+   key["CellScale"]     = scale
+   key["Step"]          = step
+   key["NFieldStored"]  = len( fields )
+   if npar > 0:
+      key["Par_NPar"]          = npar
+      key["Par_NextPUID"]      = npar + 1
+      key["Par_NAttFltStored"] = len( PAR_ATT_FLT )
+      key["Par_NAttIntStored"] = len( PAR_ATT_INT )
+      key["Float8_Par"]        = int( float8_par )
+      key["Int8_Par"]          = 1
+   key["BoxSize"]       = box
+   key["Time"]          = sim_time
+   key["CellSize"]      = dh
+   if gravity:  key["AveDens_Init"] = 1.0
+   key["CodeVersion"]   = "gamer_synthetic"
+   key["DumpWallTime"]  = time.ctime()
+   key["GitBranch"]     = ""
+   key["GitCommit"]     = ""
+   key["UniqueDataID"]  = seed
+
+   makefile   = { "Model": MODEL_ID["HYDRO"], "Gravity": int(gravity), "Comoving": int(comoving),
+                  "Particle": int(npar > 0), "NLevel": nlevel, "MaxPatch": max(nall, 1), "Float8": int(float8),
+                  "MassiveParticles": int(npar > 0), "Tracer": 0, "Float8_Par": int(float8_par), "Int8_Par": 1 }
+   sym_const  = { "NCompFluid": 5, "NCompPassive": 0, "PatchSize": ps }
+   input_para = { "BoxSize": box[0], "NX0_Tot": nx0.astype(np.int32), "Opt__Unit": 0, "Unit_L": 1.0, "Unit_M": 1.0,
+                  "Unit_T": 1.0, "Unit_V": 1.0, "Unit_D": 1.0, "Unit_E": 1.0, "Unit_P": 1.0 }
+   if comoving:  input_para.update( { "A_Init": sim_time, "OmegaM0": 0.3, "Hubble0": 0.7 } )
+
+   with h5py.File( filename, "w" ) as f:
+      f.create_dataset( "Info/KeyInfo",   data=key )
+      f.create_dataset( "Info/Makefile",  data=_scalar_compound(makefile) )
+      f.create_dataset( "Info/SymConst",  data=_scalar_compound(sym_const) )
+      f.create_dataset( "Info/InputPara", data=_scalar_compound(input_para) )
+
+      f.create_dataset( "Tree/Corner", data=corner.astype(np.int32) )
+      f["Tree/Corner"].attrs["Cvt2Phy"] = dh[-1]
+      f.create_dataset( "Tree/LBIdx",   data=tree["LBIdx"].astype(np.int64) )
+      f.create_dataset( "Tree/Father",  data=tree["Father"] )
+      f.create_dataset( "Tree/Son",     data=tree["Son"] )
+      f.create_dataset( "Tree/Sibling", data=tree["Sibling"] )
+      if npar > 0:  f.create_dataset( "Tree/NPar", data=npar_p.astype(np.int32) )
+
+      dset_grid = { v: f.create_dataset("GridData/"+v, (nall, ps, ps, ps), dtype=ftype) for v in fields }
+      dset_par  = {}
+      if npar > 0:
+         for v in PAR_ATT_FLT:  dset_par[v] = f.create_dataset( "Particle/"+v, (npar,), dtype=ptype )
+         for v in PAR_ATT_INT:  dset_par[v] = f.create_dataset( "Particle/"+v, (npar,), dtype=np.int64 )
+
+      block = max( 1, -(-block//RNG_BLOCK) )*RNG_BLOCK
+      tasks = [ (g0, min(g0+block, nall)) for g0 in range(0, nall, block) ]
+      for g0, g1, p0, p1, grid, par in imap( _block_task, tasks, nproc ):
+         for v, data in grid.items():  dset_grid[v][g0:g1] = data
+         for v, data in par.items():   dset_par [v][p0:p1] = data
+
+   _tree.clear()
+   return npatch, os.path.getsize( filename )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Generate a synthetic GAMER HDF5 snapshot' )
+
+   parser.add_argument( 'output', type=str, help='output file (e.g., Data_000000)' )
+   parser.add_argument( '--nx0', action='store', required=False, type=int, dest='nx0', nargs='+',
+                        help='number of root-level cells along each axis (1 or 3 values) [%(default)s]', default=[64] )
+   parser.add_argument( '--box', action='store', required=False, type=float, dest='box_size',
+                        help='box size along x [%(default)g]', default=1.0 )
+   parser.add_argument( '--ps', action='store', required=False, type=int, dest='ps',
+                        help='patch size [%(default)d]', default=8 )
+   parser.add_argument( '--max_level', action='store', required=False, type=int, dest='max_level',
+                        help='maximum refinement level [%(default)d]', default=2 )
+   parser.add_argument( '--nlevel', action='store', required=False, type=int, dest='nlevel',
+                        help='NLEVEL of the snapshot [max_level+1]', default=None )
+   parser.add_argument( '--pattern', action='store', required=False, type=str, dest='pattern',
+                        help='refinement pattern (nested/clumps) [%(default)s]', default='nested', choices=['nested', 'clumps'] )
+   parser.add_argument( '--center', action='store', required=False, type=float, dest='center', nargs=3,
+                        help='center of the nested spheres [box center]', default=None )
+   parser.add_argument( '--radius', action='store', required=False, type=float, dest='radius',
+                        help='radius of the (largest) sphere in units of the box size [%(default)g]', default=0.25 )
+   parser.add_argument( '--nclump', action='store', required=False, type=int, dest='nclump',
+                        help='number of clumps [%(default)d]', default=8 )
+   parser.add_argument( '--fields', action='store', required=False, type=str, dest='fields', nargs='+',
+                        help='grid fields [%(default)s]', default=list(FIELDS) )
+   parser.add_argument( '--npar', action='store', required=False, type=int, dest='npar',
+                        help='number of particles [%(default)d]', default=0 )
+   parser.add_argument( '--float8', action='store_true', required=False, dest='float8',
+                        help='store the grid fields in double precision [%(default)s]', default=False )
+   parser.add_argument( '--float8_par', action='store_true', required=False, dest='float8_par',
+                        help='store the particle attributes in double precision [%(default)s]', default=False )
+   parser.add_argument( '--time', action='store', required=False, type=float, dest='sim_time',
+                        help='simulation time (scale factor with --comoving) [%(default)g]', default=0.0 )
+   parser.add_argument( '--comoving', action='store_true', required=False, dest='comoving',
+                        help='mark the snapshot as a comoving run [%(default)s]', default=False )
+   parser.add_argument( '--dump_id', action='store', required=False, type=int, dest='dump_id',
+                        help='DumpID [digits at the end of the output name]', default=None )
+   parser.add_argument( '--seed', action='store', required=False, type=int, dest='seed',
+                        help='random seed [%(default)d]', default=0 )
+   parser.add_argument( '-b', action='store', required=False, type=int, dest='block',
+                        help='number of patches per block (rounded up to a multiple of %d) [%%(default)d]'%RNG_BLOCK, default=1024 )
+   parser.add_argument( '--dry_run', action='store_true', required=False, dest='dry_run',
+                        help='only print the number of patches and the estimated file size [%(default)s]', default=False )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   if args.dump_id is None:
+      m = re.search( r'(\d+)$', args.output )
+      args.dump_id = int( m.group(1) ) if m else 0
+
+   t0 = time.time()
+   npatch, size = generate( args.output, nx0=args.nx0 if len(args.nx0) == 3 else args.nx0[0], box_size=args.box_size,
+                            ps=args.ps, max_level=args.max_level, nlevel=args.nlevel, pattern=args.pattern,
+                            center=args.center, radius=args.radius, nclump=args.nclump, fields=args.fields,
+                            npar=args.npar, float8=args.float8, float8_par=args.float8_par, sim_time=args.sim_time,
+                            comoving=args.comoving, dump_id=args.dump_id, seed=args.seed, nproc=args.nproc,
+                            block=args.block, dry_run=args.dry_run )
+   print( 'NPatch = %s'%[ int(n) for n in npatch ] )
+   print( '%s size = %.3f GB%s'%( 'Estimated' if args.dry_run else args.output, size/1024**3,
+                                 '' if args.dry_run else ' (%.1f s)'%(time.time() - t0) ) )
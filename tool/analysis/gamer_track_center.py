@@ -0,0 +1,222 @@
+"""
+Track the center of an object across a series of GAMER HDF5 snapshots
+
+Each snapshot is searched only within a sphere of radius R (-r) around the center found in the previous snapshot
+(warm start), so that only the patches overlapping with this sphere are read. Within the sphere, the density
+maxima and potential minimum are found with gamer_reduce.py, and the center is refined by the shrinking-sphere
+method over both the cells (mass = Dens*dV) and the particles (ParMass): starting from the previous center with
+radius R, the center of mass of all cells and particles within the sphere is computed and the radius is reduced
+by a constant factor until it reaches the minimum radius or the sphere contains too few elements.
+
+The output has the same columns as the Record__Center file of GAMER (src/Auxiliary/Aux_Record_Center.cpp), with
+the shrinking-sphere center in place of the center of mass (CoM_x/y/z), so that the existing analysis scripts
+reading Record__Center can use it directly:
+   Time  Step  MaxDens  MaxDens_x/y/z  [MaxParDens  MaxParDens_x/y/z  MaxTotalDens  MaxTotalDens_x/y/z]
+   [MinPote  MinPote_x/y/z]  Final_NIter  Final_dR  CoM_x/y/z
+
+Example:
+   python gamer_track_center.py -s 0 -e 100 -r 0.05 -c 0.5 0.5 0.5 -p 8
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from gamer_reduce import PAR_POS, ArgMax, ArgMin, Block, reduce_snapshot
+from gamer_snapshot import load, parallel_map, snapshot_filenames
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def _gather_task( task ):
+   # cells and particles of the given blocks within the sphere, with positions relative to the center
+   filename, blocks, center, radius, use_gas, use_particles = task
+   snap = load( filename )
+   box  = snap.box_size
+   pos, mass = [], []
+   with snap.open() as f:
+      for g0, g1 in blocks:
+         block = Block( snap, f, g0, g1 )
+         if use_gas:
+            d = np.stack( [ (c - center[i]).ravel() for i, c in enumerate(block.coords()) ], axis=1 )
+            d = d - box*np.rint( d/box )
+            m = ( block.grid("Dens")*block.dv ).ravel()
+            k = np.sum( d**2, axis=1 ) <= radius**2
+            pos.append( d[k] )
+            mass.append( m[k] )
+         if use_particles  and  block.npar > 0:
+            d = np.stack( [ block.par(v) - center[i] for i, v in enumerate(PAR_POS) ], axis=1 )
+            d = d - box*np.rint( d/box )
+            k = np.sum( d**2, axis=1 ) <= radius**2
+            pos.append( d[k] )
+            mass.append( block.par("ParMass")[k] )
+   if not pos:  return np.zeros( (0, 3) ), np.zeros( 0 )
+   return np.concatenate( pos ), np.concatenate( mass )
+
+
+def shrinking_sphere( filename, center, radius, min_radius, shrink=0.9, min_element=64, use_gas=True,
+                      use_particles=True, nproc=1 ):
+   """
+   Shrinking-sphere center starting from the sphere ( center, radius ).
+
+   min_radius  : stop when the radius drops below this value
+   shrink      : radius reduction factor per iteration
+   min_element : stop when the sphere contains fewer cells + particles
+
+   Return ( center, number of iterations, shift of the center in the last iteration ).
+   """
+   snap   = load( filename )
+   center = np.asarray( center, dtype=np.float64 )
+   gids   = snap.patches_in_sphere( center, radius, leaf_only=True )
+   blocks = snap.blocks( gids, max_size=1024 )
+   ntask  = max( 1, min(len(blocks), 4*(nproc or 1)) )
+   tasks  = [ (filename, blocks[t::ntask], center, radius, use_gas, use_particles) for t in range(ntask) ]
+   res    = parallel_map( _gather_task, tasks, nproc, ordered=False )
+   pos    = np.concatenate( [ r[0] for r in res ] )
+   mass   = np.concatenate( [ r[1] for r in res ] )
+
+   c      = np.zeros( 3 )
+   r2     = np.sum( pos**2, axis=1 )
+   niter  = 0
+   dr     = 0.0
+   while radius >= min_radius:
+      inside = r2 <= radius**2
+      if inside.sum() < min_element  or  mass[inside].sum() <= 0.0:  break
+      c_new  = np.average( pos[inside], axis=0, weights=mass[inside] )
+      dr     = float( np.sqrt(np.sum((c_new - c)**2)) )
+      c      = c_new
+      r2     = np.sum( (pos - c)**2, axis=1 )
+      radius *= shrink
+      niter += 1
+
+   return np.mod( center + c, snap.box_size ), niter, dr
+
+
+def track_center( filenames, center, radius, min_radius=None, shrink=0.9, min_element=64, nproc=1 ):
+   """
+   Track the center through a time-ordered list of snapshots. The first snapshot is searched over the whole box
+   when center is None.
+
+   Return a list of ( snapshot, {extremum name: (value, x, y, z)}, (center, niter, dR) ).
+   """
+   records = []
+   for filename in filenames:
+      snap = load( filename )
+      if min_radius is None:  min_radius = 2.0*snap.cell_size[ snap.max_level ]
+      if center is None:
+         gids  = None
+         start = 0.5*snap.box_size
+         r0    = 0.5*np.sqrt( np.sum(snap.box_size**2) )
+      else:
+         gids  = snap.patches_in_sphere( center, radius, leaf_only=True )
+         start = center
+         r0    = radius
+
+      has_gas  = "Dens" in snap.fields
+      reducers = {}
+      if has_gas:                                 reducers["MaxDens"]      = ArgMax( "Dens" )
+      if snap.particle  and  "ParDens" in snap.fields:
+                                                  reducers["MaxParDens"]   = ArgMax( "ParDens" )
+      if snap.particle  and  ( "TotalDens" in snap.fields  or  ("ParDens" in snap.fields  and  has_gas) ):
+                                                  reducers["MaxTotalDens"] = ArgMax( "TotalDens" if "TotalDens" in snap.fields else "TotDens" )
+      if "Pote" in snap.fields:                   reducers["MinPote"]      = ArgMin( "Pote" )
+      extrema = dict( zip(reducers, reduce_snapshot(filename, list(reducers.values()), nproc=nproc, gids=gids)) )
+
+#     start the first snapshot from the density peak when no initial center is given
+      if center is None:
+         for key in ( "MaxTotalDens", "MaxDens", "MaxParDens" ):
+            if extrema.get( key ) is not None:
+               start = np.array( extrema[key][1:] )
+               r0    = radius
+               break
+
+      result = shrinking_sphere( filename, start, r0, min_radius, shrink=shrink, min_element=min_element,
+                                 use_gas=has_gas, use_particles=snap.particle, nproc=nproc )
+      center = result[0]
+      records.append( (snap, extrema, result) )
+      print( '%s : center = (%14.7e, %14.7e, %14.7e), NIter = %d'%( filename, center[0], center[1], center[2], result[1] ) )
+
+   return records
+
+
+def write_record( records, filename ):
+   """
+   Write the tracked centers in the format of Record__Center.
+   """
+   if not records:  return
+   snap0    = records[0][0]
+   with_par = snap0.particle
+   with_pot = "Pote" in snap0.fields
+   nan4     = ( np.nan, )*4
+
+   with open( filename, "w" ) as f:
+      f.write( "#%19s  %10s  %14s  %14s  %14s  %14s"%( "Time", "Step", "MaxDens", "MaxDens_x", "MaxDens_y", "MaxDens_z" ) )
+      if with_par:
+         f.write( "  %14s  %14s  %14s  %14s  %14s  %14s  %14s  %14s"%(
+                  "MaxParDens", "MaxParDens_x", "MaxParDens_y", "MaxParDens_z",
+                  "MaxTotalDens", "MaxTotalDens_x", "MaxTotalDens_y", "MaxTotalDens_z" ) )
+      if with_pot:
+         f.write( "  %14s  %14s  %14s  %14s"%( "MinPote", "MinPote_x", "MinPote_y", "MinPote_z" ) )
+      f.write( "  %14s  %14s  %14s  %14s  %14s\n"%( "Final_NIter", "Final_dR", "CoM_x", "CoM_y", "CoM_z" ) )
+
+      for snap, extrema, ( center, niter, dr ) in records:
+         f.write( "%20.14e  %10ld  %14.7e  %14.7e  %14.7e  %14.7e"%( (snap.time, snap.step) + tuple(extrema.get("MaxDens") or nan4) ) )
+         if with_par:
+            f.write( "  %14.7e  %14.7e  %14.7e  %14.7e  %14.7e  %14.7e  %14.7e  %14.7e"%(
+                     tuple(extrema.get("MaxParDens") or nan4) + tuple(extrema.get("MaxTotalDens") or nan4) ) )
+         if with_pot:
+            f.write( "  %14.7e  %14.7e  %14.7e  %14.7e"%tuple( extrema.get("MinPote") or nan4 ) )
+         f.write( "  %14d  %14.7e  %14.7e  %14.7e  %14.7e\n"%( (niter, dr) + tuple(center) ) )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Track the center of an object across snapshots' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-r', action='store', required=True,  type=float, dest='radius',
+                        help='search radius around the previous center' )
+   parser.add_argument( '-c', action='store', required=False, type=float, dest='center', nargs=3,
+                        help='initial center [density peak of the first snapshot]', default=None )
+   parser.add_argument( '--min_radius', action='store', required=False, type=float, dest='min_radius',
+                        help='minimum radius of the shrinking sphere [two finest cells]', default=None )
+   parser.add_argument( '--shrink', action='store', required=False, type=float, dest='shrink',
+                        help='shrinking factor per iteration [%(default)g]', default=0.9 )
+   parser.add_argument( '--min_element', action='store', required=False, type=int, dest='min_element',
+                        help='minimum number of cells and particles in the sphere [%(default)d]', default=64 )
+   parser.add_argument( '-o', action='store', required=False, type=str, dest='output',
+                        help='output file [%(default)s]', default='Record__Center_Track' )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   filenames = [ f for f in snapshot_filenames(args.prefix, args.idx_start, args.idx_end, args.didx) if os.path.isfile(f) ]
+   records   = track_center( filenames, args.center, args.radius, min_radius=args.min_radius, shrink=args.shrink,
+                             min_element=args.min_element, nproc=args.nproc )
+   write_record( records, args.output )
+   print( '\n%s written (%d snapshots)'%( args.output, len(records) ) )
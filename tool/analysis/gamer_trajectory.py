@@ -0,0 +1,229 @@
+"""
+Particle trajectories across GAMER HDF5 snapshots
+
+The particles of a snapshot are stored in the order of their host patches, so the array index of a particle
+changes between snapshots and particles must be identified by their unique ID (Particle/ParPUID). For each
+snapshot, PUIDIndex sorts the PUIDs once (argsort) so that any number of tracked particles can be located with
+a single searchsorted call, and every attribute is then gathered with one vectorized fancy-indexing pass per
+chunk of particles.
+
+The trajectories are stored in an HDF5 file ("trajectory store") with
+   PUID           [NTrack]          IDs of the tracked particles
+   Time, DumpID   [NTime]           physical time and dump ID of each record
+   <attribute>    [NTrack][NTime]   one dataset per particle attribute (NaN for particles not found)
+All time-dependent datasets are chunked and extendable along the time axis, so the store can be updated
+incrementally as new snapshots arrive (snapshots already recorded are skipped).
+
+Example:
+   python gamer_trajectory.py -s 0 -e 100 -u 1 25 1024 -a ParPosX ParPosY ParPosZ ParVelX -p 8
+   store = TrajectoryStore( "Trajectory.h5" );   x = store.read( "ParPosX" )
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import os
+import sys
+
+import h5py
+import numpy as np
+
+from gamer_snapshot import load, parallel_map, read_key_info, snapshot_filenames
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+DEFAULT_ATTS = [ "ParPosX", "ParPosY", "ParPosZ", "ParVelX", "ParVelY", "ParVelZ" ]
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class PUIDIndex():
+   """
+   Sorted index of the particle unique IDs of one snapshot.
+   """
+
+   def __init__( self, puid ):
+      self.order  = np.argsort( puid, kind="stable" )
+      self.sorted = puid[ self.order ]
+
+   def lookup( self, ids ):
+      """
+      Return the array indices of the particles with the given PUIDs (-1 for IDs not found).
+      """
+      ids  = np.asarray( ids, dtype=self.sorted.dtype )
+      pos  = np.searchsorted( self.sorted, ids )
+      pos  = np.minimum( pos, max(len(self.sorted)-1, 0) )
+      if len( self.sorted ) == 0:  return np.full( len(ids), -1, dtype=np.int64 )
+      return np.where( self.sorted[pos] == ids, self.order[pos], -1 ).astype( np.int64 )
+
+
+class TrajectoryStore():
+   """
+   Extendable HDF5 store of particle trajectories (see the module docstring for the layout).
+   """
+
+   def __init__( self, filename, puid=None, atts=None, chunk_time=64 ):
+      """
+      filename   : HDF5 file. A new store is created when it does not exist, in which case puid and atts are required.
+      puid       : PUIDs of the particles to track
+      atts       : particle attributes to record
+      chunk_time : number of records per HDF5 chunk along the time axis
+      """
+      self.filename = filename
+      if os.path.isfile( filename ):
+         with h5py.File( filename, "r" ) as f:
+            self.puid = f["PUID"][:]
+            self.atts = [ v.decode() if isinstance(v, bytes) else v for v in f.attrs["Attributes"] ]
+         if puid is not None  and  not np.array_equal( np.asarray(puid), self.puid ):
+            raise ValueError( "the PUIDs differ from those in the existing store \"%s\" !!"%filename )
+         if atts is not None  and  set(atts) != set(self.atts):
+            raise ValueError( "the attributes differ from those in the existing store \"%s\" !!"%filename )
+         return
+
+      if puid is None  or  atts is None:  raise ValueError( "puid and atts are required for a new store !!" )
+      self.puid = np.asarray( puid, dtype=np.int64 )
+      self.atts = list( atts )
+      ntrack    = len( self.puid )
+      with h5py.File( filename, "w" ) as f:
+         f.attrs["Attributes"] = self.atts
+         f.create_dataset( "PUID", data=self.puid )
+         f.create_dataset( "Time",   shape=(0,), maxshape=(None,), chunks=(chunk_time,), dtype=np.float64 )
+         f.create_dataset( "DumpID", shape=(0,), maxshape=(None,), chunks=(chunk_time,), dtype=np.int64 )
+         for v in self.atts:
+            f.create_dataset( v, shape=(ntrack, 0), maxshape=(ntrack, None), dtype=np.float64, fillvalue=np.nan,
+                              chunks=(max(1, min(ntrack, 1024)), chunk_time) )
+
+   def dump_ids( self ):
+      with h5py.File( self.filename, "r" ) as f:  return f["DumpID"][:]
+
+   def append( self, records ):
+      """
+      Append a list of records ( time, dump ID, {attribute: values [NTrack]} ) sorted by time.
+      """
+      if not records:  return
+      with h5py.File( self.filename, "a" ) as f:
+         nt  = f["Time"].shape[0]
+         nr  = len( records )
+         f["Time"  ].resize( (nt+nr,) )
+         f["DumpID"].resize( (nt+nr,) )
+         f["Time"  ][nt:] = [ r[0] for r in records ]
+         f["DumpID"][nt:] = [ r[1] for r in records ]
+         for v in self.atts:
+            f[v].resize( (len(self.puid), nt+nr) )
+            f[v][:, nt:] = np.stack( [ r[2][v] for r in records ], axis=1 )
+
+   def update( self, filenames, nproc=1, chunk=16777216 ):
+      """
+      Gather the tracked particles from the snapshots not yet recorded and append them in the order of time.
+      Only Info/KeyInfo of the recorded snapshots is read to check their DumpIDs. Return the number of new records.
+      """
+      done  = set( self.dump_ids().tolist() )
+      new   = [ (fn, self.puid, self.atts, chunk) for fn in filenames if int(read_key_info(fn)["DumpID"]) not in done ]
+      recs  = sorted( parallel_map(_gather_task, new, nproc, ordered=False), key=lambda r: (r[0], r[1]) )
+      if recs  and  len( self.dump_ids() ) > 0:
+         with h5py.File( self.filename, "r" ) as f:  t_last = f["Time"][-1]
+         if recs[0][0] < t_last:  print( "WARNING : appending records earlier than the last recorded time %13.7e !!"%t_last )
+      self.append( recs )
+      return len( recs )
+
+   def read( self, att ):
+      """
+      Return ( time [NTime], values [NTrack][NTime] ) of one attribute sorted by time.
+      """
+      with h5py.File( self.filename, "r" ) as f:
+         t     = f["Time"][:]
+         order = np.argsort( t, kind="stable" )
+         return t[order], f[att][:][:, order]
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def gather( filename, puid, atts, chunk=16777216 ):
+   """
+   Gather the attributes of the particles with the given PUIDs from one snapshot.
+   Return {attribute: float64 array [len(puid)]} with NaN for the particles not found.
+   """
+   snap  = load( filename )
+   with snap.open() as f:
+      par  = f["Particle"]
+      idx  = PUIDIndex( par["ParPUID"][:] ).lookup( puid )
+      out  = { v: np.full( len(puid), np.nan ) for v in atts }
+
+#     read the attributes chunk by chunk and pick the tracked particles
+      found = np.nonzero( idx >= 0 )[0]
+      found = found[ np.argsort(idx[found], kind="stable") ]
+      pidx  = idx[ found ]
+      npar  = par["ParPUID"].shape[0]
+      for s in range( 0, npar, chunk ):
+         i0, i1 = np.searchsorted( pidx, [s, min(s+chunk, npar)] )
+         if i0 == i1:  continue
+         e = min( s+chunk, npar, int(pidx[i1-1])+1 )
+         s = max( s, int(pidx[i0]) )
+         for v in atts:
+            out[v][ found[i0:i1] ] = par[v][s:e][ pidx[i0:i1]-s ]
+
+   return out
+
+
+def _gather_task( task ):
+   filename, puid, atts, chunk = task
+   snap = load( filename )
+   return snap.time, int( snap.key_info["DumpID"] ), gather( filename, puid, atts, chunk )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Track particles by their PUIDs across snapshots' )
+
+   parser.add_argument( '-s', action='store', required=True,  type=int, dest='idx_start',
+                        help='first data index' )
+   parser.add_argument( '-e', action='store', required=True,  type=int, dest='idx_end',
+                        help='last data index' )
+   parser.add_argument( '-d', action='store', required=False, type=int, dest='didx',
+                        help='delta data index [%(default)d]', default=1 )
+   parser.add_argument( '-i', action='store', required=False, type=str, dest='prefix',
+                        help='data path prefix [%(default)s]', default='./' )
+   parser.add_argument( '-u', action='store', required=False, type=int, dest='uids', nargs='+',
+                        help='PUIDs of the tracked particles (required for a new store)', default=None )
+   parser.add_argument( '--uid_file', action='store', required=False, type=str, dest='uid_file',
+                        help='text file with the PUIDs of the tracked particles [%(default)s]', default=None )
+   parser.add_argument( '-a', action='store', required=False, type=str, dest='atts', nargs='+',
+                        help='particle attributes [%(default)s]', default=DEFAULT_ATTS )
+   parser.add_argument( '-o', action='store', required=False, type=str, dest='output',
+                        help='trajectory store [%(default)s]', default='Trajectory.h5' )
+   parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                        help='number of processes [%(default)d]', default=os.cpu_count() )
+
+   args = parser.parse_args()
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   uids = args.uids
+   if args.uid_file is not None:  uids = np.loadtxt( args.uid_file, dtype=np.int64, ndmin=1 )
+
+   if os.path.isfile( args.output ):
+      store = TrajectoryStore( args.output, puid=uids )
+   else:
+      if uids is None:  raise ValueError( "PUIDs (-u or --uid_file) are required for a new store !!" )
+      store = TrajectoryStore( args.output, puid=uids, atts=args.atts )
+
+   filenames = [ f for f in snapshot_filenames(args.prefix, args.idx_start, args.idx_end, args.didx) if os.path.isfile(f) ]
+   nnew      = store.update( filenames, nproc=args.nproc )
+   print( '%d new records appended to %s (%d particles, %d records in total)'%( nnew, args.output, len(store.puid),
+                                                                                  len(store.dump_ids()) ) )
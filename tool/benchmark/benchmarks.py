@@ -0,0 +1,252 @@
+"""
+Benchmarks of the Python analysis and initial-condition tools
+
+The benchmarks follow the conventions of asv (airspeed velocity): each class is a benchmark group whose setup()
+prepares the inputs and whose time_<name>() methods are the timed benchmarks (teardown() is optional). Inputs are
+synthetic so that no simulation is required: snapshots are generated by tool/analysis/gamer_synthetic.py and
+UM_IC files are random wave functions, and both are cached in the data directory after the first use.
+
+The problem size is selected by the environment variable GAMER_BENCH_SIZE (small/medium/large, see SIZES) and the
+data directory by GAMER_BENCH_DATA (default: <tmp>/gamer_benchmark). Use run_benchmarks.py to run the benchmarks
+and to track the wall time and peak memory usage across commits.
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname( os.path.abspath(__file__) )
+ROOT_DIR  = os.path.dirname( os.path.dirname(BENCH_DIR) )
+sys.path.insert( 0, os.path.join(ROOT_DIR, "tool", "analysis") )
+
+import gamer_synthetic
+from gamer_halo_profile import halo_profiles
+from gamer_power_spectrum import particle_power_spectrum, power_spectrum
+from gamer_snapshot import Snapshot
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+# nx0/max_level/npar: synthetic snapshot; um_ic: UM_IC resolution; pk_level: level of the uniform grids
+SIZES = { "small" : { "nx0":  32, "max_level": 2, "npar":   100000, "um_ic":  64, "pk_level": 1 },
+          "medium": { "nx0":  64, "max_level": 3, "npar":  1000000, "um_ic": 128, "pk_level": 1 },
+          "large" : { "nx0": 128, "max_level": 4, "npar": 10000000, "um_ic": 256, "pk_level": 1 } }
+
+EXTRACT_PAR = os.path.join( ROOT_DIR, "tool", "analysis", "gamer_extract_particle_from_hdf5.py" )
+LSS_HYBRID  = os.path.join( ROOT_DIR, "example", "test_problem", "ELBDM", "LSS_Hybrid" )
+UM_RESCALE  = os.path.join( LSS_HYBRID, "elbdm_rescale_periodic_IC.py" )
+UM_CONVERT  = os.path.join( LSS_HYBRID, "elbdm_wave_to_hybrid_IC.py" )
+CONFIGURE   = os.path.join( ROOT_DIR, "src", "configure.py" )
+CONFIG_OPTS = [ "--machine=eureka_intel", "--model=HYDRO", "--gravity=true", "--fftw=FFTW3", "--particle=true",
+                "--hdf5=true", "--mpi=true" ]
+
+# run a script as __main__ and append its own peak RSS in bytes to the file $GAMER_BENCH_RSS at exit
+# (VmHWM starts afresh at exec, whereas ru_maxrss also counts the memory of the forking process)
+SCRIPT_WRAPPER = """
+import atexit, os, resource, runpy, sys
+def report():
+   out = os.environ.get( "GAMER_BENCH_RSS" )
+   if out is None:  return
+   rss = None
+   try:
+      with open( "/proc/self/status" ) as f:
+         rss = [ int(l.split()[1])*1024 for l in f if l.startswith("VmHWM:") ][0]
+   except ( OSError, IndexError ):
+      rss = ( 1 if sys.platform == "darwin" else 1024 )*resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+   with open( out, "a" ) as f:  f.write( "%d\\n"%rss )
+atexit.register( report )
+sys.argv    = sys.argv[1:]
+sys.path[0] = os.path.dirname( os.path.abspath(sys.argv[0]) )
+runpy.run_path( sys.argv[0], run_name="__main__" )
+"""
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def bench_size():
+   size = os.environ.get( "GAMER_BENCH_SIZE", "small" )
+   if size not in SIZES:  raise ValueError( "unsupported GAMER_BENCH_SIZE \"%s\" (%s) !!"%(size, "/".join(SIZES)) )
+   return size
+
+
+def data_dir():
+   path = os.environ.get( "GAMER_BENCH_DATA", os.path.join(tempfile.gettempdir(), "gamer_benchmark") )
+   os.makedirs( path, exist_ok=True )
+   return path
+
+
+def snapshot_file():
+   """
+   Synthetic snapshot of the current size (generated on first use).
+   """
+   size     = bench_size()
+   cfg      = SIZES[size]
+   filename = os.path.join( data_dir(), "Data_%s"%size )
+   if not os.path.isfile( filename ):
+      gamer_synthetic.generate( filename+".tmp", nx0=cfg["nx0"], max_level=cfg["max_level"], pattern="clumps",
+                                nclump=16, npar=cfg["npar"], seed=1, nproc=os.cpu_count() )
+      os.replace( filename+".tmp", filename )
+   return filename
+
+
+def um_ic_file():
+   """
+   Synthetic ELBDM UM_IC [2][N][N][N] (real and imaginary parts in single precision) of a smooth random wave
+   function without vortices (generated on first use).
+   """
+   n        = SIZES[ bench_size() ]["um_ic"]
+   filename = os.path.join( data_dir(), "UM_IC_%d"%n )
+   if not os.path.isfile( filename ):
+      rng   = np.random.default_rng( 1 )
+      k2    = sum( np.meshgrid(*[np.fft.fftfreq(n)**2]*2, np.fft.rfftfreq(n)**2, indexing="ij") )
+      smooth = lambda: np.fft.irfftn( np.fft.rfftn(rng.standard_normal((n, n, n)))*np.exp(-k2*n**2/8.0), s=(n, n, n) )
+      dens  = np.exp( 0.5*smooth() )
+      phase = 20.0*smooth()
+      psi   = np.sqrt( dens )*np.exp( 1j*phase )
+      np.stack( [psi.real, psi.imag] ).astype( np.float32 ).tofile( filename+".tmp" )
+      os.replace( filename+".tmp", filename )
+   return filename, n
+
+
+def run_script( script, *args, cwd=None ):
+   """
+   Run a Python script in a new process, which reports its peak RSS (see SCRIPT_WRAPPER).
+   """
+   res = subprocess.run( [ sys.executable, "-c", SCRIPT_WRAPPER, script ] + [ str(a) for a in args ], cwd=cwd,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True )
+   if res.returncode != 0:
+      raise RuntimeError( "%s failed (exit status %d):\n%s"%( os.path.basename(script), res.returncode, res.stderr ) )
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class SnapshotOpen():
+   def setup( self ):
+      self.filename = snapshot_file()
+
+   def time_open( self ):
+      Snapshot( self.filename )
+
+
+class RegionQuery():
+   def setup( self ):
+      self.snap    = Snapshot( snapshot_file() )
+      self.centers = np.random.default_rng( 0 ).random( (64, 3) )*self.snap.box_size
+      self.width   = 0.1*self.snap.box_size
+
+   def time_patches_in_box( self ):
+      for c in self.centers:
+         self.snap.patches_in_box( c - 0.5*self.width, c + 0.5*self.width, leaf_only=True )
+
+   def time_patches_in_sphere( self ):
+      for c in self.centers:
+         self.snap.patches_in_sphere( c, self.width[0], leaf_only=True )
+
+
+class CoveringGrid():
+   def setup( self ):
+      self.snap = Snapshot( snapshot_file() )
+      self.lv   = SIZES[ bench_size() ]["pk_level"]
+
+   def time_read_uniform( self ):
+      self.snap.read_uniform( "Dens", lv=self.lv )
+
+
+class RadialProfile():
+   def setup( self ):
+      self.filename = snapshot_file()
+      snap          = Snapshot( self.filename )
+      self.center   = np.random.default_rng( 0 ).random( (16, 3) )*snap.box_size
+      self.rmax     = 0.1*snap.box_size[0]
+
+   def time_halo_profiles( self ):
+      halo_profiles( self.filename, self.center, self.rmax, nbin=64, nproc=1 )
+
+
+class PowerSpectrum():
+   def setup( self ):
+      snap      = Snapshot( snapshot_file() )
+      lv        = SIZES[ bench_size() ]["pk_level"]
+      self.box  = snap.box_size[0]
+      self.dens = snap.read_uniform( "Dens", lv=lv )
+      par       = snap.read_particles( ["ParPosX", "ParPosY", "ParPosZ", "ParMass"] )
+      self.pos  = np.stack( [ par["ParPosX"], par["ParPosY"], par["ParPosZ"] ], axis=1 )
+      self.mass = par["ParMass"]
+      self.n    = self.dens.shape[0]
+
+   def time_grid( self ):
+      power_spectrum( self.dens, self.box )
+
+   def time_particles( self ):
+      particle_power_spectrum( self.pos, self.n, self.box, weight=self.mass, scheme="CIC" )
+
+
+class ParticleExtraction():
+   def setup( self ):
+      self.filename = snapshot_file()
+      self.tmp      = tempfile.mkdtemp()
+
+   def teardown( self ):
+      shutil.rmtree( self.tmp, ignore_errors=True )
+
+   def time_extract_binary( self ):
+      # the script refuses to overwrite an existing output file
+      output = os.path.join( self.tmp, "Particle.cbin" )
+      if os.path.isfile( output ):  os.remove( output )
+      run_script( EXTRACT_PAR, "-i", self.filename, "-o", output )
+
+
+class UMICRescale():
+   def setup( self ):
+      self.filename, self.n = um_ic_file()
+      self.tmp = tempfile.mkdtemp()
+
+   def teardown( self ):
+      shutil.rmtree( self.tmp, ignore_errors=True )
+
+   def time_downscale( self ):
+      run_script( UM_RESCALE, "-n_in", self.n, "-n_out", self.n//2, "-input", self.filename,
+                  "-output", os.path.join(self.tmp, "UM_IC") )
+
+
+class UMICConvert():
+   def setup( self ):
+      self.filename, self.n = um_ic_file()
+      self.tmp = tempfile.mkdtemp()
+
+   def teardown( self ):
+      shutil.rmtree( self.tmp, ignore_errors=True )
+
+   def time_wave_to_hybrid( self ):
+      run_script( UM_CONVERT, "-resolution", self.n, "-input", self.filename, "-output", os.path.join(self.tmp, "UM_IC") )
+
+
+class Configure():
+   def setup( self ):
+      # configure.py reads ../configs and Makefile_base and writes Makefile in the working directory
+      self.tmp = tempfile.mkdtemp()
+      src      = os.path.join( self.tmp, "src" )
+      os.makedirs( src )
+      shutil.copy( CONFIGURE, src )
+      shutil.copy( os.path.join(ROOT_DIR, "src", "Makefile_base"), src )
+      os.symlink( os.path.join(ROOT_DIR, "configs"), os.path.join(self.tmp, "configs") )
+      self.src = src
+
+   def teardown( self ):
+      shutil.rmtree( self.tmp, ignore_errors=True )
+
+   def time_configure( self ):
+      run_script( os.path.join(self.src, "configure.py"), *CONFIG_OPTS, cwd=self.src )
@@ -0,0 +1,291 @@
+"""
+Run the benchmarks of benchmarks.py and track the wall time and peak memory usage across commits
+
+Each benchmark runs in a fresh Python process: setup() is called once, the benchmark is called once untimed
+(warm-up) and then timed --repeat times. Two peak resident set sizes (RSS) are recorded:
+   PeakRSS         : peak RSS of the benchmark process above its RSS right after setup(), so that neither the
+                     interpreter and imports nor the inputs prepared by setup() are counted (on Linux the peak is
+                     reset after setup(); elsewhere the baseline is the peak reached by setup())
+   PeakRSSChildren : largest peak RSS of the scripts run by the script benchmarks (benchmarks.run_script()), as
+                     reported by the scripts themselves after exec (0 for the in-process benchmarks)
+The synthetic inputs are generated beforehand in a separate process so that they do not count towards either.
+
+The results are appended to <results>/<machine>.jsonl, one JSON record per benchmark and run:
+   Commit, Date, Machine, Python, Size, Benchmark, Times [s], Time (median) [s], PeakRSS [bytes],
+   PeakRSSChildren [bytes]
+With --compare, the latest results of the current commit are compared with those of a reference commit (default:
+the most recent other commit with results) and the script exits with status 1 if any benchmark became slower or
+used more memory (either peak, by more than --min_memory) by more than --threshold.
+
+Example:
+   python run_benchmarks.py                            # run all benchmarks for the current commit
+   python run_benchmarks.py -b PowerSpectrum --size medium
+   python run_benchmarks.py --compare                  # run and compare with the previous commit
+   python run_benchmarks.py --compare v2.4 --no_run    # compare the existing results with commit v2.4
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname( os.path.abspath(__file__) )
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def discover():
+   """
+   Names "Class.method" of all benchmarks in benchmarks.py.
+   """
+   import benchmarks
+   names = []
+   for cname, cls in inspect.getmembers( benchmarks, inspect.isclass ):
+      if cls.__module__ != benchmarks.__name__:  continue
+      names += [ "%s.%s"%(cname, m) for m, _ in inspect.getmembers(cls, inspect.isfunction) if m.startswith("time_") ]
+   return sorted( names )
+
+
+def _proc_status( key ):
+   # value of /proc/self/status in bytes (Linux only), or None
+   try:
+      with open( "/proc/self/status" ) as f:
+         for line in f:
+            if line.startswith( key+":" ):  return int( line.split()[1] )*1024
+   except OSError:
+      pass
+   return None
+
+
+def _maxrss( who ):
+   # ru_maxrss is in KiB on Linux and in bytes on macOS
+   return ( 1 if sys.platform == "darwin" else 1024 )*resource.getrusage( who ).ru_maxrss
+
+
+def reset_peak_rss():
+   """
+   Reset the peak RSS of the current process to its current RSS (Linux only). Return the baseline of peak_rss().
+   """
+   try:
+      with open( "/proc/self/clear_refs", "w" ) as f:  f.write( "5" )
+   except OSError:
+      return _maxrss( resource.RUSAGE_SELF )
+   rss = _proc_status( "VmRSS" )
+   return rss if rss is not None else _maxrss( resource.RUSAGE_SELF )
+
+
+def peak_rss():
+   hwm = _proc_status( "VmHWM" )
+   return hwm if hwm is not None else _maxrss( resource.RUSAGE_SELF )
+
+
+def run_worker( name, repeat ):
+   """
+   Run one benchmark in the current process and print its result as JSON.
+   """
+   import benchmarks
+   if name == "prepare":
+      benchmarks.snapshot_file()
+      benchmarks.um_ic_file()
+      return
+
+   cname, mname = name.split( "." )
+   obj   = getattr( benchmarks, cname )()
+   func  = getattr( obj, mname )
+   fd, child_rss = tempfile.mkstemp( suffix=".rss" )
+   os.close( fd )
+   os.environ["GAMER_BENCH_RSS"] = child_rss
+   if hasattr( obj, "setup" ):  obj.setup()
+   base  = reset_peak_rss()
+   try:
+      func()
+      times = []
+      for _ in range( repeat ):
+         t0 = time.perf_counter()
+         func()
+         times.append( time.perf_counter() - t0 )
+      peak = max( peak_rss() - base, 0 )
+      with open( child_rss ) as f:  child = max( [ int(line) for line in f if line.strip() ], default=0 )
+   finally:
+      if hasattr( obj, "teardown" ):  obj.teardown()
+      os.remove( child_rss )
+   print( json.dumps({ "Times": times, "PeakRSS": peak, "PeakRSSChildren": child }) )
+
+
+def run_benchmark( name, size, repeat, data ):
+   env = dict( os.environ, GAMER_BENCH_SIZE=size )
+   if data is not None:  env["GAMER_BENCH_DATA"] = data
+   res = subprocess.run( [ sys.executable, os.path.abspath(__file__), "--worker", name, "--repeat", str(repeat) ],
+                         cwd=BENCH_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True )
+   if res.returncode != 0:
+      print( "WARNING : benchmark %s failed !!\n%s"%( name, res.stderr ), file=sys.stderr )
+      return None
+   return json.loads( res.stdout.strip().splitlines()[-1] ) if res.stdout.strip() else {}
+
+
+def git_commit():
+   """
+   Return ( commit hash, commit date ) of the repository, or ( "unknown", None ).
+   """
+   try:
+      out = subprocess.run( [ "git", "log", "-1", "--format=%H %cI" ], cwd=BENCH_DIR, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True ).stdout.split()
+      return out[0], out[1]
+   except ( OSError, subprocess.CalledProcessError, IndexError ):
+      return "unknown", None
+
+
+def resolve_commit( ref ):
+   try:
+      return subprocess.run( [ "git", "rev-parse", ref ], cwd=BENCH_DIR, check=True, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True ).stdout.strip()
+   except ( OSError, subprocess.CalledProcessError ):
+      return ref
+
+
+def load_results( filename ):
+   if not os.path.isfile( filename ):  return []
+   with open( filename ) as f:
+      return [ json.loads(line) for line in f if line.strip() ]
+
+
+def latest( records, commit, size ):
+   """
+   Latest record of each benchmark for the given commit and size.
+   """
+   out = {}
+   for r in records:
+      if r["Commit"] == commit  and  r["Size"] == size:  out[ r["Benchmark"] ] = r
+   return out
+
+
+def compare( records, commit, ref, size, threshold=0.2, min_time=1.0e-3, min_memory=2**20 ):
+   """
+   Compare the latest results of commit with those of ref (default: the most recent other commit with results of
+   the same size). Differences below min_time (s) and min_memory (bytes) are ignored. Print a table and return the
+   number of regressions.
+   """
+   if ref is None:
+      others = [ r for r in records if r["Commit"] != commit  and  r["Size"] == size ]
+      if not others:
+         print( "No results of other commits to compare with" )
+         return 0
+      ref = max( others, key=lambda r: r["Date"] or "" )["Commit"]
+   else:
+      ref = resolve_commit( ref )
+
+   new = latest( records, commit, size )
+   old = latest( records, ref, size )
+   print( "\nCompare %s (new) with %s (reference), size = %s, threshold = %.0f%%"%( commit[:10], ref[:10], size, 100*threshold ) )
+   print( "#%-44s  %12s  %12s  %7s  %10s  %10s  %10s  %10s  %s"%( "Benchmark", "Time_ref[s]", "Time_new[s]", "Ratio",
+          "RSS_ref[M]", "RSS_new[M]", "Chd_ref[M]", "Chd_new[M]", "Status" ) )
+   nreg = 0
+   for name in sorted( set(new) | set(old) ):
+      if name not in new  or  name not in old:
+         print( " %-44s  %s"%( name, "only in the reference" if name in old else "new benchmark" ) )
+         continue
+      t0, t1 = old[name]["Time"], new[name]["Time"]
+      m0, m1 = old[name]["PeakRSS"], new[name]["PeakRSS"]
+      c0, c1 = old[name].get( "PeakRSSChildren", 0 ), new[name].get( "PeakRSSChildren", 0 )
+      slow   = t1 > ( 1.0 + threshold )*t0  and  t1 - t0 > min_time
+      heavy  = any( b > (1.0 + threshold)*a  and  b - a > min_memory for a, b in ((m0, m1), (c0, c1)) )
+      fast   = t1 < t0/( 1.0 + threshold )  and  t0 - t1 > min_time
+      status = ", ".join( s for s, c in (("SLOWER", slow), ("MORE MEMORY", heavy)) if c ) or ( "faster" if fast else "" )
+      nreg  += slow  or  heavy
+      print( " %-44s  %12.5e  %12.5e  %7.3f  %10.1f  %10.1f  %10.1f  %10.1f  %s"%( name, t0, t1, t1/t0, m0/2**20,
+             m1/2**20, c0/2**20, c1/2**20, status ) )
+   print( "\n%d regression(s)"%nreg )
+   return nreg
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+
+   parser = argparse.ArgumentParser( description='Run the benchmarks of the Python tools and track the results across commits' )
+
+   parser.add_argument( '-b', action='store', required=False, type=str, dest='bench',
+                        help='regular expression selecting the benchmarks [all]', default=None )
+   parser.add_argument( '--size', action='store', required=False, type=str, dest='size',
+                        help='problem size (small/medium/large) [%(default)s]', default='small',
+                        choices=['small', 'medium', 'large'] )
+   parser.add_argument( '--repeat', action='store', required=False, type=int, dest='repeat',
+                        help='number of timed runs of each benchmark [%(default)d]', default=5 )
+   parser.add_argument( '--data', action='store', required=False, type=str, dest='data',
+                        help='directory of the cached synthetic inputs [<tmp>/gamer_benchmark]', default=None )
+   parser.add_argument( '--results', action='store', required=False, type=str, dest='results',
+                        help='results directory [%(default)s]', default=os.path.join(BENCH_DIR, 'results') )
+   parser.add_argument( '--machine', action='store', required=False, type=str, dest='machine',
+                        help='machine name [%(default)s]', default=platform.node() or 'unknown' )
+   parser.add_argument( '--compare', action='store', required=False, type=str, dest='compare', nargs='?',
+                        help='compare with a reference commit [the previous commit with results]', default=False, const=None )
+   parser.add_argument( '--threshold', action='store', required=False, type=float, dest='threshold',
+                        help='relative increase of time or memory reported as a regression [%(default)g]', default=0.2 )
+   parser.add_argument( '--min_memory', action='store', required=False, type=float, dest='min_memory',
+                        help='smallest increase of the peak memory in MiB reported as a regression [%(default)g]', default=1.0 )
+   parser.add_argument( '--no_run', action='store_true', required=False, dest='no_run',
+                        help='only compare the existing results [%(default)s]', default=False )
+   parser.add_argument( '--list', action='store_true', required=False, dest='list',
+                        help='list the benchmarks and exit [%(default)s]', default=False )
+   parser.add_argument( '--worker', action='store', required=False, type=str, dest='worker',
+                        help=argparse.SUPPRESS, default=None )
+
+   args = parser.parse_args()
+
+   sys.path.insert( 0, BENCH_DIR )
+   if args.worker is not None:
+      run_worker( args.worker, args.repeat )
+      sys.exit( 0 )
+
+   # take note
+   print( '\nCommand-line arguments:' )
+   print( '-------------------------------------------------------------------' )
+   print( ' '.join(map(str, sys.argv)) )
+   print( '-------------------------------------------------------------------\n' )
+
+   names = [ n for n in discover() if args.bench is None  or  re.search(args.bench, n) ]
+   if args.list:
+      print( '\n'.join(names) )
+      sys.exit( 0 )
+
+   commit, date = git_commit()
+   filename     = os.path.join( args.results, '%s.jsonl'%args.machine )
+
+   if not args.no_run:
+      os.makedirs( args.results, exist_ok=True )
+      print( 'Preparing the synthetic inputs (size = %s) ...'%args.size )
+      run_benchmark( 'prepare', args.size, 1, args.data )
+
+      print( '#%-44s  %12s  %12s  %10s  %10s'%( 'Benchmark', 'Median[s]', 'Min[s]', 'PeakRSS[M]', 'Child[M]' ) )
+      for name in names:
+         res = run_benchmark( name, args.size, args.repeat, args.data )
+         if res is None:  continue
+         record = { 'Commit': commit, 'Date': date, 'Machine': args.machine, 'Python': platform.python_version(),
+                    'Size': args.size, 'Benchmark': name, 'Times': res['Times'],
+                    'Time': statistics.median( res['Times'] ), 'PeakRSS': res['PeakRSS'],
+                    'PeakRSSChildren': res['PeakRSSChildren'],
+                    'RunDate': datetime.datetime.now().isoformat( timespec='seconds' ) }
+         with open( filename, 'a' ) as f:  f.write( json.dumps(record) + '\n' )
+         print( ' %-44s  %12.5e  %12.5e  %10.1f  %10.1f'%( name, record['Time'], min(res['Times']), res['PeakRSS']/2**20,
+             res['PeakRSSChildren']/2**20 ) )
+
+   if args.compare is not False:
+      nreg = compare( load_results(filename), commit, args.compare, args.size, threshold=args.threshold,
+                      min_memory=args.min_memory*2**20 )
+      sys.exit( 1 if nreg else 0 )
@@ -1,18 +1,49 @@
 #!/usr/bin/env python3.9
+import glob
+import math
+import multiprocessing
+import os
+import re
+
 import h5py
 import numpy as np
-import math
+
+from par_ic import ParICLayout
 
 # user-specified parameters
 input_GADGET_file      = "Data_000.hdf5" # GADGET-2 HDF5 file
                                          # --> an example "Data_000.hdf5" (128^3 particles) can be downloaded via "curl -JO http://use.yt/upload/1d18ed50"
-output_float_precision = np.float32      # "np.float32" or "np.float64"
+                                         # --> snapshots split over several files (e.g., "Data_000.0.hdf5", "Data_000.1.hdf5", ...)
+                                         #     are detected automatically by setting either "Data_000.hdf5" or "Data_000.0.hdf5" here
+output_float_precision = np.float32      # "np.float32" or "np.float64" --> set PAR_IC_FLOAT8 = 0/1 accordingly
+output_int_precision   = np.int32        # "np.int32"   or "np.int64"   --> set PAR_IC_INT8   = 0/1 accordingly
+output_PUID            = False           # store GADGET "ParticleIDs" as particle UIDs --> set PAR_IC_PUID = 1 accordingly
 Gadget_UnitMass        = 1.989e43        # identical to the values adopted under "% System of units" in GADGET-2's runtime parameter file
 Gadget_UnitLength      = 3.085678e24     # ...
 Gadget_UnitVelocity    = 100000.0        # ...
+chunk_size             = 4194304         # number of particles converted at once by each process (memory ~ 64 bytes per particle per process)
+num_workers            = os.cpu_count()  # number of processes
+
+# find all files of the snapshot
+def get_snapshot_files( filename ):
+    base  = re.sub( r"(\.\d+)?\.hdf5$", "", filename )
+    files = glob.glob( base+".*.hdf5" )
+    files = [ f for f in files if re.fullmatch( re.escape(base)+r"\.\d+\.hdf5", f ) ]
+    if len(files) > 0:
+        files.sort( key=lambda f: int( f.split(".")[-2] ) )
+        with h5py.File( files[0], "r" ) as f:
+            NumFiles = int( f["Header"].attrs["NumFilesPerSnapshot"] )
+        assert len(files) == NumFiles, "found %d files for \"%s\" but NumFilesPerSnapshot = %d"%(len(files), base, NumFiles)
+    else:
+        assert os.path.isfile( filename ), "cannot find \"%s\""%filename
+        files = [ filename ]
+    return files
+
+input_GADGET_files = get_snapshot_files( input_GADGET_file )
+print( "Number of input files: %d"%len(input_GADGET_files) )
 
 # load the input file
-with h5py.File(input_GADGET_file, "r") as f:
+with h5py.File(input_GADGET_files[0], "r") as f:
     Header_list = f["Header"]
     OMEGA_M0    = float(Header_list.attrs["Omega0"])        # omega matter at the present time
     HUBBLE0     = float(Header_list.attrs["HubbleParam"])   # dimensionless Hubble parameter "h"
@@ -45,7 +76,7 @@ print("GADGET-to-GAMER length   unit conversion: %.16f"%pos_conversion)
 print("GADGET-to-GAMER velocity unit conversion: %.16f"%vel_conversion)
 
 # load the input file
-with h5py.File(input_GADGET_file, "r") as f:
+with h5py.File(input_GADGET_files[0], "r") as f:
     '''
     # print all root level object names/keys
     print("Keys: %s" % f.keys())
@@ -82,48 +113,96 @@ with h5py.File(input_GADGET_file, "r") as f:
 
     # start sorting the particle attributes and initial conditions
     # (1) ordinary point masses should have non-zero entry in the "MassTable"
+    #     --> otherwise the per-particle "Masses" dataset is used
     GADGET_MassTable = list(Header_list.attrs["MassTable"])
-    # (2) "NumPart_ThisFile" should be identical to "NumPart_Total" IFF "input_GADGET_file" is NOT split over several smaller files
-    GADGET_NumPart_ThisFile = list(Header_list.attrs["NumPart_ThisFile"])
-    # (3) record the number of particles for each type
-    GADGET_NumPart_Total = list(Header_list.attrs["NumPart_Total"])
-
-    with open('PAR_IC', 'wb') as output:
-
-        for i, NumPart_i in enumerate(GADGET_NumPart_Total):
-            # if for "PartType(i)" the total particle number is greater than zero, we import the information to PAR_IC
-            if NumPart_i > 0:
-                key_NOW = "PartType"+str(i)
-                PartType_Coordinates = np.array(f[key_NOW]["Coordinates"], float)
-                Velocities_Coordinates = np.array(f[key_NOW]["Velocities"], float)
-
-                mass = np.full(NumPart_i, GADGET_MassTable[i])*mass_conversion
-
-                # set the origin of Cartesian coordinates to the box left bottom corner
-                posx = PartType_Coordinates[:,0]*pos_conversion
-                posy = PartType_Coordinates[:,1]*pos_conversion
-                posz = PartType_Coordinates[:,2]*pos_conversion
-
-                velx = Velocities_Coordinates[:,0]*vel_conversion*(input_a_scale_factor**1.5)
-                vely = Velocities_Coordinates[:,1]*vel_conversion*(input_a_scale_factor**1.5)
-                velz = Velocities_Coordinates[:,2]*vel_conversion*(input_a_scale_factor**1.5)
-
-                # For GADGET, see "Table 3" on p.31 of https://wwwmpa.mpa-garching.mpg.de/gadget/users-guide.pdf
-                # For GAMER, we fix the imported particle type to "1 (PTYPE_GENERIC_MASSIVE)."
-                # --> See https://github.com/gamer-project/gamer/wiki/Initial-Conditions#IC-File-Particles
-                partype = np.full(NumPart_i, 1)
-
-                output.write(mass.astype(dtype=output_float_precision).tobytes())
-                output.write(posx.astype(dtype=output_float_precision).tobytes())
-                output.write(posy.astype(dtype=output_float_precision).tobytes())
-                output.write(posz.astype(dtype=output_float_precision).tobytes())
-                output.write(velx.astype(dtype=output_float_precision).tobytes())
-                output.write(vely.astype(dtype=output_float_precision).tobytes())
-                output.write(velz.astype(dtype=output_float_precision).tobytes())
-                output.write(partype.astype(dtype=output_float_precision).tobytes())
-
-                print('Number of particles = %i'%NumPart_i)
-
-        output.close()
-
-    print('PAR_IC complete')
+    # (2) record the number of particles for each type
+    #     --> "NumPart_Total_HighWord" stores the upper 32 bits for more than 2^32 particles
+    GADGET_NumPart_Total = np.array(Header_list.attrs["NumPart_Total"], dtype=np.int64)
+    if "NumPart_Total_HighWord" in Header_list.attrs:
+        GADGET_NumPart_Total += np.array(Header_list.attrs["NumPart_Total_HighWord"], dtype=np.int64) << 32
+
+# (3) "NumPart_ThisFile" of all files, which must sum up to "NumPart_Total"
+GADGET_NumPart_ThisFile = []
+for filename in input_GADGET_files:
+    with h5py.File(filename, "r") as f:
+        GADGET_NumPart_ThisFile.append(np.array(f["Header"].attrs["NumPart_ThisFile"], dtype=np.int64))
+GADGET_NumPart_ThisFile = np.array(GADGET_NumPart_ThisFile)
+assert np.array_equal(GADGET_NumPart_ThisFile.sum(axis=0), GADGET_NumPart_Total), \
+       "sum of NumPart_ThisFile %s != NumPart_Total %s"%(GADGET_NumPart_ThisFile.sum(axis=0), GADGET_NumPart_Total)
+
+# particles of all types are stored contiguously in PAR_IC in the order of [type][file]
+# --> offset of the first particle of each (type, file) pair
+NPar_AllType = int(GADGET_NumPart_Total.sum())
+Offset_Type  = np.concatenate(([0], np.cumsum(GADGET_NumPart_Total)[:-1]))
+Offset_File  = Offset_Type[None,:] + np.concatenate((np.zeros((1,len(GADGET_NumPart_Total)), dtype=np.int64),
+                                                     np.cumsum(GADGET_NumPart_ThisFile, axis=0)[:-1]), axis=0)
+
+# preallocate PAR_IC in the [attribute][id] layout
+layout = ParICLayout( NPar_AllType, float_type=output_float_precision, int_type=output_int_precision, with_puid=output_PUID )
+layout.create( 'PAR_IC' )
+
+# convert one chunk of particles of one type in one file
+# --> each process keeps its own HDF5 file handles and memory maps
+_worker_files = {}
+_worker_maps  = {}
+
+def convert_chunk( task ):
+    filename, i, start, end, offset = task
+
+    if filename not in _worker_files:   _worker_files[filename] = h5py.File(filename, "r")
+    if len(_worker_maps) == 0:
+        for v in layout.att_flt + layout.att_int:   _worker_maps[v] = layout.open('PAR_IC', v)
+
+    group = _worker_files[filename]["PartType"+str(i)]
+    s, e  = offset+start, offset+end
+
+    # mass
+    if GADGET_MassTable[i] != 0.0:
+        _worker_maps["ParMass"][s:e] = GADGET_MassTable[i]*mass_conversion
+    else:
+        mass  = np.asarray(group["Masses"][start:end], dtype=np.float64)
+        mass *= mass_conversion
+        _worker_maps["ParMass"][s:e] = mass
+
+    # set the origin of Cartesian coordinates to the box left bottom corner
+    # --> convert units in place to avoid temporary arrays
+    pos  = np.asarray(group["Coordinates"][start:end], dtype=np.float64)
+    pos *= pos_conversion
+    for d, v in enumerate(["ParPosX", "ParPosY", "ParPosZ"]):   _worker_maps[v][s:e] = pos[:,d]
+    del pos
+
+    vel  = np.asarray(group["Velocities"][start:end], dtype=np.float64)
+    vel *= vel_conversion*(input_a_scale_factor**1.5)
+    for d, v in enumerate(["ParVelX", "ParVelY", "ParVelZ"]):   _worker_maps[v][s:e] = vel[:,d]
+    del vel
+
+    # For GADGET, see "Table 3" on p.31 of https://wwwmpa.mpa-garching.mpg.de/gadget/users-guide.pdf
+    # For GAMER, we fix the imported particle type to "1 (PTYPE_GENERIC_MASSIVE)."
+    # --> See https://github.com/gamer-project/gamer/wiki/Initial-Conditions#IC-File-Particles
+    _worker_maps["ParType"][s:e] = 1
+
+    if output_PUID:   _worker_maps["ParPUID"][s:e] = group["ParticleIDs"][start:end]
+
+    return end-start
+
+tasks = []
+for f_idx, filename in enumerate(input_GADGET_files):
+    for i, NumPart_i in enumerate(GADGET_NumPart_ThisFile[f_idx]):
+        for start in range(0, NumPart_i, chunk_size):
+            tasks.append((filename, i, start, min(start+chunk_size, NumPart_i), Offset_File[f_idx][i]))
+
+# use "fork" so that the workers inherit the parameters above without re-executing this script
+NPar_Done = 0
+with multiprocessing.get_context("fork").Pool(processes=num_workers) as pool:
+    for NPar_Chunk in pool.imap_unordered(convert_chunk, tasks):
+        NPar_Done += NPar_Chunk
+        print('Converted %13d / %13d particles (%6.2f%%)'%(NPar_Done, NPar_AllType, 100.0*NPar_Done/max(NPar_AllType, 1)), end='\r')
+print('')
+
+layout.check( 'PAR_IC' )
+
+for i, NumPart_i in enumerate(GADGET_NumPart_Total):
+    if NumPart_i > 0:   print('Number of particles of PartType%d = %i'%(i, NumPart_i))
+for line in layout.summary():   print(line)
+
+print('PAR_IC complete')
@@ -0,0 +1,543 @@
+"""
+This file generates cosmological initial conditions from a tabulated linear
+power spectrum for import into GAMER with COMOVING enabled. It can write either
+the particle initial condition file "PAR_IC" (PAR_INIT=3) or the uniform-mesh
+initial condition file "UM_IC" (OPT__INIT=3) of ELBDM or HYDRO. It does the
+following:
+
+1. Draws a Gaussian white noise on an N^3 grid, Fourier transforms it, and
+   scales each mode by the power spectrum linearly extrapolated to A_INIT
+2. Computes the Zel'dovich (1LPT) displacement field, and optionally the
+   second-order (2LPT) displacement field from the second-order source term
+3. PAR_IC : Places one particle per cell, displaced from the cell center and
+            with the growing-mode velocity
+   UM_IC  : Writes the linear density field together with the corresponding
+            velocity (HYDRO) or phase (ELBDM) field at the cell centers
+
+All quantities are in the comoving units of GAMER (see src/Init/Init_Unit.cpp):
+length in Mpc/h, density in the present matter density (so the mean density is
+one), time in 1/H0, and velocity in 100 km/s. The particle and fluid
+velocities are a^2*dx/dt, and the ELBDM phase is ELBDM_ETA times the velocity
+potential. The power spectrum table has two columns, k in h/Mpc and P(k) in
+(Mpc/h)^3, and lines starting with "#" are skipped. A flat LCDM cosmology
+(OMEGA_M0 + OMEGA_LAMBDA = 1) is assumed for the growth factors.
+
+The 3D FFTs are decomposed into slabs: 2D transforms of z-slabs followed by 1D
+transforms along z of y-slabs. Each transform is multi-threaded with
+scipy.fft. The only full-size array held in memory is the Fourier-space field.
+Intermediate fields are kept in temporary memory-mapped files under --tmpdir
+and the output is written through memory maps one slab at a time. The white
+noise of each z-plane is drawn from its own random stream seeded by
+(seed, plane index), so the result does not depend on the slab size or the
+number of threads.
+
+Set the following runtime parameters accordingly:
+
+   BOX_SIZE = --box, NX0_TOT_X/Y/Z = N (for UM_IC), A_INIT = --a_init, OMEGA_M0 = --omega_m0
+   PAR_IC : PAR_INIT = 3, PAR_IC_FORMAT = 1, PAR_IC_MASS = -1.0 (or the printed
+            particle mass with --no_mass), PAR_IC_TYPE = -1, PAR_NPAR = N^3
+   UM_IC  : OPT__INIT = 3, OPT__UM_IC_FORMAT = 1, OPT__UM_IC_NVAR = the number of
+            written fields, OPT__UM_IC_FLOAT8 consistent with --float8
+            ELBDM: LSS_InitMode = 1 for "-u dens" and 2 for "-u wave/hybrid"
+            (HYDRO: HUBBLE0 = --hubble0 and an EoS with GAMMA = --gamma and MOLECULAR_WEIGHT = --mu)
+
+It requires NumPy and SciPy to be installed.
+
+Example:
+
+    python3 gen_cosmo_ic.py -k pk_z0.txt -n 256 --box 30.0 --a_init 0.01 --omega_m0 0.315823 --lpt 2 -o PAR_IC
+    python3 gen_cosmo_ic.py -k pk_z0.txt -n 256 --box 1.4 --a_init 3.124024e-4 --omega_m0 0.2835 -u wave -o UM_IC
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.fft as sfft
+from scipy.integrate import trapezoid
+from scipy.special import roots_legendre
+
+from par_ic import ParICLayout
+
+
+# physical constants identical to include/PhysicalConstant.h
+Const_cm     = 1.0
+Const_km     = 1.0e5*Const_cm
+Const_Mpc    = 3.08567758149e24
+Const_c      = 2.99792458e10
+Const_eV     = 1.6021766208e-12
+Const_Planck = 1.054571800e-27
+Const_kB     = 1.38064852e-16
+Const_mH     = 1.007825*1.660539040e-24
+
+# fields stored in UM_IC for different "-u" options
+UM_IC_FIELDS = { "dens"  : [ "Dens" ],                                # ELBDM LSS_InitMode=1
+                 "wave"  : [ "Real", "Imag" ],                        # ELBDM LSS_InitMode=2 with ELBDM_WAVE
+                 "hybrid": [ "Dens", "Phase" ],                       # ELBDM LSS_InitMode=2 with ELBDM_HYBRID
+                 "hydro" : [ "Dens", "MomX", "MomY", "MomZ", "Engy" ] }
+
+
+
+class Cosmology():
+    def __init__( self, omega_m0 ):
+        """
+        Flat LCDM cosmology with the linear growth factor normalized to D(a=1)=1.
+        """
+        self.omega_m0 = omega_m0
+        self.norm     = 1.0
+        self.norm     = 1.0/self.growth( 1.0 )
+
+    def hubble( self, a ):
+        # H(a)/H0
+        return np.sqrt( self.omega_m0/a**3 + 1.0 - self.omega_m0 )
+
+    def omega_m( self, a ):
+        return self.omega_m0/a**3/self.hubble( a )**2
+
+    def _growth_integral( self, a ):
+        # \int_0^a da'/(a'*H(a')/H0)^3, whose integrand vanishes as a'^1.5 at a'=0
+        x, w = roots_legendre( 64 )
+        ap   = 0.5*a*( x + 1.0 )
+        return 0.5*a*np.sum( w/( ap*self.hubble(ap) )**3 )
+
+    def growth( self, a ):
+        return self.norm*2.5*self.omega_m0*self.hubble( a )*self._growth_integral( a )
+
+    def growth_rate( self, a ):
+        # f = dlnD/dlna
+        E = self.hubble( a )
+        return -1.5*self.omega_m0/a**3/E**2 + a/( a*E )**3/self._growth_integral( a )
+
+    def growth_rate_2lpt( self, a ):
+        # f2 = dlnD2/dlna (Bouchet et al. 1995)
+        return 2.0*self.omega_m( a )**(6.0/11.0)
+
+    def growth_2lpt( self, a ):
+        # -D2/D1^2
+        return 3.0/7.0*self.omega_m( a )**(-1.0/143.0)
+
+
+
+class PowerSpectrum():
+    def __init__( self, filename, scale=1.0 ):
+        """
+        Linear power spectrum interpolated in log-log space from a table of k [h/Mpc] and P(k) [(Mpc/h)^3],
+        multiplied by "scale". It vanishes outside the tabulated range.
+        """
+        table      = np.loadtxt( filename, comments='#', usecols=(0, 1) )
+        self.logk  = np.log( table[:,0] )
+        self.logp  = np.log( table[:,1] )
+        self.scale = scale
+
+    def __call__( self, k ):
+        logk = np.log( np.maximum(k, 1.0e-300) )
+        pk   = np.exp( np.interp(logk, self.logk, self.logp) )
+        pk[ (logk < self.logk[0]) | (logk > self.logk[-1]) ] = 0.0
+        return self.scale*pk
+
+    def sigma_r( self, r ):
+        # rms linear density fluctuation within a top-hat sphere of radius r
+        k  = np.exp( np.linspace(self.logk[0], self.logk[-1], 8192) )
+        kr = k*r
+        W  = 3.0*( np.sin(kr) - kr*np.cos(kr) )/kr**3
+        return np.sqrt( trapezoid(k**3*self(k)*W**2, np.log(k))/(2.0*np.pi**2) )
+
+
+
+class SlabFFT():
+    def __init__( self, n, box_size, float_type=np.float32, slab=16, nthreads=1, tmpdir=None ):
+        """
+        Slab-decomposed real-to-complex 3D FFTs of an n^3 periodic grid stored as [z][y][x].
+
+        The Fourier-space field "field_k" with the shape [n][n][n//2+1] (i.e., [kz][ky][kx]) is the only
+        full-size array in memory. The complex intermediate of the inverse transforms and any real-space
+        field obtained from "scratch()" are memory-mapped temporary files under "tmpdir".
+        """
+        self.n          = n
+        self.box_size   = box_size
+        self.float_type = np.dtype( float_type )
+        self.cplx_type  = np.result_type( self.float_type, np.complex64 )
+        self.slab       = slab
+        self.nthreads   = nthreads
+        self.tmpdir     = tempfile.mkdtemp( prefix='gen_cosmo_ic_', dir=tmpdir )
+        self.nscratch   = 0
+
+        dk      = 2.0*np.pi/box_size
+        self.kx = dk*sfft.rfftfreq( n, 1.0/n )
+        self.ky = dk*sfft.fftfreq( n, 1.0/n )
+        self.kz = self.ky
+
+        self.field_k = np.zeros( (n, n, n//2+1), dtype=self.cplx_type )
+        self.work_k  = self.scratch( self.cplx_type, (n, n, n//2+1) )
+
+    def scratch( self, dtype=None, shape=None ):
+        filename       = os.path.join( self.tmpdir, 'scratch_%d'%self.nscratch )
+        self.nscratch += 1
+        return np.memmap( filename, mode='w+', dtype=self.float_type if dtype is None else dtype,
+                          shape=(self.n,)*3 if shape is None else shape )
+
+    def close( self ):
+        del self.work_k
+        for f in os.listdir( self.tmpdir ):  os.remove( os.path.join(self.tmpdir, f) )
+        os.rmdir( self.tmpdir )
+
+    def slabs( self ):
+        return [ (i, min(i+self.slab, self.n)) for i in range(0, self.n, self.slab) ]
+
+    def wavevectors( self, y0, y1 ):
+        """
+        Return [kx, ky, kz] broadcast to the y-slab [:, y0:y1, :] and k^2 with the zero mode set to one.
+        """
+        k  = [ self.kx[None,None,:], self.ky[None,y0:y1,None], self.kz[:,None,None] ]
+        k2 = k[0]**2 + k[1]**2 + k[2]**2
+        if y0 == 0:  k2[0,0,0] = 1.0
+        return k, k2
+
+    def forward( self, get_slab, kernel=None ):
+        """
+        field_k = FFT( f ) * kernel, where get_slab(z0, z1) returns f[z0:z1] and kernel(k, k2) returns
+        the multiplier on a y-slab (see wavevectors()).
+        """
+        for z0, z1 in self.slabs():
+            self.field_k[z0:z1] = sfft.rfft2( get_slab(z0, z1), axes=(1, 2), workers=self.nthreads )
+
+        for y0, y1 in self.slabs():
+            tmp = sfft.fft( self.field_k[:,y0:y1], axis=0, overwrite_x=True, workers=self.nthreads )
+            if kernel is not None:  tmp *= kernel( *self.wavevectors(y0, y1) )
+            self.field_k[:,y0:y1] = tmp
+
+    def inverse( self, kernel, put_slab ):
+        """
+        f = IFFT( field_k * kernel ), where put_slab(z0, z1, f[z0:z1]) receives the result slab by slab.
+        field_k is left untouched.
+        """
+        for y0, y1 in self.slabs():
+            tmp = self.field_k[:,y0:y1]*kernel( *self.wavevectors(y0, y1) )
+            self.work_k[:,y0:y1] = sfft.ifft( tmp, axis=0, overwrite_x=True, workers=self.nthreads )
+
+        for z0, z1 in self.slabs():
+            put_slab( z0, z1, sfft.irfft2( self.work_k[z0:z1], s=(self.n, self.n), axes=(1, 2),
+                                           workers=self.nthreads ).astype( self.float_type, copy=False ) )
+
+    def store( self, array, factor=1.0, add=False ):
+        # return a put_slab() function writing factor*f (or adding it when add=True) into "array"
+        def put_slab( z0, z1, f ):
+            if add:  array[z0:z1] += factor*f
+            else:    array[z0:z1]  = factor*f
+        return put_slab
+
+
+
+def white_noise( fft, seed ):
+    """
+    Return get_slab() of a unit Gaussian white noise whose z-plane iz is drawn from the stream (seed, iz).
+    """
+    n = fft.n
+    def plane( iz ):
+        return np.random.default_rng( [seed, iz] ).standard_normal( (n, n) )
+    def get_slab( z0, z1 ):
+        with ThreadPoolExecutor( max_workers=fft.nthreads ) as pool:
+            return np.array( list(pool.map(plane, range(z0, z1))), dtype=fft.float_type )
+    return get_slab
+
+
+def linear_field( fft, pk, seed ):
+    """
+    Fill fft.field_k with the Fourier coefficients of the linear density contrast whose power spectrum
+    is pk(k), following the unnormalized forward transform convention of scipy.fft.
+    """
+    n       = fft.n
+    amp     = np.sqrt( n**3/fft.box_size**3 )
+    nyquist = np.abs( fft.kx[-1] ) if n%2 == 0 else None
+
+    def kernel( k, k2 ):
+        kabs = np.sqrt( k2 )
+        w    = amp*np.sqrt( pk(kabs) )
+        if nyquist is not None:
+#           remove the Nyquist modes, for which the derivatives are ill-defined
+            w = np.where( (np.abs(k[0]) >= nyquist) | (np.abs(k[1]) >= nyquist) | (np.abs(k[2]) >= nyquist), 0.0, w )
+        return w
+
+    fft.forward( white_noise(fft, seed), kernel )
+    fft.field_k[0,0,0] = 0.0
+
+
+def second_order_source( fft ):
+    """
+    Replace fft.field_k (the linear density contrast) by the Fourier transform of the 2LPT source term
+    sum_{i>j} ( phi_ii*phi_jj - phi_ij^2 ), where laplacian(phi) = delta.
+    """
+    diag = [ fft.scratch() for d in range(3) ]
+    src  = fft.scratch()
+
+    for d in range(3):
+        fft.inverse( lambda k, k2, d=d: k[d]**2/k2, fft.store(diag[d]) )
+
+    for z0, z1 in fft.slabs():
+        src[z0:z1] = diag[0][z0:z1]*diag[1][z0:z1] + diag[0][z0:z1]*diag[2][z0:z1] + diag[1][z0:z1]*diag[2][z0:z1]
+    del diag
+
+    def subtract_square( z0, z1, f ):
+        src[z0:z1] -= f**2
+    for i, j in [ (0, 1), (0, 2), (1, 2) ]:
+        fft.inverse( lambda k, k2, i=i, j=j: k[i]*k[j]/k2, subtract_square )
+
+    fft.forward( lambda z0, z1: src[z0:z1] )
+    fft.field_k[0,0,0] = 0.0
+
+
+def cell_centers( fft, z0, z1 ):
+    # cell-center coordinates of the slab [z0:z1] broadcast to [z][y][x]
+    dh = fft.box_size/fft.n
+    c  = ( np.arange(fft.n) + 0.5 )*dh
+    return [ c[None,None,:], c[None,:,None], c[z0:z1,None,None] ]
+
+
+def write_par_ic( filename, fft, cosmo, a_init, lpt=1, float_type=np.float32, int_type=np.int32,
+                  with_mass=True, par_type=2, mass_frac=1.0 ):
+    """
+    Write one particle per cell displaced by the 1LPT (lpt=1) or 2LPT (lpt=2) displacement field.
+    fft.field_k must hold the linear density contrast at a_init and is overwritten when lpt=2.
+
+    mass_frac : float. Fraction of the mean matter density carried by particles.
+
+    Return the ParICLayout object and the particle mass.
+    """
+    n        = fft.n
+    npar     = n**3
+    par_mass = mass_frac*fft.box_size**3/npar
+    vel_fac  = a_init**2*cosmo.hubble( a_init )
+    f1       = cosmo.growth_rate( a_init )
+
+#   displacement = psi1 + psi2, velocity = a^2*H*( f1*psi1 + f2*psi2 )
+    psi1 = [ fft.scratch() for d in range(3) ]
+    for d in range(3):
+        fft.inverse( lambda k, k2, d=d: 1j*k[d]/k2, fft.store(psi1[d]) )
+
+    if lpt == 2:
+        f2   = cosmo.growth_rate_2lpt( a_init )
+        c2   = cosmo.growth_2lpt( a_init )
+        second_order_source( fft )
+        psi2 = [ fft.scratch() for d in range(3) ]
+        for d in range(3):
+            fft.inverse( lambda k, k2, d=d: 1j*c2*k[d]/k2, fft.store(psi2[d]) )
+
+    layout = ParICLayout( npar, float_type=float_type, int_type=int_type, with_mass=with_mass )
+    layout.create( filename )
+    maps   = { v: layout.open( filename, v ) for v in layout.att_flt + layout.att_int }
+
+    for z0, z1 in fft.slabs():
+        s, e = z0*n*n, z1*n*n
+        q    = cell_centers( fft, z0, z1 )
+        for d in range(3):
+            disp = np.asarray( psi1[d][z0:z1], dtype=np.float64 )
+            vel  = f1*disp
+            if lpt == 2:
+                disp2 = np.asarray( psi2[d][z0:z1], dtype=np.float64 )
+                disp += disp2
+                vel  += f2*disp2
+            maps["ParPos"+"XYZ"[d]][s:e] = np.mod( q[d] + disp, fft.box_size ).ravel()
+            maps["ParVel"+"XYZ"[d]][s:e] = ( vel_fac*vel ).ravel()
+        if "ParMass" in maps:   maps["ParMass"][s:e] = par_mass
+        if "ParType" in maps:   maps["ParType"][s:e] = par_type
+        print( 'Written %13d / %13d particles (%6.2f%%)'%(e, npar, 100.0*e/npar), end='\r' )
+    print( '' )
+
+    for m in maps.values():  m.flush()
+    del maps
+    layout.check( filename )
+    return layout, par_mass
+
+
+def write_um_ic( filename, fft, cosmo, a_init, mode="dens", lpt=1, float_type=np.float32,
+                 eta=None, gas_frac=1.0, temp=0.0, mu=0.6, gamma=5.0/3.0 ):
+    """
+    Write the fields of UM_IC_FIELDS[mode] in the [field][z][y][x] layout (OPT__UM_IC_FORMAT=1).
+    fft.field_k must hold the linear density contrast at a_init and is overwritten when lpt=2.
+
+    The density is the linear density contrast plus one. The velocity (mode="hydro") and the phase
+    (mode="wave/hybrid") include the 2LPT growing mode when lpt=2.
+
+    eta      : float. ELBDM_ETA=ELBDM_MASS/ELBDM_PLANCK_CONST in code units (mode="wave/hybrid").
+    gas_frac : float. Mean gas density in units of the mean matter density (mode="hydro").
+    temp     : float. Mean gas temperature at a_init in Kelvin (mode="hydro").
+    mu/gamma : float. Mean molecular weight and adiabatic index (mode="hydro").
+    """
+    fields  = UM_IC_FIELDS[mode]
+    um      = np.memmap( filename, mode='w+', dtype=float_type, shape=(len(fields),) + (fft.n,)*3 )
+    vel_fac = a_init**2*cosmo.hubble( a_init )
+    f1      = cosmo.growth_rate( a_init )
+
+    if mode in ( "wave", "hybrid" ) and eta is None:
+        raise ValueError( "eta must be provided for mode=%s !!"%mode )
+
+#   (1) first-order fields: density in field 0 and the velocity (hydro) or phase (wave/hybrid) in fields 1+
+    def store_dens( z0, z1, f ):
+        um[0,z0:z1] = 1.0 + f
+    fft.inverse( lambda k, k2: 1.0, store_dens )
+
+    if mode == "hydro":
+        for d in range(3):
+            fft.inverse( lambda k, k2, d=d: 1j*k[d]/k2, fft.store(um[1+d], factor=vel_fac*f1) )
+    elif mode != "dens":
+#       phase = eta*S, where velocity = grad(S) = a^2*H*f1*psi1 and psi1 = -grad(phi) with laplacian(phi) = delta
+        fft.inverse( lambda k, k2: 1.0/k2, fft.store(um[1], factor=eta*vel_fac*f1) )
+
+#   (2) second-order velocity and phase
+    if lpt == 2  and  mode != "dens":
+        f2 = cosmo.growth_rate_2lpt( a_init )
+        c2 = cosmo.growth_2lpt( a_init )
+        second_order_source( fft )
+        if mode == "hydro":
+            for d in range(3):
+                fft.inverse( lambda k, k2, d=d: 1j*c2*k[d]/k2, fft.store(um[1+d], factor=vel_fac*f2, add=True) )
+        else:
+            fft.inverse( lambda k, k2: c2/k2, fft.store(um[1], factor=eta*vel_fac*f2, add=True) )
+
+#   (3) convert to the conserved or stored variables slab by slab
+    nneg = 0
+    for z0, z1 in fft.slabs():
+        dens  = np.asarray( um[0,z0:z1], dtype=np.float64 )
+        nneg += np.count_nonzero( dens < 0.0 )
+        dens  = np.maximum( dens, 0.0 )
+
+        if mode == "wave":
+            phase       = np.asarray( um[1,z0:z1], dtype=np.float64 )
+            um[0,z0:z1] = np.sqrt( dens )*np.cos( phase )
+            um[1,z0:z1] = np.sqrt( dens )*np.sin( phase )
+        elif mode == "hydro":
+            dens       *= gas_frac
+            vel         = [ np.asarray(um[1+d,z0:z1], dtype=np.float64) for d in range(3) ]
+#           adiabatic temperature scaling with the comoving temperature a^2*T as in the Zeldovich test problem
+            eint        = dens*a_init**2*temp*( dens/gas_frac )**(gamma-1.0)*Const_kB/( mu*Const_mH*(gamma-1.0) )/( 100.0*Const_km )**2
+            um[0,z0:z1] = dens
+            for d in range(3):  um[1+d,z0:z1] = dens*vel[d]
+            um[4,z0:z1] = eint + 0.5*dens*( vel[0]**2 + vel[1]**2 + vel[2]**2 )
+        else:
+            um[0,z0:z1] = dens
+
+    if nneg > 0:
+        print( 'WARNING : %d cells with negative linear density are reset to zero (A_INIT may be too large) !!'%nneg )
+
+    um.flush()
+    return fields
+
+
+def elbdm_eta( elbdm_mass, hubble0 ):
+    # ELBDM_ETA in the comoving units, where UNIT_L = Mpc/h and UNIT_T = 1/H0
+    unit_l = Const_Mpc/hubble0
+    unit_t = Const_Mpc/( 100.0*hubble0*Const_km )
+    return elbdm_mass*Const_eV/Const_c**2/Const_Planck*unit_l**2/unit_t
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser( description='Generate cosmological PAR_IC or UM_IC from a linear power spectrum' )
+
+    parser.add_argument( '-k', action='store', required=True,  type=str, dest='pk_table',
+                         help='power spectrum table with columns k [h/Mpc] and P(k) [(Mpc/h)^3]' )
+    parser.add_argument( '--pk_z', action='store', required=False, type=float, dest='pk_z',
+                         help='redshift of the power spectrum table [%(default)g]', default=0.0 )
+    parser.add_argument( '--sigma8', action='store', required=False, type=float, dest='sigma8',
+                         help='renormalize the table to this sigma_8 at z=0 (<0=off) [%(default)g]', default=-1.0 )
+    parser.add_argument( '-n', action='store', required=True,  type=int, dest='n',
+                         help='number of cells (and particles) along each dimension' )
+    parser.add_argument( '--box', action='store', required=True,  type=float, dest='box_size',
+                         help='box size in Mpc/h (BOX_SIZE)' )
+    parser.add_argument( '--a_init', action='store', required=True,  type=float, dest='a_init',
+                         help='initial scale factor (A_INIT)' )
+    parser.add_argument( '--omega_m0', action='store', required=False, type=float, dest='omega_m0',
+                         help='present matter density parameter (OMEGA_M0) [%(default)g]', default=0.3 )
+    parser.add_argument( '--hubble0', action='store', required=False, type=float, dest='hubble0',
+                         help='dimensionless Hubble parameter (HUBBLE0) [%(default)g]', default=0.7 )
+    parser.add_argument( '--lpt', action='store', required=False, type=int, dest='lpt', choices=[1, 2],
+                         help='order of Lagrangian perturbation theory [%(default)d]', default=1 )
+    parser.add_argument( '-u', action='store', required=False, type=str, dest='um_ic', choices=list(UM_IC_FIELDS),
+                         help='write UM_IC with the given fields instead of PAR_IC [%(default)s]', default=None )
+    parser.add_argument( '--elbdm_mass', action='store', required=False, type=float, dest='elbdm_mass',
+                         help='ELBDM particle mass in eV/c^2 for "-u wave/hybrid" [%(default)g]', default=8.0e-23 )
+    parser.add_argument( '--gas_frac', action='store', required=False, type=float, dest='gas_frac',
+                         help='mean gas density over mean matter density for "-u hydro" [%(default)g]', default=1.0 )
+    parser.add_argument( '--temp', action='store', required=False, type=float, dest='temp',
+                         help='initial gas temperature in Kelvin for "-u hydro" [%(default)g]', default=100.0 )
+    parser.add_argument( '--mu', action='store', required=False, type=float, dest='mu',
+                         help='mean molecular weight for "-u hydro" [%(default)g]', default=0.6 )
+    parser.add_argument( '--gamma', action='store', required=False, type=float, dest='gamma',
+                         help='adiabatic index for "-u hydro" [%(default)g]', default=5.0/3.0 )
+    parser.add_argument( '--mass_frac', action='store', required=False, type=float, dest='mass_frac',
+                         help='particle mass fraction of the mean matter density for PAR_IC [%(default)g]', default=1.0 )
+    parser.add_argument( '--no_mass', action='store_true', dest='no_mass',
+                         help='do not store particle mass in PAR_IC (set PAR_IC_MASS to the printed value) [False]' )
+    parser.add_argument( '--type', action='store', required=False, type=int, dest='par_type',
+                         help='particle type [%(default)d]', default=2 )
+    parser.add_argument( '--seed', action='store', required=False, type=int, dest='seed',
+                         help='random seed [%(default)d]', default=0 )
+    parser.add_argument( '--slab', action='store', required=False, type=int, dest='slab',
+                         help='number of planes per slab [%(default)d]', default=16 )
+    parser.add_argument( '-t', action='store', required=False, type=int, dest='nthreads',
+                         help='number of threads [%(default)d]', default=os.cpu_count() )
+    parser.add_argument( '--fft_float8', action='store_true', dest='fft_float8',
+                         help='use double precision for the FFTs [False]' )
+    parser.add_argument( '--float8', action='store_true', dest='float8',
+                         help='use double precision for the output (PAR_IC_FLOAT8/OPT__UM_IC_FLOAT8=1) [False]' )
+    parser.add_argument( '--int8', action='store_true', dest='int8',
+                         help='use 64-bit integers (PAR_IC_INT8=1) [False]' )
+    parser.add_argument( '--tmpdir', action='store', required=False, type=str, dest='tmpdir',
+                         help='directory of the temporary files [the output directory]', default=None )
+    parser.add_argument( '-o', action='store', required=False, type=str, dest='filename_out',
+                         help='output filename [PAR_IC or UM_IC]', default=None )
+
+    args = parser.parse_args()
+
+    # take note
+    print( '\nCommand-line arguments:' )
+    print( '-------------------------------------------------------------------' )
+    print( ' '.join(map(str, sys.argv)) )
+    print( '-------------------------------------------------------------------\n' )
+
+    filename_out = args.filename_out if args.filename_out is not None else \
+                   ( 'PAR_IC' if args.um_ic is None else 'UM_IC' )
+    tmpdir       = args.tmpdir if args.tmpdir is not None else \
+                   os.path.dirname( os.path.abspath(filename_out) )
+
+    # linearly extrapolate the power spectrum table to a_init
+    cosmo = Cosmology( args.omega_m0 )
+    pk    = PowerSpectrum( args.pk_table )
+    if args.sigma8 > 0.0:
+        pk.scale = ( args.sigma8/( pk.sigma_r(8.0)*cosmo.growth(1.0)/cosmo.growth(1.0/(1.0+args.pk_z)) ) )**2
+    pk.scale *= ( cosmo.growth(args.a_init)/cosmo.growth(1.0/(1.0+args.pk_z)) )**2
+
+    print( 'sigma_8 at z=0      = %14.7e'%( pk.sigma_r(8.0)*cosmo.growth(1.0)/cosmo.growth(args.a_init) ) )
+    print( 'D(a_init)/D(1)      = %14.7e'%cosmo.growth( args.a_init ) )
+    print( 'f(a_init)           = %14.7e'%cosmo.growth_rate( args.a_init ) )
+    kf, kn = 2.0*np.pi/args.box_size, np.pi*args.n/args.box_size
+    if kf < np.exp( pk.logk[0] )  or  np.sqrt(3.0)*kn > np.exp( pk.logk[-1] ):
+        print( 'WARNING : the power spectrum table [%13.7e, %13.7e] does not cover the box modes [%13.7e, %13.7e] !!'
+               %( np.exp(pk.logk[0]), np.exp(pk.logk[-1]), kf, np.sqrt(3.0)*kn ) )
+
+    fft = SlabFFT( args.n, args.box_size, float_type=np.float64 if args.fft_float8 else np.float32,
+                   slab=args.slab, nthreads=args.nthreads, tmpdir=tmpdir )
+    try:
+        linear_field( fft, pk, args.seed )
+
+        if args.um_ic is None:
+            layout, par_mass = write_par_ic( filename_out, fft, cosmo, args.a_init, lpt=args.lpt,
+                                             float_type=np.float64 if args.float8 else np.float32,
+                                             int_type=np.int64 if args.int8 else np.int32,
+                                             with_mass=not args.no_mass, par_type=args.par_type,
+                                             mass_frac=args.mass_frac )
+            for line in layout.summary():  print( line )
+            print( 'Particle mass       = %14.7e'%par_mass )
+        else:
+            fields = write_um_ic( filename_out, fft, cosmo, args.a_init, mode=args.um_ic, lpt=args.lpt,
+                                  float_type=np.float64 if args.float8 else np.float32,
+                                  eta=elbdm_eta( args.elbdm_mass, args.hubble0 ), gas_frac=args.gas_frac,
+                                  temp=args.temp, mu=args.mu, gamma=args.gamma )
+            print( 'UM_IC fields        = %s (OPT__UM_IC_NVAR=%d)'%( ", ".join(fields), len(fields) ) )
+    finally:
+        fft.close()
+
+    print( '%s complete'%filename_out )
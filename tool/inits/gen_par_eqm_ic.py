@@ -0,0 +1,313 @@
+"""
+This file generates the particle initial condition file "PAR_IC" of spherical
+isotropic equilibrium models for import into GAMER using PAR_INIT=3, as a
+stand-alone counterpart of the ParticleEquilibriumIC test problem
+(src/Particle/Par_EquilibriumIC.cpp). It does the following:
+
+1. Tabulates the density, enclosed mass, and relative potential of the model
+   on a logarithmic radial grid
+2. Computes the Eddington distribution function f(E) from the tables
+3. Draws radii by inverse transform sampling of the cumulative mass table and
+   speeds by rejection sampling of v^2 f(Psi(r) - v^2/2)
+4. Writes the particles to "PAR_IC" in the [attribute][id] layout
+
+Supported models are Plummer, Hernquist, NFW, Burkert, Jaffe, Einasto, and
+Table (a radius-density table in the same format as the density tables of
+ParticleEquilibriumIC; see tool/table_maker). All models are truncated at
+MaxR, outside of which the potential is Keplerian.
+
+Particles are generated in independent chunks of a fixed size. Each chunk
+draws from its own random stream seeded by (seed, chunk index), so the output
+does not depend on the number of processes. The chunks are written directly
+into the preallocated "PAR_IC", so the memory usage is bounded by the chunk
+size times the number of processes.
+
+The units should be the same as those used in GAMER, with the gravitational
+constant set by --newton_g. Set the following runtime parameters accordingly:
+
+   PAR_INIT = 3, PAR_IC_FORMAT = 1, PAR_IC_MASS = -1.0, PAR_IC_TYPE = -1,
+   PAR_IC_FLOAT8 and PAR_IC_INT8 consistent with --float8/--int8,
+   PAR_NPAR = the total number of particles
+
+It requires NumPy and SciPy to be installed.
+
+Example:
+
+    python3 gen_par_eqm_ic.py -m Plummer --r0 0.1 --rho0 1.0 --maxr 1.0 -n 100000000 --center 0.5 0.5 0.5
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+from scipy.special import roots_legendre
+
+from par_ic import ParICLayout
+
+
+MAX_REJECTION = 1000   # maximum number of rejection sampling iterations
+
+
+# analytical density profiles identical to those in src/Particle/Par_EquilibriumIC.cpp
+
+def Dens_Plummer( r, R0, Rho0, Einasto ):
+    return Rho0*( 1.0 + (r/R0)**2 )**(-2.5)
+
+def Dens_NFW( r, R0, Rho0, Einasto ):
+    x = r/R0
+    return Rho0/( x*(1.0 + x)**2 )
+
+def Dens_Burkert( r, R0, Rho0, Einasto ):
+    x = r/R0
+    return Rho0/( (1.0 + x)*(1.0 + x*x) )
+
+def Dens_Jaffe( r, R0, Rho0, Einasto ):
+    x = r/R0
+    return Rho0/( 4.0*np.pi*x*x*(1.0 + x)**2 )
+
+def Dens_Hernquist( r, R0, Rho0, Einasto ):
+    x = r/R0
+    return Rho0/( x*(1.0 + x)**3 )
+
+def Dens_Einasto( r, R0, Rho0, Einasto ):
+    return Rho0*np.exp( -(r/R0)**Einasto )
+
+MODELS = { "Plummer": Dens_Plummer, "NFW": Dens_NFW, "Burkert": Dens_Burkert,
+           "Jaffe": Dens_Jaffe, "Hernquist": Dens_Hernquist, "Einasto": Dens_Einasto }
+
+
+class EquilibriumModel():
+    """
+    Radial tables and the Eddington distribution function of a truncated
+    spherical model. The object only holds NumPy arrays so that it can be sent
+    to worker processes.
+
+    r, dens    : radius and density (r must be strictly increasing and end at MaxR)
+    newton_g   : gravitational constant
+    n_quad     : number of Gauss-Legendre nodes for the Abel integral
+    """
+    def __init__( self, r, dens, newton_g=1.0, n_quad=128 ):
+        r    = np.asarray( r,    dtype=np.float64 )
+        dens = np.asarray( dens, dtype=np.float64 )
+        if np.any( np.diff(r) <= 0.0 ):  raise ValueError( "radii must be strictly increasing" )
+        if np.any( dens < 0.0 ):         raise ValueError( "density must be non-negative" )
+
+        self.r        = r
+        self.dens     = dens
+        self.newton_g = newton_g
+        lnr           = np.log( r )
+
+        # enclosed mass: power-law extrapolation inside r[0] and trapezoidal rule in ln(r) outside
+        slope         = np.log( dens[1]/dens[0] )/( lnr[1] - lnr[0] ) if dens[0] > 0.0 and dens[1] > 0.0 else 0.0
+        if slope <= -3.0:  raise ValueError( "inner density slope (%g) must be shallower than -3"%slope )
+        self.slope    = slope
+        dM            = 4.0*np.pi*r**3*dens
+        self.mass     = 4.0*np.pi*r[0]**3*dens[0]/( 3.0 + slope ) + \
+                        np.concatenate( ([0.0], np.cumsum( 0.5*(dM[1:] + dM[:-1])*np.diff(lnr) )) )
+        self.mass_tot = self.mass[-1]
+
+        # relative potential Psi = -Phi + Phi(MaxR) >= 0
+        #   Phi(r) = -G*[ M(r)/r + \int_r^MaxR 4*pi*r'*rho(r') dr' ]
+        dP            = 4.0*np.pi*r**2*dens
+        outer         = np.concatenate( (np.cumsum( (0.5*(dP[1:] + dP[:-1])*np.diff(lnr))[::-1] )[::-1], [0.0]) )
+        self.psi      = newton_g*( self.mass/r + outer - self.mass_tot/r[-1] )
+
+        # d(rho)/d(Psi) = -d(rho)/d(ln r) * r/(G*M)
+        drho_dlnr     = np.gradient( dens, lnr )
+        drho_dpsi     = -drho_dlnr*r/( newton_g*self.mass )
+
+        # Eddington formula f(E) = 1/(sqrt(8)*pi^2) d/dE \int_0^E d(rho)/d(Psi) dPsi/sqrt(E-Psi)
+        # --> substitute Psi = E - u^2 to remove the integrable singularity
+        #     I(E) = 2 \int_0^sqrt(E) d(rho)/d(Psi)(E-u^2) du
+        psi_inc       = self.psi[::-1]
+        dpsi_inc      = drho_dpsi[::-1]
+        x, w          = roots_legendre( n_quad )
+        E             = psi_inc
+        u             = 0.5*( x[None,:] + 1.0 )*np.sqrt( E )[:,None]
+        integrand     = np.interp( E[:,None] - u*u, psi_inc, dpsi_inc )
+        I             = np.sum( integrand*w[None,:], axis=1 )*np.sqrt( E )
+        self.E        = E
+        self.DF       = np.maximum( np.gradient( I, E )/( np.sqrt(8.0)*np.pi**2 ), 0.0 )
+
+        # upper bound of the speed distribution s^2 f(Psi*(1-s^2)) with s = v/v_esc at each radius
+        s             = np.linspace( 0.0, 1.0, 257 )
+        g             = s[None,:]**2*self.df( self.psi[:,None]*(1.0 - s[None,:]**2) )
+        g_max         = np.pad( g.max( axis=1 ), 1, mode="edge" )
+        self.g_max    = 1.2*np.maximum( g_max[1:-1], np.maximum( g_max[:-2], g_max[2:] ) )
+        self.s_peak   = s[ np.argmax( g, axis=1 ) ]
+
+    def df( self, E ):
+        return np.interp( E, self.E, self.DF, left=0.0, right=0.0 )
+
+    def sample( self, rng, n ):
+        """
+        Draw n particles and return (pos[3,n], vel[3,n]) relative to the center.
+        """
+        # radius: inverse transform sampling of M(r)/M_tot in ln(r)
+        # --> particles inside r[0] follow the inner power law rho ~ r^slope
+        q      = rng.random( n )*self.mass_tot
+        r      = np.exp( np.interp( np.log( np.maximum( q, self.mass[0] ) ), np.log( self.mass ), np.log( self.r ) ) )
+        inner  = q < self.mass[0]
+        r[inner] = self.r[0]*( q[inner]/self.mass[0] )**( 1.0/(3.0 + self.slope) )
+
+        # speed: vectorized rejection sampling of s^2 f(Psi*(1-s^2)), s = v/v_esc
+        psi    = np.interp( r, self.r, self.psi )
+        bound  = np.interp( r, self.r, self.g_max )
+        s      = np.empty( n )
+        todo   = np.arange( n )
+        for _ in range( MAX_REJECTION ):
+            if todo.size == 0:  break
+            s_try = rng.random( todo.size )
+            accept = rng.random( todo.size )*bound[todo] <= s_try**2*self.df( psi[todo]*(1.0 - s_try**2) )
+            s[todo[accept]] = s_try[accept]
+            todo  = todo[~accept]
+
+        # the distribution vanishes only at MaxR where Psi = 0 --> use the most probable speed of the nearest bin
+        s[todo] = self.s_peak[ np.minimum( np.searchsorted( self.r, r[todo] ), self.r.size-1 ) ]
+        v      = s*np.sqrt( 2.0*psi )
+
+        return r*random_direction( rng, n ), v*random_direction( rng, n )
+
+
+def random_direction( rng, n ):
+    cos_t = 2.0*rng.random( n ) - 1.0
+    sin_t = np.sqrt( 1.0 - cos_t**2 )
+    phi   = 2.0*np.pi*rng.random( n )
+    return np.array( [ sin_t*np.cos(phi), sin_t*np.sin(phi), cos_t ] )
+
+
+def build_model( model, r0=1.0, rho0=1.0, einasto=1.0, maxr=10.0, minr=None, nbin=10000,
+                 table=None, newton_g=1.0 ):
+    """
+    Construct an EquilibriumModel from either an analytical model or a density
+    table ("Table"; the first two columns are radius and density).
+    """
+    if model == "Table":
+        r, dens = np.loadtxt( table, usecols=(0,1), unpack=True, comments="#" )
+        if r[-1] < maxr:  raise ValueError( "maximum radius (%g) in the density table %s is smaller than MaxR (%g)"%(r[-1], table, maxr) )
+        r_grid  = np.logspace( np.log10(r[0]), np.log10(maxr), nbin )
+        dens    = np.exp( np.interp( np.log(r_grid), np.log(r), np.log( np.maximum(dens, 1.0e-300) ) ) )
+        return EquilibriumModel( r_grid, dens, newton_g )
+
+    if model not in MODELS:  raise ValueError( "unsupported model \"%s\" (supported: %s, Table)"%(model, ", ".join(MODELS)) )
+    if minr is None:  minr = 1.0e-4*min( r0, maxr )
+    r_grid = np.logspace( np.log10(minr), np.log10(maxr), nbin )
+    return EquilibriumModel( r_grid, MODELS[model]( r_grid, r0, rho0, einasto ), newton_g )
+
+
+_worker = {}
+
+def _init_worker( clouds, layout, filename, seed ):
+    _worker["clouds"]   = clouds
+    _worker["maps"]     = { v: layout.open( filename, v ) for v in layout.att_flt + layout.att_int }
+    _worker["seed"]     = seed
+
+def _sample_chunk( task ):
+    cloud_idx, chunk_idx, start, end = task
+    model, offset, npar, center, bulk_vel, par_type = _worker["clouds"][cloud_idx]
+    maps     = _worker["maps"]
+    rng      = np.random.default_rng( [_worker["seed"], cloud_idx, chunk_idx] )
+    pos, vel = model.sample( rng, end-start )
+    s, e     = offset+start, offset+end
+
+    if "ParMass" in maps:   maps["ParMass"][s:e] = model.mass_tot/npar
+    for d in range(3):
+        maps["ParPos"+"XYZ"[d]][s:e] = pos[d] + center[d]
+        maps["ParVel"+"XYZ"[d]][s:e] = vel[d] + bulk_vel[d]
+    if "ParType" in maps:   maps["ParType"][s:e] = par_type
+    return end-start
+
+
+def write_par_ic( filename, clouds, seed=0, chunk_size=1048576, num_workers=None,
+                  float_type=np.float32, int_type=np.int32 ):
+    """
+    Sample all clouds and write them to "filename".
+
+    clouds : list of (EquilibriumModel, number of particles, center[3], bulk velocity[3], particle type)
+    """
+    npar_all = sum( c[1] for c in clouds )
+    layout   = ParICLayout( npar_all, float_type=float_type, int_type=int_type )
+    layout.create( filename )
+
+    cloud_info, tasks, offset = [], [], 0
+    for c, (model, npar, center, bulk_vel, par_type) in enumerate( clouds ):
+        cloud_info.append( (model, offset, npar, center, bulk_vel, par_type) )
+        for chunk_idx, start in enumerate( range(0, npar, chunk_size) ):
+            tasks.append( (c, chunk_idx, start, min(start+chunk_size, npar)) )
+        offset += npar
+
+    ndone = 0
+    with multiprocessing.Pool( processes=num_workers, initializer=_init_worker,
+                               initargs=(cloud_info, layout, filename, seed) ) as pool:
+        for n in pool.imap_unordered( _sample_chunk, tasks ):
+            ndone += n
+            print( 'Sampled %13d / %13d particles (%6.2f%%)'%(ndone, npar_all, 100.0*ndone/max(npar_all, 1)), end='\r' )
+    print( '' )
+
+    layout.check( filename )
+    return layout
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser( description='Generate PAR_IC of a spherical isotropic equilibrium model' )
+
+    parser.add_argument( '-m', action='store', required=False, type=str, dest='model',
+                         help='model: %s, Table [%%(default)s]'%( ", ".join(MODELS) ), default='Plummer' )
+    parser.add_argument( '-t', action='store', required=False, type=str, dest='table',
+                         help='density table for "-m Table" [%(default)s]', default=None )
+    parser.add_argument( '-n', action='store', required=True,  type=int, dest='npar',
+                         help='number of particles' )
+    parser.add_argument( '--r0', action='store', required=False, type=float, dest='r0',
+                         help='scale radius [%(default)g]', default=0.1 )
+    parser.add_argument( '--rho0', action='store', required=False, type=float, dest='rho0',
+                         help='scale density [%(default)g]', default=1.0 )
+    parser.add_argument( '--einasto', action='store', required=False, type=float, dest='einasto',
+                         help='power factor of the Einasto model [%(default)g]', default=1.0 )
+    parser.add_argument( '--maxr', action='store', required=False, type=float, dest='maxr',
+                         help='truncation radius [%(default)g]', default=1.0 )
+    parser.add_argument( '--nbin', action='store', required=False, type=int, dest='nbin',
+                         help='number of radial bins of the tables [%(default)d]', default=10000 )
+    parser.add_argument( '--newton_g', action='store', required=False, type=float, dest='newton_g',
+                         help='gravitational constant in code units [%(default)g]', default=1.0 )
+    parser.add_argument( '--center', action='store', required=False, type=float, dest='center', nargs=3,
+                         help='center [%(default)s]', default=[0.0, 0.0, 0.0] )
+    parser.add_argument( '--bulk_vel', action='store', required=False, type=float, dest='bulk_vel', nargs=3,
+                         help='bulk velocity [%(default)s]', default=[0.0, 0.0, 0.0] )
+    parser.add_argument( '--type', action='store', required=False, type=int, dest='par_type',
+                         help='particle type [%(default)d]', default=1 )
+    parser.add_argument( '--seed', action='store', required=False, type=int, dest='seed',
+                         help='random seed [%(default)d]', default=0 )
+    parser.add_argument( '--chunk', action='store', required=False, type=int, dest='chunk',
+                         help='number of particles per chunk [%(default)d]', default=1048576 )
+    parser.add_argument( '-p', action='store', required=False, type=int, dest='nproc',
+                         help='number of processes [%(default)d]', default=os.cpu_count() )
+    parser.add_argument( '--float8', action='store_true', dest='float8',
+                         help='use double precision (PAR_IC_FLOAT8=1) [False]' )
+    parser.add_argument( '--int8', action='store_true', dest='int8',
+                         help='use 64-bit integers (PAR_IC_INT8=1) [False]' )
+    parser.add_argument( '-o', action='store', required=False, type=str, dest='filename_out',
+                         help='output filename [%(default)s]', default='PAR_IC' )
+
+    args = parser.parse_args()
+
+    # take note
+    print( '\nCommand-line arguments:' )
+    print( '-------------------------------------------------------------------' )
+    print( ' '.join(map(str, sys.argv)) )
+    print( '-------------------------------------------------------------------\n' )
+
+    model = build_model( args.model, r0=args.r0, rho0=args.rho0, einasto=args.einasto, maxr=args.maxr,
+                         nbin=args.nbin, table=args.table, newton_g=args.newton_g )
+    print( 'Total mass within MaxR = %14.7e'%model.mass_tot )
+    print( 'Particle mass          = %14.7e'%(model.mass_tot/args.npar) )
+
+    layout = write_par_ic( args.filename_out, [ (model, args.npar, args.center, args.bulk_vel, args.par_type) ],
+                           seed=args.seed, chunk_size=args.chunk, num_workers=args.nproc,
+                           float_type=np.float64 if args.float8 else np.float32,
+                           int_type=np.int64 if args.int8 else np.int32 )
+
+    for line in layout.summary():  print( line )
+    print( '%s complete'%args.filename_out )
@@ -15,76 +15,127 @@ as those used in GAMER. So:
 
 The file should also be named "B_IC" for GAMER to recognize it.
 
+The vector potential is evaluated and written one z-slab at a time, so the
+memory usage is independent of the grid size along z and large grids (e.g.,
+2048^3) can be generated on a single node. The vector potential components are
+given as functions of the 1-D coordinate arrays broadcast against each other,
+i.e., x has the shape (Nx,1,1), y has (1,Ny,1), and z has (1,1,Nz_slab), so they
+must only use NumPy operations that support broadcasting.
+
+The datasets are chunked into small cubes since GAMER reads the vector
+potential patch by patch (see src/Model_Hydro/MHD_Init_BField_ByVecPot_File.cpp).
+Optional gzip compression (with shuffle) is supported; other filters (e.g.,
+lzf) are not used since they cannot be read by GAMER without HDF5 plugins.
+
 It requires NumPy, h5py, and HDF5 to be installed.
+
+Example of using it as a module:
+
+    from gen_vec_pot import write_vector_potential
+    write_vector_potential( "B_IC", lambda x, y, z: 0.0*x*y*z,
+                                    lambda x, y, z: 0.0*x*y*z,
+                                    lambda x, y, z: x*x + y*y,
+                            ddims=[512]*3, le=[0.0]*3, re=[1.0]*3 )
 """
 
 import h5py
 import numpy as np
 
-# Number of cells along each dimension of the input grid.
-# This is somewhat arbitrary, but should be chosen in
-# such a way as to adequately resolve the vector potential.
 
-ddims = np.array([128]*3, dtype='int')
+def write_vector_potential( filename, Ax_func, Ay_func, Az_func, ddims, le, re,
+                            nbuf=3, chunk=32, compression=None, slab=None ):
+    """
+    Evaluate the vector potential on a uniform grid and write it to "filename"
+    one z-slab at a time.
+
+    filename    : output filename ("B_IC" for GAMER)
+    Ax/y/z_func : vector potential components as functions f(x, y, z) of the
+                  broadcast cell-center coordinates
+    ddims       : number of cells along each dimension covering the simulation domain
+    le, re      : left and right edges of the simulation domain
+    nbuf        : number of buffer cells added on each side
+    chunk       : size of the cubic HDF5 chunks
+    compression : None or the gzip level (0-9)
+    slab        : number of cells along z evaluated at once (default: chunk)
+    """
+
+    ddims = np.array(ddims, dtype='int')
+    le    = np.array(le, dtype='float64')
+    re    = np.array(re, dtype='float64')
+
+    # Since we need to take derivatives of the vector potential
+    # to get the magnetic field on the simulation domain, the
+    # input grid must be extended a bit beyond this boundary.
+    # We therefore add a buffer of three cells on each side.
+    # (Three cells are necessary to solve some corner cases
+    # resulting from round-off errors.)
+
+    delta  = (re-le)/ddims
+    ddims += 2*nbuf
+    le    -= nbuf*delta
+    re    += nbuf*delta
+
+    # Construct the grid cell edge coordinates and find the grid
+    # cell midpoints
+
+    x, y, z = [ np.linspace(le[d], re[d], ddims[d]+1) for d in range(3) ]
+    x, y, z = [ 0.5*(c[1:]+c[:-1]) for c in (x, y, z) ]
 
-# Left edge and right edge coordinates of the desired
-# simulation domain which will be used in GAMER.
+    # Sparse coordinates broadcast against each other instead of
+    # full 3D coordinate arrays
 
-le = np.zeros(3)
-re = np.ones(3)
+    xx = x[:,None,None]
+    yy = y[None,:,None]
 
-# Since we need to take derivatives of the vector potential
-# to get the magnetic field on the simulation domain, the
-# input grid must be extended a bit beyond this boundary.
-# We therefore add a buffer of three cells on each side.
-# (Three cells are necessary to solve some corner cases
-# resulting from round-off errors.)
+    if slab is None:  slab = chunk
+    chunks = tuple( min(chunk, n) for n in ddims )
+    filter_kwargs = {} if compression is None else \
+                    { "compression": "gzip", "compression_opts": compression, "shuffle": True }
 
-delta = (re-le)/ddims
-ddims += 6
-le -= 3.0*delta
-re += 3.0*delta
+    with h5py.File(filename, "w") as f:
 
-# Construct the grid cell edge coordinates
+        # Write coordinate arrays
 
-x = np.linspace(le[0], re[0], ddims[0]+1)
-y = np.linspace(le[1], re[1], ddims[1]+1)
-z = np.linspace(le[2], re[2], ddims[2]+1)
+        f.create_dataset("x", data=x)
+        f.create_dataset("y", data=y)
+        f.create_dataset("z", data=z)
 
-# Find the grid cell midpoints
+        # Create the vector potential datasets, which are stored as
+        # A[Nx][Ny][Nz] and read by GAMER in double precision
 
-x = 0.5*(x[1:]+x[:-1])
-y = 0.5*(y[1:]+y[:-1])
-z = 0.5*(z[1:]+z[:-1])
+        dsets = [ f.create_dataset("magnetic_vector_potential_%s"%c, shape=tuple(ddims),
+                                   dtype='float64', chunks=chunks, **filter_kwargs)
+                  for c in "xyz" ]
 
-# Use the 1-D coordinate arrays to consruct 3D coordinate arrays
-# that we will use to compute an analytic vector potential
+        # Evaluate and write one z-slab at a time
 
-xx, yy, zz = np.meshgrid(x, y, z, sparse=False, indexing='ij')
+        for k0 in range(0, ddims[2], slab):
+            k1 = min(k0+slab, ddims[2])
+            zz = z[None,None,k0:k1]
+            for dset, func in zip(dsets, (Ax_func, Ay_func, Az_func)):
+                dset[:,:,k0:k1] = np.broadcast_to(func(xx, yy, zz), (ddims[0], ddims[1], k1-k0))
 
-# Toy vector potential which depends on all three coordinates
 
-Ax = 3.0*yy*zz*zz
-Ay = 2.0*xx*xx*zz
-Az = yy*yy*xx
+if __name__ == "__main__":
 
-# Write the ICs to an HDF5 file
+    # Number of cells along each dimension of the input grid.
+    # This is somewhat arbitrary, but should be chosen in
+    # such a way as to adequately resolve the vector potential.
 
-f = h5py.File("B_IC", "w")
+    ddims = np.array([128]*3, dtype='int')
 
-# Write coordinate arrays
+    # Left edge and right edge coordinates of the desired
+    # simulation domain which will be used in GAMER.
 
-f.create_dataset("x", data=x)
-f.create_dataset("y", data=y)
-f.create_dataset("z", data=z)
+    le = np.zeros(3)
+    re = np.ones(3)
 
-#  Write vector potential arrays
+    # Toy vector potential which depends on all three coordinates
 
-f.create_dataset("magnetic_vector_potential_x", data=Ax)
-f.create_dataset("magnetic_vector_potential_y", data=Ay)
-f.create_dataset("magnetic_vector_potential_z", data=Az)
+    Ax = lambda x, y, z: 3.0*y*z*z
+    Ay = lambda x, y, z: 2.0*x*x*z
+    Az = lambda x, y, z: y*y*x
 
-# Close the file
+    # Write the ICs to an HDF5 file
 
-f.flush()
-f.close()
+    write_vector_potential("B_IC", Ax, Ay, Az, ddims, le, re)
@@ -0,0 +1,113 @@
+"""
+Helper for writing the GAMER particle initial condition file "PAR_IC" in the [attribute][id] layout
+(PAR_IC_FORMAT=1) through memory-mapped arrays.
+
+Layout of PAR_IC (see src/Particle/Par_Init_ByFile.cpp):
+
+   [floating-point attributes][id] followed by [integer attributes][id]
+
+   floating-point attributes : mass (excluded when PAR_IC_MASS>=0), position x/y/z, velocity x/y/z
+                               [, user-specified floating-point attributes]
+   integer attributes        : type (excluded when PAR_IC_TYPE>=0), PUID (included only when PAR_IC_PUID=1)
+                               [, user-specified integer attributes]
+
+   The floating-point/integer precision must match PAR_IC_FLOAT8/PAR_IC_INT8.
+
+Since each attribute occupies a contiguous block of the file, the whole file can be preallocated once
+and different particle ranges of different attributes can be filled independently (e.g., by different
+processes) without holding all particles in memory.
+
+Example:
+   layout = ParICLayout( NPar, float_type=np.float32 )
+   layout.create( "PAR_IC" )
+   layout.open( "PAR_IC", "ParPosX" )[start:end] = posx_chunk
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import os
+
+import numpy as np
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+PAR_ATT_FLT = [ "ParMass", "ParPosX", "ParPosY", "ParPosZ", "ParVelX", "ParVelY", "ParVelZ" ]
+PAR_ATT_INT = [ "ParType", "ParPUID" ]
+
+
+
+#====================================================================================================
+# Classes
+#====================================================================================================
+class ParICLayout():
+    def __init__( self, npar, float_type=np.float32, int_type=np.int32, with_mass=True, with_type=True,
+                  with_puid=False, user_flt=[], user_int=[] ):
+        """
+        npar       : int. Total number of particles.
+        float_type : numpy dtype. Precision of the floating-point attributes (np.float32/np.float64 for PAR_IC_FLOAT8=0/1).
+        int_type   : numpy dtype. Width of the integer attributes (np.int32/np.int64 for PAR_IC_INT8=0/1).
+        with_mass  : bool. Whether to store particle mass (set False when adopting PAR_IC_MASS>=0).
+        with_type  : bool. Whether to store particle type (set False when adopting PAR_IC_TYPE>=0).
+        with_puid  : bool. Whether to store particle UID (set True only when adopting PAR_IC_PUID=1).
+        user_flt   : list of string. Names of the user-specified floating-point attributes.
+        user_int   : list of string. Names of the user-specified integer attributes.
+
+        The object only stores plain attributes so that it can be sent to worker processes.
+        """
+        self.npar       = int(npar)
+        self.float_type = np.dtype(float_type)
+        self.int_type   = np.dtype(int_type)
+
+        self.att_flt    = [ v for v in PAR_ATT_FLT if with_mass or v != "ParMass" ] + list(user_flt)
+        self.att_int    = [ v for v in ["ParType"] if with_type ] + [ v for v in ["ParPUID"] if with_puid ] + list(user_int)
+
+        self.offset     = {}
+        offset          = 0
+        for v in self.att_flt:
+            self.offset[v] = offset
+            offset        += self.npar*self.float_type.itemsize
+        for v in self.att_int:
+            self.offset[v] = offset
+            offset        += self.npar*self.int_type.itemsize
+        self.size       = offset
+
+    def dtype( self, att ):
+        return self.float_type if att in self.att_flt else self.int_type
+
+    def create( self, filename ):
+        """
+        Preallocate the output file with the expected size. The file is sparse on most file systems
+        until it is filled.
+        """
+        with open( filename, "wb" ) as f:
+            f.truncate( self.size )
+        return
+
+    def open( self, filename, att, mode="r+" ):
+        """
+        Return a 1D memory-mapped array of length npar for the target attribute.
+        """
+        if att not in self.offset:  raise KeyError( "attribute <%s> is not stored in PAR_IC (stored: %s)"%(att, ", ".join(self.offset)) )
+        return np.memmap( filename, dtype=self.dtype(att), mode=mode, offset=self.offset[att], shape=(self.npar,) )
+
+    def check( self, filename ):
+        """
+        Check the file size against the expected size in the same way as Par_Init_ByFile().
+        """
+        file_size = os.path.getsize( filename )
+        if file_size != self.size:
+            raise RuntimeError( "size of the file <%s> = %d != expect = %d"%(filename, file_size, self.size) )
+        return
+
+    def summary( self ):
+        return [ "Number of particles       : %d"%self.npar,
+                 "Floating-point attributes : %s (%s, PAR_IC_FLOAT8 = %d)"%( ", ".join(self.att_flt), self.float_type.name, self.float_type.itemsize == 8 ),
+                 "Integer attributes        : %s (%s, PAR_IC_INT8 = %d)"%( ", ".join(self.att_int), self.int_type.name, self.int_type.itemsize == 8 ),
+                 "PAR_IC_FORMAT             : 1 ([attribute][id])",
+                 "PAR_IC_MASS               : %s"%( "-1.0" if "ParMass" in self.att_flt else "(set to the particle mass)" ),
+                 "PAR_IC_TYPE               : %s"%( "-1"   if "ParType" in self.att_int else "(set to the particle type)" ),
+                 "PAR_IC_PUID               : %d"%( "ParPUID" in self.att_int ) ]
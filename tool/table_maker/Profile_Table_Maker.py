@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Construct radial profile tables (e.g., density or external potential) for GAMER with the
+minimum number of rows required to reach a target interpolation accuracy.
+
+GAMER loads these tables with Aux_LoadTable() and evaluates them with Mis_InterpolateFromTable(),
+which interpolates linearly in both radius and value. This script therefore places the table nodes
+adaptively so that the piecewise-linear interpolant of the table deviates from the exact profile by
+less than "atol + rtol*|f(r)|" everywhere in [r_min, r_max].
+
+Usage:
+   1. Built-in analytical profiles (see PROFILES below):
+
+         python3 Profile_Table_Maker.py -m NFW -q dens --r0 0.1 --rho0 1.0 --rmin 1.0e-3 --rmax 1.0 -o density_table.txt
+
+   2. User-supplied vectorized callables f(r) from a Python module:
+
+         python3 Profile_Table_Maker.py -u my_profile:Density --rmin 1.0e-3 --rmax 1.0 -o density_table.txt
+
+   3. As a module:
+
+         from Profile_Table_Maker import make_table, write_table
+         r, f = make_table( lambda r: 1.0/(1.0+r*r)**2.5, 1.0e-3, 1.0, rtol=1.0e-4 )
+         write_table( "density_table.txt", r, f, ["Radius", "Density"] )
+
+Note:
+   1. The callables must accept and return NumPy arrays so that all nodes of a refinement pass can
+      be evaluated at once
+   2. The first column of the output table is always radius and the second column is the profile
+      --> Same format as Density_Table_Maker.py and ExtPot_Table_Maker.py
+"""
+
+#====================================================================================================
+# Packages
+#====================================================================================================
+import argparse
+import importlib
+import sys
+
+import numpy as np
+
+
+
+#====================================================================================================
+# Global variables
+#====================================================================================================
+NEWTON_G     = 1.0      # gravitational constant in code units adopted by the built-in potentials
+N_INIT       = 16       # number of log-spaced nodes to start the refinement with
+MAX_ROW      = 1000000  # maximum number of rows allowed in the output table
+DENSE_FACTOR = 0.1      # tolerance factor for the dense reference sampling (relative to the target tolerance)
+TEST_POINTS  = np.array( [0.25, 0.5, 0.75] )   # relative log-space positions of the test points in each interval
+
+
+
+#====================================================================================================
+# Built-in profiles
+#====================================================================================================
+# All functions take (r, R0, Rho0) and must be vectorized
+# --> identical to the analytical models in src/Particle/Par_EquilibriumIC.cpp
+def Dens_Plummer( r, R0, Rho0 ):
+    return Rho0*( 1.0 + (r/R0)**2 )**(-2.5)
+
+def Dens_NFW( r, R0, Rho0 ):
+    x = r/R0
+    return Rho0/( x*(1.0 + x)**2 )
+
+def Dens_Burkert( r, R0, Rho0 ):
+    x = r/R0
+    return Rho0/( (1.0 + x)*(1.0 + x*x) )
+
+def Dens_Jaffe( r, R0, Rho0 ):
+    x = r/R0
+    return Rho0/( 4.0*np.pi*x*x*(1.0 + x)**2 )
+
+def Dens_Hernquist( r, R0, Rho0 ):
+    x = r/R0
+    return Rho0/( x*(1.0 + x)**3 )
+
+def Pote_Plummer( r, R0, Rho0 ):
+    return -NEWTON_G*(4.0/3.0)*np.pi*R0**3*Rho0/np.sqrt( r*r + R0*R0 )
+
+def Pote_NFW( r, R0, Rho0 ):
+    x = r/R0
+    return -4.0*np.pi*NEWTON_G*Rho0*R0*R0*np.log1p( x )/x
+
+def Pote_Jaffe( r, R0, Rho0 ):
+    return -NEWTON_G*Rho0*R0*R0*np.log1p( R0/r )
+
+def Pote_Hernquist( r, R0, Rho0 ):
+    return -2.0*np.pi*NEWTON_G*Rho0*R0*R0/( 1.0 + r/R0 )
+
+PROFILES = { "dens": { "Plummer"  : Dens_Plummer,
+                       "NFW"      : Dens_NFW,
+                       "Burkert"  : Dens_Burkert,
+                       "Jaffe"    : Dens_Jaffe,
+                       "Hernquist": Dens_Hernquist },
+             "pot" : { "Plummer"  : Pote_Plummer,
+                       "NFW"      : Pote_NFW,
+                       "Jaffe"    : Pote_Jaffe,
+                       "Hernquist": Pote_Hernquist } }
+
+LABELS   = { "dens": "Density", "pot": "Potential" }
+
+
+
+#====================================================================================================
+# Functions
+#====================================================================================================
+def interp_error( r, f, r_test, f_test, rtol, atol ):
+    """
+    Evaluate the error of the piecewise-linear interpolant of (r, f) at the test points, normalized
+    by the allowed tolerance. A value <= 1 means the tolerance is satisfied.
+
+    Parameters:
+        r, f           : array - Table nodes and values (r must be strictly increasing)
+        r_test, f_test : array - Test points and their exact values
+        rtol, atol     : float - Relative and absolute tolerances
+
+    Returns:
+        array - Normalized errors at the test points
+    """
+    f_interp = np.interp( r_test, r, f )
+    return np.abs( f_interp - f_test )/( atol + rtol*np.abs(f_test) )
+
+
+
+def refine( func, r, f, rtol, atol, max_row ):
+    """
+    Bisect (in log space) every interval whose interior test points violate the tolerance until all
+    intervals pass.
+
+    Parameters:
+        func       : callable - Vectorized profile f(r)
+        r, f       : array    - Initial nodes and values
+        rtol, atol : float    - Relative and absolute tolerances
+        max_row    : int      - Maximum number of nodes
+
+    Returns:
+        (array, array) - Refined nodes and values
+    """
+    while True:
+#       evaluate all test points of all intervals at once
+        logr   = np.log( r )
+        r_test = np.exp( logr[:-1,None] + TEST_POINTS[None,:]*np.diff(logr)[:,None] )
+        f_test = func( r_test.ravel() ).reshape( r_test.shape )
+
+        err = interp_error( r, f, r_test.ravel(), f_test.ravel(), rtol, atol ).reshape( r_test.shape )
+        bad = np.any( err > 1.0, axis=1 )
+
+        if not np.any( bad ):  return r, f
+
+        if r.size + np.count_nonzero( bad ) > max_row:
+            raise RuntimeError( "number of rows exceeds %d before reaching the target accuracy"%max_row )
+
+#       the middle test point is the log-space midpoint --> reuse its value as the new node
+        mid    = TEST_POINTS.size//2
+        r_new  = np.concatenate( [r, r_test[bad,mid]] )
+        f_new  = np.concatenate( [f, f_test[bad,mid]] )
+        order  = np.argsort( r_new )
+        r, f   = r_new[order], f_new[order]
+
+
+
+def thin( r, f, rtol, atol ):
+    """
+    Greedily select the fewest nodes from a dense reference table such that the chord between two
+    consecutive selected nodes reproduces all skipped reference nodes within the tolerance.
+
+    Parameters:
+        r, f       : array - Dense reference nodes and values
+        rtol, atol : float - Relative and absolute tolerances
+
+    Returns:
+        array - Indices of the selected nodes
+    """
+    N    = r.size
+    keep = [0]
+    i    = 0
+    while i < N-1:
+#       exponential search followed by bisection for the farthest valid end point
+        def valid( j ):
+            if j <= i+1:  return True
+            f_chord = f[i] + ( f[j] - f[i] )*( r[i+1:j] - r[i] )/( r[j] - r[i] )
+            return np.all( np.abs(f_chord - f[i+1:j]) <= atol + rtol*np.abs(f[i+1:j]) )
+
+        step = 1
+        while i+2*step <= N-1 and valid( i+2*step ):  step *= 2
+        lo, hi = i+step, min( i+2*step, N-1 )
+        while hi - lo > 1:
+            mid = (lo + hi)//2
+            if valid( mid ):  lo = mid
+            else:             hi = mid
+        i = hi if valid( hi ) else lo
+        keep.append( i )
+
+    return np.array( keep )
+
+
+
+def make_table( func, r_min, r_max, rtol=1.0e-4, atol=0.0, n_init=N_INIT, max_row=MAX_ROW ):
+    """
+    Construct a table with the minimum number of rows such that linear interpolation in radius
+    reproduces func(r) within "atol + rtol*|func(r)|".
+
+    Procedure:
+        1. Refine a log-spaced grid until it is accurate to DENSE_FACTOR times the tolerance
+        2. Thin the dense grid greedily using the remaining tolerance budget
+        3. Verify the thinned table against fresh test points and refine it again if necessary
+
+    Parameters:
+        func         : callable - Vectorized profile f(r)
+        r_min, r_max : float    - Radial range of the table
+        rtol, atol   : float    - Relative and absolute tolerances
+        n_init       : int      - Number of initial log-spaced nodes
+        max_row      : int      - Maximum number of rows
+
+    Returns:
+        (array, array) - Radii and profile values
+    """
+    if r_min <= 0.0 or r_max <= r_min:
+        raise ValueError( "incorrect radial range [%g, %g] (must be 0 < r_min < r_max)"%(r_min, r_max) )
+    if rtol <= 0.0 and atol <= 0.0:
+        raise ValueError( "at least one of rtol (%g) and atol (%g) must be positive"%(rtol, atol) )
+
+    r = np.logspace( np.log10(r_min), np.log10(r_max), n_init )
+    f = np.asarray( func(r), dtype=np.float64 )
+    if not np.all( np.isfinite(f) ):
+        raise ValueError( "func(r) is not finite in [%g, %g]"%(r_min, r_max) )
+
+    r, f = refine( func, r, f, DENSE_FACTOR*rtol, DENSE_FACTOR*atol, max_row )
+
+    idx  = thin( r, f, (1.0-DENSE_FACTOR)*rtol, (1.0-DENSE_FACTOR)*atol )
+    r, f = refine( func, r[idx], f[idx], rtol, atol, max_row )
+
+    return r, f
+
+
+
+def max_error( func, r, f, rtol, atol, n_test=64 ):
+    """
+    Estimate the maximum normalized interpolation error of a table on a dense set of test points.
+
+    Returns:
+        float - Maximum of |interp - f|/(atol + rtol*|f|)
+    """
+    logr   = np.log( r )
+    frac   = ( np.arange(n_test) + 0.5 )/n_test
+    r_test = np.exp( logr[:-1,None] + frac[None,:]*np.diff(logr)[:,None] ).ravel()
+    return np.max( interp_error( r, f, r_test, func(r_test), rtol, atol ) )
+
+
+
+def write_table( filename, r, f, labels ):
+    """
+    Write the table in the format loadable by Aux_LoadTable()
+    --> Lines starting with "#" are comments and columns are separated by spaces
+
+    Parameters:
+        filename : str   - Output filename
+        r, f     : array - Radii and profile values
+        labels   : list  - Column names
+    """
+    header = "%20s %21s"%tuple( labels )
+    np.savetxt( filename, np.column_stack( [r, f] ), fmt="%21.14e", delimiter=" ", header=header, comments="#" )
+
+
+
+def load_user_function( spec ):
+    """
+    Load a user-supplied callable specified as "module:function".
+    """
+    module_name, _, func_name = spec.partition( ":" )
+    if not func_name:  raise ValueError( "user function must be specified as \"module:function\" (input = %s)"%spec )
+    sys.path.insert( 0, "." )
+    return getattr( importlib.import_module(module_name), func_name )
+
+
+
+#====================================================================================================
+# Main
+#====================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description='Construct adaptive radial profile tables for GAMER' )
+
+    parser.add_argument( '-q', action='store', required=False, type=str, dest='quantity', choices=list(PROFILES.keys()),
+                         help='profile quantity [%(default)s]', default='dens' )
+    parser.add_argument( '-m', action='store', required=False, type=str, dest='model',
+                         help='built-in model: %s (density) / %s (potential) [%%(default)s]'%( ", ".join(PROFILES["dens"]), ", ".join(PROFILES["pot"]) ),
+                         default='NFW' )
+    parser.add_argument( '-u', action='store', required=False, type=str, dest='user_func',
+                         help='user-supplied vectorized function f(r) as "module:function" (overwrite -m) [%(default)s]', default=None )
+    parser.add_argument( '--r0', action='store', required=False, type=float, dest='r0',
+                         help='scale radius of the built-in model [%(default)g]', default=0.1 )
+    parser.add_argument( '--rho0', action='store', required=False, type=float, dest='rho0',
+                         help='scale density of the built-in model [%(default)g]', default=1.0 )
+    parser.add_argument( '--rmin', action='store', required=False, type=float, dest='r_min',
+                         help='minimum radius [%(default)g]', default=1.0e-2 )
+    parser.add_argument( '--rmax', action='store', required=False, type=float, dest='r_max',
+                         help='maximum radius [%(default)g]', default=1.0 )
+    parser.add_argument( '--rtol', action='store', required=False, type=float, dest='rtol',
+                         help='relative interpolation tolerance [%(default)g]', default=1.0e-4 )
+    parser.add_argument( '--atol', action='store', required=False, type=float, dest='atol',
+                         help='absolute interpolation tolerance [%(default)g]', default=0.0 )
+    parser.add_argument( '-o', action='store', required=False, type=str, dest='filename_out',
+                         help='output filename [density_table.txt or external_pot_table.txt]', default=None )
+
+    args = parser.parse_args()
+
+    # take note
+    print( '\nCommand-line arguments:' )
+    print( '-------------------------------------------------------------------' )
+    print( ' '.join(map(str, sys.argv)) )
+    print( '-------------------------------------------------------------------\n' )
+
+    if args.user_func is not None:
+        func = load_user_function( args.user_func )
+    else:
+        if args.model not in PROFILES[args.quantity]:
+            raise ValueError( "unsupported model \"%s\" for \"%s\" (supported: %s)"%( args.model, args.quantity, ", ".join(PROFILES[args.quantity]) ) )
+        model = PROFILES[args.quantity][args.model]
+        func  = lambda r: model( r, args.r0, args.rho0 )
+
+    filename_out = args.filename_out
+    if filename_out is None:  filename_out = "density_table.txt" if args.quantity == "dens" else "external_pot_table.txt"
+
+    r, f = make_table( func, args.r_min, args.r_max, rtol=args.rtol, atol=args.atol )
+    write_table( filename_out, r, f, ["Radius", LABELS[args.quantity]] )
+
+    print( "Number of rows           = %d"%r.size )
+    print( "Maximum normalized error = %13.7e"%max_error( func, r, f, args.rtol, args.atol ) )
+    print( "Table \"%s\" complete"%filename_out )